@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Campaign, Contact, Group, Message, MessageTemplate, WhatsAppInstance
+from .models import Campaign, Contact, Conversation, Group, Message, MessageTemplate, WhatsAppInstance
 
 
 @admin.register(WhatsAppInstance)
@@ -52,6 +52,21 @@ class ContactAdmin(admin.ModelAdmin):
     search_fields = ["jid", "name", "phone"]
 
 
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = [
+        "jid",
+        "contact_name",
+        "instance",
+        "message_count",
+        "unread_count",
+        "last_message_at",
+    ]
+    list_filter = ["instance"]
+    search_fields = ["jid", "contact_name", "contact_phone"]
+    readonly_fields = ["created_at", "updated_at"]
+
+
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     list_display = [
@@ -0,0 +1,341 @@
+"""
+Campaign dispatch for ChatCube.
+
+run_campaign hands a campaign to CampaignDispatcher, which walks the
+recipient list one page at a time (a jsonb slice, never the whole list)
+starting at the progress cursor ``sent_count + failed_count``.  Each page is
+sent concurrently through AsyncEngineClient, paced by a per-instance token
+bucket derived from ``delay_between_messages_ms``, then committed with one
+Message bulk insert and one counter UPDATE.
+
+Pause/resume is read from a cached status flag that the campaign views
+publish, so senders don't query the campaign row before every message.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .conversations import record_messages
+from .engine_client import AsyncEngineClient, EngineCircuitOpenError, EngineClientError
+from .models import Campaign, Message
+
+logger = logging.getLogger(__name__)
+
+try:
+    from celery.exceptions import SoftTimeLimitExceeded  # type: ignore
+except Exception:  # pragma: no cover
+    class SoftTimeLimitExceeded(Exception):  # type: ignore[no-redef]
+        pass
+
+SEND_CONCURRENCY = 8        # In-flight engine requests per campaign
+MAX_PAGE_SIZE = 500         # Upper bound on campaign.batch_size per page
+TIME_BUDGET_S = 480         # Re-queue before run_campaign's soft time limit
+STATUS_FLAG_TTL = 60        # Lifetime of a status published by the views
+STATUS_DB_TTL = 5           # How long a status read from the DB is reused
+CIRCUIT_WAIT_S = 1          # Poll interval while the instance's circuit is open
+
+
+# ---------------------------------------------------------------------------
+# Status flag
+# ---------------------------------------------------------------------------
+
+
+def _status_key(campaign_id) -> str:
+    return f"chatcube:campaign_status:{campaign_id}"
+
+
+def publish_campaign_status(campaign_id, status: str) -> None:
+    """Called wherever a campaign's status changes so senders see it at once."""
+    cache.set(_status_key(campaign_id), status, timeout=STATUS_FLAG_TTL)
+
+
+def campaign_status(campaign_id) -> Optional[str]:
+    key = _status_key(campaign_id)
+    status = cache.get(key)
+    if status is None:
+        status = Campaign.objects.filter(id=campaign_id).values_list("status", flat=True).first()
+        if status is not None:
+            cache.set(key, status, timeout=STATUS_DB_TTL)
+    return status
+
+
+# ---------------------------------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------------------------------
+
+
+class TokenBucket:
+    """Refilling token bucket; ``rate`` tokens per second, ``None`` = unlimited."""
+
+    def __init__(self, rate: Optional[float], capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate: Optional[float], capacity: float) -> None:
+        with self._lock:
+            self.rate = rate
+            self.capacity = capacity
+            self.tokens = min(self.tokens, capacity)
+
+    def _take(self) -> float:
+        """Take a token if available; otherwise return seconds to wait."""
+        with self._lock:
+            if self.rate is None:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+# One bucket per engine instance, shared by every campaign in the process
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def instance_bucket(engine_instance_id: str, delay_ms: int) -> TokenBucket:
+    rate = 1000.0 / delay_ms if delay_ms > 0 else None
+    capacity = max(1.0, rate or 1.0)  # allow up to one second of burst
+    with _buckets_lock:
+        bucket = _buckets.get(engine_instance_id)
+        if bucket is None:
+            bucket = _buckets[engine_instance_id] = TokenBucket(rate, capacity)
+        else:
+            bucket.configure(rate, capacity)
+    return bucket
+
+
+# ---------------------------------------------------------------------------
+# Recipients
+# ---------------------------------------------------------------------------
+
+
+def _safe_format_template(content: str, variables: Dict[str, Any]) -> str:
+    class _SafeDict(dict):
+        def __missing__(self, key):  # type: ignore[override]
+            return ""
+
+    try:
+        return content.format_map(_SafeDict(variables))
+    except Exception:
+        # If the template uses a different placeholder convention, keep it as-is.
+        return content
+
+
+def _parse_recipient(rec: Union[str, Dict[str, Any]]) -> Tuple[Optional[str], Dict[str, Any]]:
+    if isinstance(rec, str):
+        return rec, {}
+    if isinstance(rec, dict):
+        return rec.get("jid") or rec.get("to"), rec.get("variables") or rec.get("vars") or {}
+    return None, {}
+
+
+def _jsonb(value):
+    # psycopg returns jsonb decoded, but be tolerant of text
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def recipient_count(campaign_id) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN jsonb_typeof(recipients) = 'array' "
+            "THEN jsonb_array_length(recipients) ELSE 0 END "
+            "FROM chatcube_campaign WHERE id = %s",
+            [campaign_id],
+        )
+        row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def recipient_page(campaign_id, start: int, size: int, total: int) -> List[Any]:
+    """Recipients ``[start, start + size)`` without loading the whole list."""
+    end = min(start + size, total) - 1
+    if end < start:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT jsonb_path_query_array(recipients, %s::jsonpath) FROM chatcube_campaign WHERE id = %s",
+            [f"$[{start} to {end}]", campaign_id],
+        )
+        row = cursor.fetchone()
+    return _jsonb(row[0]) if row else []
+
+
+# ---------------------------------------------------------------------------
+# Dispatcher
+# ---------------------------------------------------------------------------
+
+
+class CampaignDispatcher:
+    """Sends a running campaign page by page until done, paused or out of time."""
+
+    def __init__(self, campaign: Campaign, time_budget: float = TIME_BUDGET_S):
+        self.campaign = campaign
+        self.instance = campaign.instance
+        self.template = campaign.template
+        self.page_size = max(1, min(int(campaign.batch_size), MAX_PAGE_SIZE))
+        self.deadline = time.monotonic() + time_budget
+        self.bucket = instance_bucket(self.instance.engine_instance_id, int(campaign.delay_between_messages_ms))
+        self.sent = 0
+        self.failed = 0
+        self._page_results: Dict[int, dict] = {}
+
+    def run(self) -> Dict[str, Any]:
+        total = recipient_count(self.campaign.id)
+        cursor = int(self.campaign.sent_count) + int(self.campaign.failed_count)
+
+        loop = asyncio.new_event_loop()
+        client = AsyncEngineClient(max_connections=SEND_CONCURRENCY)
+        try:
+            while cursor < total and time.monotonic() < self.deadline:
+                if campaign_status(self.campaign.id) != "running":
+                    break
+                page = recipient_page(self.campaign.id, cursor, self.page_size, total)
+                if not page:
+                    break
+                try:
+                    results = loop.run_until_complete(self._send_page(client, page))
+                except SoftTimeLimitExceeded:
+                    # Record what was already handed to the engine so a re-run
+                    # doesn't send it again
+                    self._commit(self._attempted())
+                    raise
+                self._commit(results)
+                cursor += len(results)
+                if len(results) < len(page):
+                    break  # paused mid-page
+        finally:
+            loop.run_until_complete(client.aclose())
+            loop.close()
+
+        return {"sent": self.sent, "failed": self.failed, "attempted": cursor, "total": total}
+
+    async def _paused(self) -> bool:
+        status = await cache.aget(_status_key(self.campaign.id))
+        return status is not None and status != "running"
+
+    def _attempted(self) -> List[dict]:
+        """Results of the current page so far; sends cut off mid-request count as failed."""
+        results = [self._page_results[i] for i in range(len(self._page_results))]
+        for result in results:
+            if result["jid"] and "response" not in result and "error" not in result:
+                result["error"] = "Interrupted by the task time limit"
+        return results
+
+    async def _send_page(self, client: AsyncEngineClient, page: List[Any]) -> List[dict]:
+        """Send *page*; returns results for the prefix that was attempted."""
+        results = self._page_results = {}
+        items = iter(enumerate(page))
+        stop = False
+
+        async def worker() -> None:
+            nonlocal stop
+            while not stop:
+                # Checked per message: a page may take longer than the budget
+                if time.monotonic() >= self.deadline or await self._paused():
+                    stop = True
+                    return
+                try:
+                    index, rec = next(items)
+                except StopIteration:
+                    return
+                results[index] = {"jid": None}
+                await self._send_one(client, rec, results[index])
+
+        await asyncio.gather(*(worker() for _ in range(min(SEND_CONCURRENCY, len(page)))))
+        # Items are taken in order, so the attempted ones form a prefix
+        return [results[i] for i in range(len(results))]
+
+    async def _send_one(self, client: AsyncEngineClient, rec: Any, result: dict) -> dict:
+        """Send to *rec*, filling in *result*."""
+        jid, vars_map = _parse_recipient(rec)
+        if not jid:
+            return result
+
+        content = _safe_format_template(self.template.content, vars_map)
+        result.update(jid=jid, content=content, variables=vars_map, timestamp=timezone.now())
+
+        await self.bucket.acquire()
+        while True:
+            result["timestamp"] = timezone.now()
+            try:
+                result["response"] = await client.send_message(
+                    self.instance.engine_instance_id,
+                    to=jid,
+                    message_type=self.template.message_type,
+                    content=content,
+                    media_url=self.template.media_url,
+                    metadata={"campaign_id": str(self.campaign.id), "variables": vars_map},
+                )
+            except EngineCircuitOpenError as e:
+                # Instance is down: wait for the breaker's trial request rather
+                # than failing the rest of the page in a few milliseconds
+                if time.monotonic() < self.deadline:
+                    await asyncio.sleep(CIRCUIT_WAIT_S)
+                    continue
+                result["error"] = str(e)
+            except EngineClientError as e:
+                result["error"] = str(e)
+            return result
+
+    def _commit(self, results: List[dict]) -> None:
+        campaign_id = str(self.campaign.id)
+        messages = []
+        sent = failed = 0
+        for result in results:
+            if not result["jid"]:
+                failed += 1
+                continue
+            metadata = {"campaign_id": campaign_id, "variables": result["variables"]}
+            if "error" in result:
+                failed += 1
+                wa_message_id = None
+                metadata["error"] = result["error"]
+            else:
+                sent += 1
+                resp = result["response"]
+                wa_message_id = resp.get("wa_message_id") or resp.get("waMessageId") or resp.get("id")
+                metadata["engine_response"] = resp
+            messages.append(Message(
+                instance=self.instance,
+                remote_jid=result["jid"],
+                from_me=True,
+                message_type=self.template.message_type,
+                content=result["content"],
+                media_url=self.template.media_url,
+                wa_message_id=wa_message_id,
+                status="failed" if "error" in result else "sent",
+                timestamp=result["timestamp"],
+                metadata=metadata,
+            ))
+
+        with transaction.atomic():
+            created = Message.objects.bulk_create(messages)
+            record_messages(self.instance.id, created)
+            Campaign.objects.filter(id=self.campaign.id).update(
+                sent_count=F("sent_count") + sent,
+                failed_count=F("failed_count") + failed,
+            )
+        self.sent += sent
+        self.failed += failed
@@ -0,0 +1,107 @@
+"""
+Set-based contact and group upserts.
+
+Callers collect ``{jid: fields}`` and write it in chunks of CHUNK_SIZE,
+each with one SELECT, at most one INSERT ... ON CONFLICT DO UPDATE per
+field set and a SELECT of the written ids; rows whose fields already match
+are skipped, so a resync of an unchanged address book only reads.  bulk_create bypasses the Contact
+post_save signal, so contacts whose name or phone changed are pushed to
+their conversations here.
+"""
+import logging
+from typing import Any, Dict, Type
+
+from django.db import models, transaction
+
+from .conversations import sync_contact_names
+from .models import Contact, Group
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+# Contact fields mirrored onto conversations by sync_contact_names()
+_SYNCED_FIELDS = ("name", "phone")
+
+
+def _changed_rows(model: Type[models.Model], instance_id, rows: Dict[str, Dict[str, Any]]):
+    fields = sorted({field for values in rows.values() for field in values})
+    existing = {
+        row["jid"]: row
+        for row in model.objects.filter(instance_id=instance_id, jid__in=list(rows)).values("jid", *fields)
+    }
+    changed = {}
+    for jid, values in rows.items():
+        current = existing.get(jid)
+        if current is None or any(current[field] != value for field, value in values.items()):
+            changed[jid] = values
+    return changed, existing
+
+
+def _upsert(model: Type[models.Model], instance_id, rows: Dict[str, Dict[str, Any]]):
+    """Write changed *rows*; returns the saved objects and pre-existing values."""
+    changed, existing = _changed_rows(model, instance_id, rows)
+
+    # bulk_create needs one update_fields list per statement
+    by_fields: Dict[tuple, list] = {}
+    for jid in sorted(changed):  # fixed order keeps concurrent upserts from deadlocking
+        values = changed[jid]
+        by_fields.setdefault(tuple(sorted(values)), []).append(
+            model(instance_id=instance_id, jid=jid, **values)
+        )
+
+    saved = []
+    with transaction.atomic():
+        for fields, objs in by_fields.items():
+            saved.extend(model.objects.bulk_create(
+                objs,
+                batch_size=CHUNK_SIZE,
+                update_conflicts=True,
+                unique_fields=["instance", "jid"],
+                update_fields=list(fields),
+            ))
+        # Objects come with a fresh default pk that bulk_create does not
+        # overwrite on conflict; existing rows keep theirs
+        if saved:
+            ids = dict(
+                model.objects.filter(instance_id=instance_id, jid__in=list(changed)).values_list("jid", "pk")
+            )
+            for obj in saved:
+                obj.pk = ids[obj.jid]
+    return saved, existing
+
+
+def _chunks(rows: Dict[str, Dict[str, Any]]):
+    jids = sorted(rows)
+    for start in range(0, len(jids), CHUNK_SIZE):
+        yield {jid: rows[jid] for jid in jids[start:start + CHUNK_SIZE]}
+
+
+def upsert_contacts(instance_id, rows: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Insert or update the contacts in *rows* (``{jid: {field: value}}``).
+
+    Returns the number of contacts written (unchanged rows are not counted).
+    """
+    written = 0
+    for chunk in _chunks(rows):
+        saved, existing = _upsert(Contact, instance_id, chunk)
+        renamed = []
+        for contact in saved:
+            before = existing.get(contact.jid)
+            if before is None or any(
+                field in before and before[field] != getattr(contact, field) for field in _SYNCED_FIELDS
+            ):
+                renamed.append(contact)
+        sync_contact_names(instance_id, renamed)
+        written += len(saved)
+    return written
+
+
+def upsert_groups(instance_id, rows: Dict[str, Dict[str, Any]]) -> int:
+    """Group counterpart of upsert_contacts()."""
+    written = 0
+    for chunk in _chunks(rows):
+        saved, _ = _upsert(Group, instance_id, chunk)
+        written += len(saved)
+    return written
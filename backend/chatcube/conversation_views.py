@@ -3,19 +3,20 @@ Conversation aggregation views for ChatCube.
 
 Groups messages by (instance, remote_jid) and presents them as "conversations"
 for the /conversations frontend page. This bridges the ChatCube messaging system
-with the conversations UI.
+with the conversations UI. The list is served from the Conversation index
+(see chatcube.conversations).
 """
-from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db.models import Count, Max, Q, F, Value
-from django.db.models.functions import Replace
+from django.db.models import Q, Sum
 from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status as http_status
 
-from .models import Contact, Message, WhatsAppInstance
+from core.pagination import decode_cursor, encode_cursor
+
+from .models import Contact, Conversation, Message, WhatsAppInstance
 from .engine_client import EngineClient, EngineClientError
 from .views import _ensure_engine_instance_id
 
@@ -39,108 +40,74 @@ def conversation_list(request):
     """
     List all conversations for the authenticated user's WhatsApp instances.
 
-    A conversation = unique (instance, remote_jid) pair that has messages.
-    Uses Contact for name/phone, falls back to parsing remote_jid.
-    Supports pagination: ?page=1&per_page=50
+    Reads the Conversation index (one row per instance + contact JID), newest
+    first.  Supports keyset pagination with ?cursor=<next_cursor>&per_page=50;
+    ?page=N is still accepted for offset paging.  "count" is only computed
+    for offset pages and is null on cursor pages.
     """
     user = request.user
-    instance_ids = list(
-        WhatsAppInstance.objects.filter(owner=user).values_list("id", flat=True)
-    )
+    instance_map = {
+        str(pk): name
+        for pk, name in WhatsAppInstance.objects.filter(owner=user).values_list("id", "name")
+    }
 
-    if not instance_ids:
-        return Response({"results": [], "count": 0, "page": 1, "per_page": 50})
+    if not instance_map:
+        return Response({"results": [], "count": 0, "page": 1, "per_page": 50, "next_cursor": None})
 
     # Pagination params
     page = max(int(request.query_params.get("page", 1)), 1)
     per_page = min(int(request.query_params.get("per_page", 50)), 100)
     search = request.query_params.get("search", "").strip().lower()
-
-    # Check cache (15s TTL, invalidated by new messages)
-    cache_key = f"conv_list_{user.id}_{page}_{per_page}_{search}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return Response(cached)
-
-    # Aggregate unique conversations from messages
-    convs = (
-        Message.objects.filter(instance_id__in=instance_ids)
-        .exclude(remote_jid__endswith="@g.us")
-        .exclude(remote_jid__exact="status@broadcast")
-        .exclude(remote_jid__endswith="@lid")
-        .annotate(
-            normalized_jid=Replace(
-                "remote_jid", Value("@s.whatsapp.net"), Value("")
-            )
+    cursor = request.query_params.get("cursor")
+
+    convs = Conversation.objects.filter(instance_id__in=list(instance_map))
+    if search:
+        # Served by the trigram index on search_text
+        convs = convs.filter(search_text__contains=search)
+    # Clients keep the total from the first page rather than recount per cursor page
+    total = None if cursor else convs.count()
+
+    convs = convs.order_by("-last_message_at", "-id")
+    if cursor:
+        try:
+            last_message_at, last_id = decode_cursor(cursor)
+        except ValidationError as e:
+            return Response({"detail": e.messages[0]}, status=http_status.HTTP_400_BAD_REQUEST)
+        convs = convs.filter(
+            Q(last_message_at__lt=last_message_at)
+            | Q(last_message_at=last_message_at, id__lt=last_id)
         )
-        .values("instance_id", "normalized_jid")
-        .annotate(
-            message_count=Count("id"),
-            last_message_at=Max("timestamp"),
-        )
-        .order_by("-last_message_at")
-    )
-
-    # Build lookups
-    contacts = Contact.objects.filter(instance_id__in=instance_ids)
-    contact_map = {}
-    for c in contacts:
-        phone = _phone_from_jid(c.jid)
-        contact_map[(str(c.instance_id), phone)] = c
-
-    instances = WhatsAppInstance.objects.filter(id__in=instance_ids)
-    instance_map = {str(i.id): i.name for i in instances}
-
-    # Build result list with search filter
-    all_results = []
-    for conv in convs:
-        inst_id = str(conv["instance_id"])
-        phone = conv["normalized_jid"]
-        contact = contact_map.get((inst_id, phone))
-
-        contact_name = ""
-        contact_phone = phone
-        if contact:
-            contact_name = contact.name or contact_phone
-            contact_phone = contact.phone or contact_phone
-
-        if search:
-            if search not in contact_name.lower() and search not in contact_phone.lower():
-                continue
-
-        conv_id = str(contact.id) if contact else f"{inst_id}_{phone}"
-        all_results.append({
-            "id": conv_id,
-            "contact_name": contact_name or contact_phone,
-            "contact_phone": contact_phone,
+        rows = list(convs[: per_page + 1])
+    else:
+        start = (page - 1) * per_page
+        rows = list(convs[start : start + per_page + 1])
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    results = []
+    for conv in rows:
+        inst_id = str(conv.instance_id)
+        results.append({
+            "id": str(conv.contact_id) if conv.contact_id else f"{inst_id}_{conv.jid}",
+            "contact_name": conv.contact_name or conv.contact_phone,
+            "contact_phone": conv.contact_phone,
             "status": "active",
-            "message_count": conv["message_count"],
-            "last_message_at": (
-                conv["last_message_at"].isoformat()
-                if conv["last_message_at"]
-                else None
-            ),
+            "message_count": conv.message_count,
+            "unread_count": conv.unread_count,
+            "last_message_at": conv.last_message_at.isoformat(),
+            "last_message_preview": conv.last_message_preview,
             "instance_id": inst_id,
             "instance_name": instance_map.get(inst_id, ""),
         })
 
-    # Paginate
-    total = len(all_results)
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated = all_results[start:end]
-
-    response_data = {
-        "results": paginated,
+    return Response({
+        "results": results,
         "count": total,
         "page": page,
         "per_page": per_page,
-    }
-
-    # Cache for 15 seconds
-    cache.set(cache_key, response_data, timeout=15)
-
-    return Response(response_data)
+        "next_cursor": encode_cursor(rows[-1].last_message_at, rows[-1].id) if has_more else None,
+    })
 
 
 @api_view(["GET"])
@@ -343,42 +310,18 @@ def conversation_send_message(request, conversation_id):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def conversation_stats(request):
-    """Get conversation statistics for the authenticated user."""
-    user = request.user
-    instance_ids = list(
-        WhatsAppInstance.objects.filter(owner=user).values_list("id", flat=True)
-    )
-
-    if not instance_ids:
-        return Response(
-            {
-                "total": 0,
-                "by_status": {"active": 0, "waiting": 0, "handoff": 0, "completed": 0},
-                "total_messages": 0,
-                "unread_messages": 0,
-            }
-        )
+    """
+    Get conversation statistics for the authenticated user.
 
-    # Count unique conversations (normalize JIDs for dedup)
-    conv_count = (
-        Message.objects.filter(instance_id__in=instance_ids)
-        .annotate(
-            normalized_jid=Replace(
-                "remote_jid", Value("@s.whatsapp.net"), Value("")
-            )
-        )
-        .values("instance_id", "normalized_jid")
-        .distinct()
-        .count()
+    Reads the per-instance counters kept by chatcube.conversations instead
+    of counting Message rows.
+    """
+    totals = WhatsAppInstance.objects.filter(owner=request.user).aggregate(
+        conversations=Sum("conversation_count"),
+        messages=Sum("message_count"),
+        unread=Sum("unread_message_count"),
     )
-
-    total_messages = Message.objects.filter(instance_id__in=instance_ids).count()
-
-    unread = Message.objects.filter(
-        instance_id__in=instance_ids,
-        from_me=False,
-        status__in=["delivered", "sent", "pending"],
-    ).count()
+    conv_count = totals["conversations"] or 0
 
     return Response(
         {
@@ -389,7 +332,7 @@ def conversation_stats(request):
                 "handoff": 0,
                 "completed": 0,
             },
-            "total_messages": total_messages,
-            "unread_messages": unread,
+            "total_messages": totals["messages"] or 0,
+            "unread_messages": totals["unread"] or 0,
         }
     )
@@ -0,0 +1,323 @@
+"""
+Maintenance of the Conversation inbox index.
+
+Every new 1:1 message is folded into its Conversation row with a single
+INSERT ... ON CONFLICT DO UPDATE, so the inbox never has to aggregate the
+Message table.  Groups, status broadcasts and @lid JIDs are not
+conversations (same exclusions the inbox always applied).
+
+The same transaction bumps the instance's message, unread and
+conversation counters that conversation_stats reads;
+reconcile_instance_counters() recomputes them from the tables.  The
+conversation counter keeps the dashboard's meaning: every distinct chat,
+so groups, status broadcasts and @lid JIDs count as well.
+"""
+import logging
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Replace
+from django.utils import timezone
+
+from .models import Contact, Conversation, Message, WhatsAppInstance
+
+logger = logging.getLogger(__name__)
+
+JID_SUFFIX = "@s.whatsapp.net"
+# Inbound messages in these states count as unread
+UNREAD_STATUSES = ("delivered", "sent", "pending")
+PREVIEW_LENGTH = 255
+
+_UPSERT_COLUMNS = (
+    "id", "instance_id", "jid", "contact_id", "contact_name", "contact_phone",
+    "search_text", "message_count", "unread_count", "last_message_at",
+    "last_message_preview", "last_message_from_me", "created_at", "updated_at",
+)
+
+# References to "c" read the row as it was before this statement;
+# (xmax = 0) is true for rows this statement inserted
+_UPSERT_SQL = """
+INSERT INTO chatcube_conversation AS c ({columns})
+VALUES {values}
+ON CONFLICT (instance_id, jid) DO UPDATE SET
+    message_count = c.message_count + EXCLUDED.message_count,
+    unread_count = c.unread_count + EXCLUDED.unread_count,
+    last_message_at = GREATEST(c.last_message_at, EXCLUDED.last_message_at),
+    last_message_preview = CASE WHEN EXCLUDED.last_message_at >= c.last_message_at
+        THEN EXCLUDED.last_message_preview ELSE c.last_message_preview END,
+    last_message_from_me = CASE WHEN EXCLUDED.last_message_at >= c.last_message_at
+        THEN EXCLUDED.last_message_from_me ELSE c.last_message_from_me END,
+    contact_id = COALESCE(EXCLUDED.contact_id, c.contact_id),
+    contact_name = CASE WHEN EXCLUDED.contact_id IS NOT NULL
+        THEN EXCLUDED.contact_name ELSE c.contact_name END,
+    contact_phone = CASE WHEN EXCLUDED.contact_id IS NOT NULL
+        THEN EXCLUDED.contact_phone ELSE c.contact_phone END,
+    search_text = CASE WHEN EXCLUDED.contact_id IS NOT NULL
+        THEN EXCLUDED.search_text ELSE c.search_text END,
+    updated_at = EXCLUDED.updated_at
+RETURNING (xmax = 0)
+"""
+
+
+def conversation_jid(remote_jid: str) -> Optional[str]:
+    """Conversation key for *remote_jid*, or None if it is not a 1:1 chat."""
+    if (
+        not remote_jid
+        or remote_jid.endswith("@g.us")
+        or remote_jid.endswith("@lid")
+        or remote_jid == "status@broadcast"
+    ):
+        return None
+    return remote_jid.replace(JID_SUFFIX, "")
+
+
+def _contact_fields(contact: Optional[Contact], jid: str):
+    """Display name, phone and search text as the inbox shows them."""
+    phone = jid
+    name = phone
+    if contact:
+        name = contact.name or phone
+        phone = contact.phone or phone
+    return name, phone, f"{name}\n{phone}".lower()
+
+
+def _preview(message: Message) -> str:
+    return (message.content or f"[{message.message_type}]")[:PREVIEW_LENGTH]
+
+
+def record_messages(instance_id, messages: Iterable[Message]) -> int:
+    """
+    Fold newly created *messages* of one instance into their conversations.
+
+    Call only for messages that did not exist before; returns the number
+    of conversations touched.
+    """
+    deltas: Dict[str, dict] = {}
+    other_chats = set()
+    message_ids = []
+    total = unread_total = 0
+    for message in messages:
+        unread = not message.from_me and message.status in UNREAD_STATUSES
+        total += 1
+        unread_total += unread
+        message_ids.append(message.pk)
+        jid = conversation_jid(message.remote_jid)
+        if jid is None:
+            other_chats.add(message.remote_jid)
+            continue
+        delta = deltas.setdefault(jid, {"count": 0, "unread": 0, "last": None})
+        delta["count"] += 1
+        delta["unread"] += unread
+        if delta["last"] is None or message.timestamp >= delta["last"].timestamp:
+            delta["last"] = message
+
+    if not total:
+        return 0
+
+    with transaction.atomic():
+        inserted = _upsert_conversations(instance_id, deltas) if deltas else 0
+        inserted += _new_other_chats(instance_id, other_chats, message_ids)
+        WhatsAppInstance.objects.filter(id=instance_id).update(
+            message_count=F("message_count") + total,
+            unread_message_count=F("unread_message_count") + unread_total,
+            conversation_count=F("conversation_count") + inserted,
+        )
+    return len(deltas)
+
+
+def _new_other_chats(instance_id, remote_jids, message_ids) -> int:
+    """How many of *remote_jids* (chats without a Conversation) had no earlier message."""
+    # One probe of msg_conv_timeline_idx per chat
+    earlier = Message.objects.filter(instance_id=instance_id).exclude(id__in=message_ids)
+    return sum(1 for remote_jid in remote_jids if not earlier.filter(remote_jid=remote_jid).exists())
+
+
+def _upsert_conversations(instance_id, deltas: Dict[str, dict]) -> int:
+    """Apply per-conversation deltas; returns how many rows were new."""
+    contacts = {}
+    candidates = [j for jid in deltas for j in (jid, jid + JID_SUFFIX)]
+    for contact in Contact.objects.filter(instance_id=instance_id, jid__in=candidates):
+        contacts.setdefault(contact.jid.replace(JID_SUFFIX, ""), contact)
+
+    now = timezone.now()
+    params: List = []
+    # Fixed row order keeps concurrent upserts from deadlocking
+    for jid in sorted(deltas):
+        delta = deltas[jid]
+        contact = contacts.get(jid)
+        name, phone, search_text = _contact_fields(contact, jid)
+        last = delta["last"]
+        params.extend([
+            uuid.uuid4(), instance_id, jid, contact.id if contact else None,
+            name, phone, search_text, delta["count"], delta["unread"],
+            last.timestamp, _preview(last), last.from_me, now, now,
+        ])
+
+    row = "(" + ", ".join(["%s"] * len(_UPSERT_COLUMNS)) + ")"
+    sql = _UPSERT_SQL.format(
+        columns=", ".join(_UPSERT_COLUMNS),
+        values=", ".join([row] * len(deltas)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return sum(1 for (was_inserted,) in cursor.fetchall() if was_inserted)
+
+
+def record_message(message: Message) -> int:
+    return record_messages(message.instance_id, [message])
+
+
+def mark_read(instance_id, remote_jids: Iterable[str]) -> None:
+    """Decrement unread counters for inbound messages that were just read."""
+    remote_jids = list(remote_jids)
+    counts: Dict[str, int] = {}
+    for remote_jid in remote_jids:
+        jid = conversation_jid(remote_jid)
+        if jid is not None:
+            counts[jid] = counts.get(jid, 0) + 1
+
+    with transaction.atomic():
+        for jid, count in counts.items():
+            Conversation.objects.filter(instance_id=instance_id, jid=jid).update(
+                unread_count=Greatest(F("unread_count") - count, 0),
+            )
+        if remote_jids:
+            WhatsAppInstance.objects.filter(id=instance_id).update(
+                unread_message_count=Greatest(F("unread_message_count") - len(remote_jids), 0),
+            )
+
+
+def sync_contact(contact: Contact) -> None:
+    """Refresh the denormalized contact fields after a contact changes."""
+    jid = conversation_jid(contact.jid)
+    if jid is None:
+        return
+    name, phone, search_text = _contact_fields(contact, jid)
+    Conversation.objects.filter(instance_id=contact.instance_id, jid=jid).update(
+        contact=contact,
+        contact_name=name,
+        contact_phone=phone,
+        search_text=search_text,
+    )
+
+
+def sync_contact_names(instance_id, contacts: Iterable[Contact]) -> int:
+    """sync_contact() for many contacts of one instance; one bulk UPDATE."""
+    by_jid = {}
+    for contact in contacts:
+        jid = conversation_jid(contact.jid)
+        if jid is not None:
+            by_jid[jid] = contact
+    if not by_jid:
+        return 0
+
+    conversations = list(Conversation.objects.filter(instance_id=instance_id, jid__in=list(by_jid)))
+    for conversation in conversations:
+        contact = by_jid[conversation.jid]
+        conversation.contact = contact
+        conversation.contact_name, conversation.contact_phone, conversation.search_text = (
+            _contact_fields(contact, conversation.jid)
+        )
+    Conversation.objects.bulk_update(
+        conversations,
+        ["contact", "contact_name", "contact_phone", "search_text"],
+        batch_size=500,
+    )
+    return len(conversations)
+
+
+def rebuild_conversations(instance_id) -> int:
+    """Recompute every conversation of an instance from its messages."""
+    messages = (
+        Message.objects.filter(instance_id=instance_id)
+        .exclude(remote_jid__endswith="@g.us")
+        .exclude(remote_jid__exact="status@broadcast")
+        .exclude(remote_jid__endswith="@lid")
+        .annotate(conv_jid=Replace("remote_jid", Value(JID_SUFFIX), Value("")))
+    )
+    aggregates = messages.values("conv_jid").annotate(
+        message_count=Count("id"),
+        unread_count=Count("id", filter=Q(from_me=False, status__in=UNREAD_STATUSES)),
+        last_message_at=Max("timestamp"),
+    )
+    latest = {
+        row["conv_jid"]: row
+        for row in messages.order_by("conv_jid", "-timestamp")
+        .distinct("conv_jid")
+        .values("conv_jid", "content", "message_type", "from_me")
+    }
+
+    contacts = {}
+    for contact in Contact.objects.filter(instance_id=instance_id):
+        contacts.setdefault(contact.jid.replace(JID_SUFFIX, ""), contact)
+
+    rows = []
+    for agg in aggregates:
+        jid = agg["conv_jid"]
+        contact = contacts.get(jid)
+        name, phone, search_text = _contact_fields(contact, jid)
+        last = latest.get(jid) or {}
+        rows.append(Conversation(
+            instance_id=instance_id,
+            jid=jid,
+            contact=contact,
+            contact_name=name,
+            contact_phone=phone,
+            search_text=search_text,
+            message_count=agg["message_count"],
+            unread_count=agg["unread_count"],
+            last_message_at=agg["last_message_at"],
+            last_message_preview=(
+                last.get("content") or f"[{last.get('message_type', 'text')}]"
+            )[:PREVIEW_LENGTH],
+            last_message_from_me=bool(last.get("from_me")),
+        ))
+
+    started = timezone.now()
+    with transaction.atomic():
+        Conversation.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["instance", "jid"],
+            update_fields=[
+                "contact", "contact_name", "contact_phone", "search_text",
+                "message_count", "unread_count", "last_message_at",
+                "last_message_preview", "last_message_from_me", "updated_at",
+            ],
+        )
+        # Rows not rewritten above no longer have any messages
+        Conversation.objects.filter(instance_id=instance_id, updated_at__lt=started).delete()
+        reconcile_instance_counters(instance_id)
+    return len(rows)
+
+
+def _count(queryset):
+    subquery = queryset.order_by().values("instance_id").annotate(n=Count("id")).values("n")
+    return Coalesce(Subquery(subquery), 0)
+
+
+def reconcile_instance_counters(instance_id) -> None:
+    """Recompute an instance's inbox counters in one UPDATE."""
+    messages = Message.objects.filter(instance_id=OuterRef("pk"))
+    other_chats = (
+        messages.filter(
+            Q(remote_jid__endswith="@g.us")
+            | Q(remote_jid__endswith="@lid")
+            | Q(remote_jid__in=["status@broadcast", ""])
+        )
+        .order_by()
+        .values("instance_id")
+        .annotate(n=Count("remote_jid", distinct=True))
+        .values("n")
+    )
+    WhatsAppInstance.objects.filter(id=instance_id).update(
+        message_count=_count(messages),
+        unread_message_count=_count(messages.filter(from_me=False, status__in=UNREAD_STATUSES)),
+        conversation_count=(
+            _count(Conversation.objects.filter(instance_id=OuterRef("pk")))
+            + Coalesce(Subquery(other_chats), 0)
+        ),
+    )
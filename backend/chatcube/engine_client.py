@@ -1,15 +1,39 @@
+import asyncio
 import os
-from typing import Any, Dict, Optional, Union
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
 
+import httpx
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 
+try:
+    import h2  # noqa: F401
+
+    _HTTP2 = True
+except ImportError:  # pragma: no cover
+    _HTTP2 = False
+
+
 class EngineClientError(RuntimeError):
     pass
 
 
+class EngineCircuitOpenError(EngineClientError):
+    """The instance's circuit breaker is open; the request was not sent."""
+
+
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (502, 503, 504)
+
+SEND_BATCH_MAX = 100            # Must not exceed the engine's MAX_SEND_BATCH
+BREAKER_FAILURE_THRESHOLD = 5   # Consecutive failures that open the circuit
+BREAKER_RESET_TIMEOUT = 30      # Seconds before a trial request is let through
+
 # Singleton session with connection pooling and retry
 _session: Optional[requests.Session] = None
 
@@ -19,9 +43,9 @@ def _get_session() -> requests.Session:
     if _session is None:
         _session = requests.Session()
         retry = Retry(
-            total=3,
-            backoff_factor=0.5,
-            status_forcelist=[502, 503, 504],
+            total=RETRY_TOTAL,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=list(RETRY_STATUSES),
             allowed_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
         )
         adapter = HTTPAdapter(
@@ -34,6 +58,89 @@ def _get_session() -> requests.Session:
     return _session
 
 
+def _message_payload(
+    to: str,
+    message_type: str = "text",
+    content: str = "",
+    media_url: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "to": to,
+        "type": message_type,
+        "content": content,
+    }
+    if media_url:
+        payload["mediaUrl"] = media_url
+    if metadata:
+        payload["metadata"] = metadata
+    return payload
+
+
+def _parse_response(resp, method: str, url: str) -> Dict[str, Any]:
+    try:
+        data: Union[Dict[str, Any], Any] = resp.json()
+    except ValueError:
+        data = {"detail": resp.text}
+
+    if resp.status_code >= 400:
+        raise EngineClientError(f"Engine request failed ({resp.status_code}) {method} {url}: {data}")
+
+    if isinstance(data, dict):
+        return data
+    return {"data": data}
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker for one engine instance.
+
+    After BREAKER_FAILURE_THRESHOLD failures in a row, calls are rejected
+    for BREAKER_RESET_TIMEOUT seconds; then a single trial call is let
+    through, and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: hold the circuit open for everyone but this trial
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(engine_instance_id: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(engine_instance_id)
+        if breaker is None:
+            breaker = _breakers[engine_instance_id] = CircuitBreaker()
+        return breaker
+
+
 class EngineClient:
     """
     Minimal HTTP client for chatcube-engine.
@@ -63,17 +170,7 @@ class EngineClient:
         except requests.RequestException as e:
             raise EngineClientError(f"Engine request error ({method} {url}): {e}") from e
 
-        try:
-            data: Union[Dict[str, Any], Any] = resp.json()
-        except ValueError:
-            data = {"detail": resp.text}
-
-        if resp.status_code >= 400:
-            raise EngineClientError(f"Engine request failed ({resp.status_code}) {method} {url}: {data}")
-
-        if isinstance(data, dict):
-            return data
-        return {"data": data}
+        return _parse_response(resp, method, url)
 
     def create_instance(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         engine_payload: Dict[str, Any] = {
@@ -114,15 +211,7 @@ class EngineClient:
         media_url: Optional[str] = None,
         metadata: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        payload: Dict[str, Any] = {
-            "to": to,
-            "type": message_type,
-            "content": content,
-        }
-        if media_url:
-            payload["mediaUrl"] = media_url
-        if metadata:
-            payload["metadata"] = metadata
+        payload = _message_payload(to, message_type, content, media_url, metadata)
         return self._request("POST", f"/api/messages/{engine_instance_id}/send", json=payload)
 
     def disconnect(self, engine_instance_id: str) -> Dict[str, Any]:
@@ -163,3 +252,105 @@ class EngineClient:
 
     def fetch_history(self, engine_instance_id: str, jid: str, count: int = 50) -> Dict[str, Any]:
         return self._request("POST", f"/api/instances/{engine_instance_id}/fetch-history", json={"jid": jid, "count": count})
+
+
+class AsyncEngineClient:
+    """
+    Async client for chatcube-engine, for callers that send many messages
+    concurrently (campaign dispatch, chatbot replies).  One pooled keep-alive
+    connection set per client (HTTP/2 when h2 is installed and the engine is
+    served over TLS); use as an async context manager or call aclose().
+
+    Calls scoped to an instance go through that instance's circuit breaker,
+    so a dead instance fails fast instead of tying up connections.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, timeout: int = 15, max_connections: int = 20):
+        self.base_url = (base_url or os.getenv("CHATCUBE_ENGINE_URL", "http://chatcube-engine:3100")).rstrip("/")
+        self.api_key = os.getenv("CHATCUBE_ENGINE_API_KEY", "")
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            http2=_HTTP2,
+            headers={"X-Engine-Key": self.api_key},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def __aenter__(self) -> "AsyncEngineClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        *,
+        json: Optional[Dict[str, Any]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        instance_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        url = f"{self.base_url}{path}"
+        breaker = circuit_breaker(instance_id) if instance_id else None
+        if breaker and not breaker.allow():
+            raise EngineCircuitOpenError(f"Circuit open for engine instance {instance_id}; {method} {url} not sent")
+
+        # Same policy as the sync session's urllib3 Retry
+        for attempt in range(RETRY_TOTAL + 1):
+            try:
+                resp = await self._client.request(method, url, json=json, params=params)
+            except httpx.HTTPError as e:
+                if attempt == RETRY_TOTAL:
+                    if breaker:
+                        breaker.record_failure()
+                    raise EngineClientError(f"Engine request error ({method} {url}): {e}") from e
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+                    break
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+        if breaker:
+            # 4xx means the engine answered; only server errors count against it
+            if resp.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return _parse_response(resp, method, url)
+
+    async def send_message(
+        self,
+        engine_instance_id: str,
+        *,
+        to: str,
+        message_type: str = "text",
+        content: str = "",
+        media_url: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        payload = _message_payload(to, message_type, content, media_url, metadata)
+        return await self._request(
+            "POST", f"/api/messages/{engine_instance_id}/send", json=payload, instance_id=engine_instance_id,
+        )
+
+    async def send_messages(self, engine_instance_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Queue *messages* (dicts with send_message's keyword arguments) on the
+        engine in order, SEND_BATCH_MAX per request.
+
+        Returns one engine result per message: ``{"success", "messageId"}``
+        or ``{"success": False, "error"}``.
+        """
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(messages), SEND_BATCH_MAX):
+            chunk = messages[start:start + SEND_BATCH_MAX]
+            resp = await self._request(
+                "POST",
+                f"/api/messages/{engine_instance_id}/send-batch",
+                json={"messages": [_message_payload(**message) for message in chunk]},
+                instance_id=engine_instance_id,
+            )
+            results.extend((resp.get("data") or {}).get("results") or [])
+        return results
@@ -0,0 +1,272 @@
+"""
+Micro-batched ingestion of engine message webhooks.
+
+accept_engine_webhook() validates message_received / message_status_update
+events and LPUSHes them onto INGEST_KEY; the first push of a window
+schedules flush_ingest_queue INGEST_WINDOW_S later.  The flush commits
+each instance's share of a batch with one Message bulk insert (plus a bulk
+update for redelivered wa_message_ids), set-based contact/group upserts and
+a single counter UPDATE, instead of 5+ queries per message.
+
+One flusher runs at a time (LOCK_KEY).  A claimed batch is moved to
+PROCESSING_KEY until it is committed, and a flusher that finds it
+non-empty replays it first, so a crash mid-commit loses nothing.  Payloads
+that cannot be processed even one at a time go to DEAD_LETTER_KEY.
+"""
+import json
+import logging
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+import redis
+
+from .contacts import upsert_contacts, upsert_groups
+from .conversations import record_messages
+from .models import Message, WhatsAppInstance
+
+logger = logging.getLogger(__name__)
+
+INGEST_KEY = "chatcube:ingest:queue"
+PROCESSING_KEY = "chatcube:ingest:processing"
+LOCK_KEY = "chatcube:ingest:lock"
+SCHEDULED_KEY = "chatcube:ingest:scheduled"
+DEAD_LETTER_KEY = "chatcube:ingest:dead"
+
+BATCHED_EVENTS = ("message_received", "message_status_update")
+
+INGEST_WINDOW_S = 0.5       # How long messages accumulate before a flush
+BATCH_SIZE = 500            # Webhooks committed per batch
+FLUSH_TIME_BUDGET_S = 20    # Then hand over to a fresh task
+LOCK_TIMEOUT = 60           # Must exceed the time to commit one batch
+SCHEDULE_TTL = 5            # A lost flush trigger is re-armed after this
+DEAD_LETTER_MAX = 10000
+
+# KEYS: queue, processing  ARGV: count
+_CLAIM_LUA = """
+local items = redis.call('LRANGE', KEYS[1], -tonumber(ARGV[1]), -1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], 0, -#items - 1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+# KEYS: lock  ARGV: token
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def batching_enabled() -> bool:
+    return getattr(settings, "CHATCUBE_BATCH_INGEST", True)
+
+
+@lru_cache(maxsize=1)
+def _get_redis():
+    redis_url = getattr(settings, "CELERY_BROKER_URL", "redis://flowcube-redis:6379/3")
+    return redis.from_url(redis_url)
+
+
+@lru_cache(maxsize=1)
+def _scripts():
+    r = _get_redis()
+    return r.register_script(_CLAIM_LUA), r.register_script(_RELEASE_LUA)
+
+
+def enqueue_webhook(instance: WhatsAppInstance, event: str, payload: Dict[str, Any]) -> None:
+    entry = json.dumps({"instance_id": str(instance.id), "event": event, "payload": payload}, default=str)
+    pipe = _get_redis().pipeline(transaction=False)
+    pipe.lpush(INGEST_KEY, entry)
+    pipe.set(SCHEDULED_KEY, 1, nx=True, ex=SCHEDULE_TTL)
+    _, first_in_window = pipe.execute()
+    if first_in_window:
+        from .tasks import flush_ingest_queue
+
+        flush_ingest_queue.apply_async(countdown=INGEST_WINDOW_S)
+
+
+def _dead_letter(entries) -> None:
+    pipe = _get_redis().pipeline(transaction=False)
+    for raw, error in entries:
+        payload = raw.decode(errors="replace") if isinstance(raw, bytes) else raw
+        pipe.lpush(DEAD_LETTER_KEY, json.dumps({
+            "payload": payload,
+            "error": error,
+            "failed_at": timezone.now().isoformat(),
+        }))
+    pipe.ltrim(DEAD_LETTER_KEY, 0, DEAD_LETTER_MAX - 1)
+    pipe.execute()
+
+
+def _commit_messages(instance: WhatsAppInstance, entries: List[Dict[str, Any]]) -> None:
+    """Write the message_received entries of one instance in one transaction."""
+    from .webhooks import _parse_message_received
+
+    parsed = [p for p in (_parse_message_received(instance, e["payload"]) for e in entries) if p]
+    if not parsed:
+        return
+
+    # Redelivered ids update the existing row, as update_or_create did; last one wins
+    by_wa_id: Dict[str, Dict[str, Any]] = {}
+    without_id = []
+    for p in parsed:
+        if p["wa_message_id"]:
+            by_wa_id[p["wa_message_id"]] = p
+        else:
+            without_id.append(p)
+
+    to_update = list(Message.objects.filter(instance=instance, wa_message_id__in=list(by_wa_id)))
+    for msg in to_update:
+        for field, value in by_wa_id[msg.wa_message_id]["defaults"].items():
+            setattr(msg, field, value)
+    existing_ids = {msg.wa_message_id for msg in to_update}
+
+    to_create = [
+        Message(instance=instance, wa_message_id=p["wa_message_id"] or None, **p["defaults"])
+        for p in without_id + [p for wa_id, p in by_wa_id.items() if wa_id not in existing_ids]
+    ]
+
+    # Same contact/group writes as the per-message path, folded per jid
+    contacts: Dict[str, Dict[str, Any]] = {}
+    groups: Dict[str, Dict[str, Any]] = {}
+    sent_today = 0
+    today = timezone.localdate()
+    for p in parsed:
+        remote_jid = p["defaults"]["remote_jid"]
+        timestamp = p["defaults"]["timestamp"]
+        name = p["sender_name"]
+        if remote_jid.endswith("@g.us"):
+            groups.setdefault(remote_jid, {})["name"] = name or remote_jid
+        else:
+            contacts.setdefault(remote_jid, {}).update(name=name or remote_jid, phone="", last_message_at=timestamp)
+        sender_jid = p["sender_jid"]
+        if p["is_group"] and sender_jid and not sender_jid.endswith("@g.us"):
+            contacts.setdefault(sender_jid, {}).update(name=name or sender_jid, phone="")
+        if p["defaults"]["from_me"] and timestamp.date() == today:
+            sent_today += 1
+
+    with transaction.atomic():
+        created = Message.objects.bulk_create(to_create)
+        if to_update:
+            Message.objects.bulk_update(to_update, list(parsed[0]["defaults"]))
+        upsert_groups(instance.id, groups)
+        upsert_contacts(instance.id, contacts)
+        # After the contact upsert so new conversations pick up contact names
+        record_messages(instance.id, created)
+        if sent_today:
+            WhatsAppInstance.objects.filter(id=instance.id).update(
+                messages_sent_today=F("messages_sent_today") + sent_today,
+            )
+
+
+def _commit_instance(instance: WhatsAppInstance, entries: List[Dict[str, Any]]) -> None:
+    from .webhooks import _handle_status_update
+
+    # All or nothing, so the one-by-one fallback never replays committed messages
+    with transaction.atomic():
+        _commit_messages(instance, [e for e in entries if e["event"] == "message_received"])
+        # Status updates refer to messages that arrived before them, so they go second
+        for entry in entries:
+            if entry["event"] == "message_status_update":
+                _handle_status_update(instance, entry["event"], entry["payload"])
+
+
+def _process_one(instance: WhatsAppInstance, entry: Dict[str, Any]) -> None:
+    from .webhooks import _handle_message_received, _handle_status_update
+
+    handler = _handle_message_received if entry["event"] == "message_received" else _handle_status_update
+    handler(instance, entry["event"], entry["payload"])
+
+
+def _process_batch(items: List[bytes]) -> int:
+    """Commit a claimed batch (in arrival order); returns entries processed."""
+    dead = []
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for raw in items:
+        try:
+            entry = json.loads(raw)
+            entry["raw"] = raw
+            grouped.setdefault(entry["instance_id"], []).append(entry)
+        except (ValueError, TypeError, KeyError) as exc:
+            dead.append((raw, f"{type(exc).__name__}: {exc}"))
+
+    instances = WhatsAppInstance.objects.in_bulk(list(grouped))
+    processed = 0
+    for instance_id, entries in grouped.items():
+        instance = instances.get(uuid.UUID(instance_id))
+        if instance is None:
+            dead.extend((e["raw"], f"Unknown instance {instance_id}") for e in entries)
+            continue
+        try:
+            _commit_instance(instance, entries)
+            processed += len(entries)
+            continue
+        except Exception:
+            logger.exception("Batched ingest failed for instance=%s; retrying one by one", instance_id)
+
+        # Isolate the payload that broke the batch instead of losing the rest
+        for entry in entries:
+            try:
+                _process_one(instance, entry)
+                processed += 1
+            except Exception as exc:
+                logger.exception("Ingest failed for instance=%s event=%s", instance_id, entry["event"])
+                dead.append((entry["raw"], f"{type(exc).__name__}: {exc}"))
+
+    if dead:
+        logger.warning("Moved %d webhooks to %s", len(dead), DEAD_LETTER_KEY)
+        _dead_letter(dead)
+    return processed
+
+
+def flush_queue(time_budget: float = FLUSH_TIME_BUDGET_S) -> Dict[str, Any]:
+    """
+    Drain the ingest queue batch by batch until it is empty or *time_budget*
+    runs out.  ``pending`` in the result means another flush is needed.
+    A flush that finds the lock taken does nothing: the holder checks the
+    queue again after releasing it.
+    """
+    r = _get_redis()
+    claim, release = _scripts()
+
+    token = uuid.uuid4().hex
+    if not r.set(LOCK_KEY, token, nx=True, ex=LOCK_TIMEOUT):
+        return {"processed": 0, "pending": False, "locked": True}
+    # Pushes from now on arm a new flush, so none can be left behind
+    r.delete(SCHEDULED_KEY)
+
+    deadline = time.monotonic() + time_budget
+    processed = 0
+    try:
+        # A batch left behind by a flusher that died mid-commit goes first
+        items = r.lrange(PROCESSING_KEY, 0, -1)
+        while True:
+            if not items:
+                items = claim(keys=[INGEST_KEY, PROCESSING_KEY], args=[BATCH_SIZE])
+            if not items:
+                break
+            # LRANGE returns newest first; process in arrival order
+            items.reverse()
+            processed += _process_batch(items)
+            r.delete(PROCESSING_KEY)
+            r.expire(LOCK_KEY, LOCK_TIMEOUT)
+            items = None
+            if time.monotonic() >= deadline:
+                break
+    finally:
+        # Pushes that saw the lock are caught by the pending check below
+        r.delete(SCHEDULED_KEY)
+        release(keys=[LOCK_KEY], args=[token])
+
+    if processed:
+        logger.info("Ingested %d engine webhooks", processed)
+    return {"processed": processed, "pending": bool(r.llen(INGEST_KEY)), "locked": False}
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from chatcube.conversations import rebuild_conversations
+from chatcube.models import WhatsAppInstance
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Conversation inbox index from stored messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--instance",
+            action="append",
+            dest="instances",
+            help="Instance UUID to rebuild (repeatable; default: all instances)",
+        )
+
+    def handle(self, *args, **options):
+        instances = WhatsAppInstance.objects.all()
+        if options["instances"]:
+            instances = instances.filter(id__in=options["instances"])
+
+        total = 0
+        for instance in instances.only("id", "name"):
+            count = rebuild_conversations(instance.id)
+            total += count
+            self.stdout.write(f"{instance.name}: {count} conversations")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} conversations"))
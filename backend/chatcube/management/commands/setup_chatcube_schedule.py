@@ -0,0 +1,42 @@
+"""Register/update the ChatCube periodic tasks in Celery Beat DB."""
+from django.core.management.base import BaseCommand
+from django_celery_beat.models import CrontabSchedule, IntervalSchedule, PeriodicTask
+
+
+class Command(BaseCommand):
+    help = "Register ChatCube periodic tasks in Celery Beat"
+
+    def handle(self, *args, **options):
+        schedule, _ = CrontabSchedule.objects.get_or_create(
+            minute="30",
+            hour="3",
+            day_of_week="*",
+            day_of_month="*",
+            month_of_year="*",
+        )
+        task, created = PeriodicTask.objects.update_or_create(
+            name="ChatCube: reconcile inbox counters",
+            defaults={
+                "task": "chatcube.tasks.reconcile_inbox_counters",
+                "crontab": schedule,
+                "interval": None,
+                "enabled": True,
+                "description": "Recompute per-instance message/unread/conversation counters nightly",
+            },
+        )
+        action = "Created" if created else "Updated"
+        self.stdout.write(self.style.SUCCESS(f"{action}: \"{task.name}\" (daily 03:30)"))
+
+        interval, _ = IntervalSchedule.objects.get_or_create(every=1, period=IntervalSchedule.MINUTES)
+        task, created = PeriodicTask.objects.update_or_create(
+            name="ChatCube: flush ingest queue",
+            defaults={
+                "task": "chatcube.tasks.flush_ingest_queue",
+                "interval": interval,
+                "crontab": None,
+                "enabled": True,
+                "description": "Safety net for batched webhook ingest whose flush trigger was lost",
+            },
+        )
+        action = "Created" if created else "Updated"
+        self.stdout.write(self.style.SUCCESS(f"{action}: \"{task.name}\" (every 1 minute)"))
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.15 on 2026-10-16 09:00
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatcube', '0006_rename_chatcube_me_instanc_40d6b9_idx_msg_instance_time_idx_and_more'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('jid', models.CharField(max_length=255)),
+                ('contact_name', models.CharField(blank=True, default='', max_length=255)),
+                ('contact_phone', models.CharField(blank=True, default='', max_length=255)),
+                ('search_text', models.TextField(blank=True, default='')),
+                ('message_count', models.IntegerField(default=0)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_message_preview', models.CharField(blank=True, default='', max_length=255)),
+                ('last_message_from_me', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('contact', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='conversations', to='chatcube.contact')),
+                ('instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='chatcube.whatsappinstance')),
+            ],
+            options={
+                'ordering': ['-last_message_at', '-id'],
+                'indexes': [
+                    models.Index(fields=['instance', '-last_message_at', '-id'], name='conv_inbox_idx'),
+                    django.contrib.postgres.indexes.GinIndex(fields=['search_text'], name='conv_search_trgm_idx', opclasses=['gin_trgm_ops']),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('instance', 'jid'), name='uniq_conversation_instance_jid'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-16 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatcube', '0007_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='whatsappinstance',
+            name='message_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='whatsappinstance',
+            name='unread_message_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='whatsappinstance',
+            name='conversation_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+"""
+0009 - Build the Conversation inbox index and the instance inbox counters
+       from existing messages, so the inbox is populated right after deploy.
+       Same as ``manage.py rebuild_conversations`` for every instance.
+"""
+from django.db import migrations
+
+
+def backfill_conversations(apps, schema_editor):
+    # rebuild_conversations() works on the current models; this runs right
+    # after 0007/0008, when the tables match them
+    from chatcube.conversations import rebuild_conversations
+
+    WhatsAppInstance = apps.get_model("chatcube", "WhatsAppInstance")
+    for instance_id in WhatsAppInstance.objects.values_list("id", flat=True):
+        rebuild_conversations(instance_id)
+
+
+class Migration(migrations.Migration):
+    # Each instance is rebuilt in its own transaction instead of one long one
+    atomic = False
+
+    dependencies = [
+        ("chatcube", "0008_whatsappinstance_inbox_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
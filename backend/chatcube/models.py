@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
 from django.utils import timezone
 import uuid
 
@@ -45,6 +46,11 @@ class WhatsAppInstance(models.Model):
     daily_limit = models.IntegerField(default=999999)
     warmup_day = models.IntegerField(default=30)
 
+    # Inbox counters, maintained by chatcube.conversations and reconciled nightly
+    message_count = models.IntegerField(default=0)
+    unread_message_count = models.IntegerField(default=0)
+    conversation_count = models.IntegerField(default=0)
+
     # Engine internal reference
     engine_instance_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     evolution_instance_name = models.CharField(max_length=100, blank=True, null=True, help_text="Nome da instância na Evolution API para sync de histórico")
@@ -127,6 +133,50 @@ class Contact(models.Model):
         return f"{self.name or self.jid} ({self.instance.name})"
 
 
+class Conversation(models.Model):
+    """
+    Inbox row per (instance, 1:1 chat), kept up to date as messages arrive.
+
+    ``jid`` is the remote JID without the ``@s.whatsapp.net`` suffix, so both
+    JID spellings land on one row.  Maintained by chatcube.conversations;
+    rebuild from Message with ``manage.py rebuild_conversations``.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    instance = models.ForeignKey(WhatsAppInstance, on_delete=models.CASCADE, related_name="conversations")
+    jid = models.CharField(max_length=255)
+    contact = models.ForeignKey(
+        Contact,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="conversations",
+    )
+    contact_name = models.CharField(max_length=255, blank=True, default="")
+    contact_phone = models.CharField(max_length=255, blank=True, default="")
+    # Lower-cased name and phone, trigram-indexed for inbox search
+    search_text = models.TextField(blank=True, default="")
+    message_count = models.IntegerField(default=0)
+    unread_count = models.IntegerField(default=0)
+    last_message_at = models.DateTimeField(default=timezone.now)
+    last_message_preview = models.CharField(max_length=255, blank=True, default="")
+    last_message_from_me = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-last_message_at", "-id"]
+        constraints = [
+            models.UniqueConstraint(fields=["instance", "jid"], name="uniq_conversation_instance_jid"),
+        ]
+        indexes = [
+            models.Index(fields=["instance", "-last_message_at", "-id"], name="conv_inbox_idx"),
+            GinIndex(fields=["search_text"], name="conv_search_trgm_idx", opclasses=["gin_trgm_ops"]),
+        ]
+
+    def __str__(self):
+        return f"{self.contact_name or self.jid} ({self.instance.name})"
+
+
 class Group(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     instance = models.ForeignKey(WhatsAppInstance, on_delete=models.CASCADE, related_name="groups")
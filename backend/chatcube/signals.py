@@ -3,7 +3,8 @@ import logging
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 
-from .models import WhatsAppInstance
+from .conversations import record_message, sync_contact
+from .models import Contact, Message, WhatsAppInstance
 
 logger = logging.getLogger(__name__)
 
@@ -42,3 +43,15 @@ def whatsapp_instance_post_save(sender, instance: WhatsAppInstance, created: boo
             instance.status,
         )
 
+
+@receiver(post_save, sender=Message)
+def message_post_save(sender, instance: Message, created: bool, raw: bool = False, **kwargs):
+    # bulk_create callers (history sync) record their messages themselves
+    if created and not raw:
+        record_message(instance)
+
+
+@receiver(post_save, sender=Contact)
+def contact_post_save(sender, instance: Contact, raw: bool = False, **kwargs):
+    if not raw:
+        sync_contact(instance)
@@ -1,13 +1,12 @@
 import logging
-import time
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from django.db import transaction
-from django.db.models import F
 from django.utils import timezone
 
+from .campaigns import CampaignDispatcher, SoftTimeLimitExceeded, campaign_status, publish_campaign_status
 from .engine_client import EngineClient, EngineClientError
-from .models import Campaign, Contact, Message, WhatsAppInstance
+from .models import Campaign, WhatsAppInstance
 
 logger = logging.getLogger(__name__)
 
@@ -126,36 +125,16 @@ def health_check_instances() -> Dict[str, Any]:
     return {"checked": len(instances), "updated": updated, "errors": errors}
 
 
-def _normalize_recipients(recipients: Any) -> List[Union[str, Dict[str, Any]]]:
-    if recipients is None:
-        return []
-    if isinstance(recipients, list):
-        return recipients
-    return []
-
-
-def _safe_format_template(content: str, variables: Dict[str, Any]) -> str:
-    class _SafeDict(dict):
-        def __missing__(self, key):  # type: ignore[override]
-            return ""
-
-    try:
-        return content.format_map(_SafeDict(variables))
-    except Exception:
-        # If the template uses a different placeholder convention, keep it as-is.
-        return content
-
-
 @shared_task(time_limit=600, soft_time_limit=540)
 def run_campaign(campaign_id: str) -> Dict[str, Any]:
     """
-    Send campaign messages in batches.
+    Send campaign messages until done, paused or out of time.
 
     Progress pointer is inferred as:
       attempted = sent_count + failed_count
-    """
 
-    client = EngineClient()
+    Sending itself is done by campaigns.CampaignDispatcher.
+    """
     try:
         campaign = Campaign.objects.select_related("instance", "template").get(id=campaign_id)
     except Campaign.DoesNotExist:
@@ -181,89 +160,29 @@ def run_campaign(campaign_id: str) -> Dict[str, Any]:
 
     # Mark running.
     Campaign.objects.filter(id=campaign.id).update(status="running", started_at=campaign.started_at or now)
+    publish_campaign_status(campaign.id, "running")
 
-    recipients = _normalize_recipients(campaign.recipients)
-    attempted_total = int(campaign.sent_count) + int(campaign.failed_count)
-    batch = recipients[attempted_total : attempted_total + int(campaign.batch_size)]
-
-    sent = 0
-    failed = 0
-
-    for rec in batch:
-        # Allow pausing mid-batch.
-        current_status = Campaign.objects.filter(id=campaign.id).values_list("status", flat=True).first()
-        if current_status != "running":
-            break
-
-        jid: Optional[str] = None
-        vars_map: Dict[str, Any] = {}
-        if isinstance(rec, str):
-            jid = rec
-        elif isinstance(rec, dict):
-            jid = rec.get("jid") or rec.get("to")
-            vars_map = rec.get("variables") or rec.get("vars") or {}
-
-        if not jid:
-            Campaign.objects.filter(id=campaign.id).update(failed_count=F("failed_count") + 1)
-            failed += 1
-            continue
-
-        content = _safe_format_template(campaign.template.content, vars_map)
-        message_type = campaign.template.message_type
-        media_url = campaign.template.media_url
-        msg_ts = timezone.now()
-
+    try:
+        result = CampaignDispatcher(campaign).run()
+    except SoftTimeLimitExceeded:
+        # The dispatcher committed its progress; carry on in a fresh task
         try:
-            resp = client.send_message(
-                campaign.instance.engine_instance_id,
-                to=jid,
-                message_type=message_type,
-                content=content,
-                media_url=media_url,
-                metadata={"campaign_id": str(campaign.id), "variables": vars_map},
-            )
-            wa_message_id = resp.get("wa_message_id") or resp.get("waMessageId") or resp.get("id")
-
-            Message.objects.create(
-                instance=campaign.instance,
-                remote_jid=jid,
-                from_me=True,
-                message_type=message_type,
-                content=content,
-                media_url=media_url,
-                wa_message_id=wa_message_id,
-                status="sent",
-                timestamp=msg_ts,
-                metadata={"campaign_id": str(campaign.id), "engine_response": resp, "variables": vars_map},
-            )
-            Campaign.objects.filter(id=campaign.id).update(sent_count=F("sent_count") + 1)
-            sent += 1
-        except EngineClientError as e:
-            Message.objects.create(
-                instance=campaign.instance,
-                remote_jid=jid,
-                from_me=True,
-                message_type=message_type,
-                content=content,
-                media_url=media_url,
-                wa_message_id=None,
-                status="failed",
-                timestamp=msg_ts,
-                metadata={"campaign_id": str(campaign.id), "error": str(e), "variables": vars_map},
-            )
-            Campaign.objects.filter(id=campaign.id).update(failed_count=F("failed_count") + 1)
-            failed += 1
-
-        time.sleep(max(float(campaign.delay_between_messages_ms) / 1000.0, 0.0))
+            run_campaign.apply_async(args=[str(campaign.id)], countdown=1)  # type: ignore[attr-defined]
+        except Exception:
+            logger.info("Celery apply_async not available; campaign will require manual re-run. id=%s", campaign.id)
+        raise
+    sent, failed = result["sent"], result["failed"]
 
     # Decide whether we're done.
-    campaign = Campaign.objects.get(id=campaign.id)
-    attempted_total = int(campaign.sent_count) + int(campaign.failed_count)
-    if attempted_total >= len(recipients):
+    if result["attempted"] >= result["total"]:
         Campaign.objects.filter(id=campaign.id).update(status="completed", completed_at=timezone.now())
+        publish_campaign_status(campaign.id, "completed")
         return {"ok": True, "sent": sent, "failed": failed, "completed": True}
 
-    # Re-queue next batch (if Celery is active). If Celery is not active, the caller can invoke again.
+    if campaign_status(campaign.id) != "running":
+        return {"ok": True, "sent": sent, "failed": failed, "completed": False}
+
+    # Re-queue the rest (if Celery is active). If Celery is not active, the caller can invoke again.
     try:
         run_campaign.apply_async(args=[str(campaign.id)], countdown=1)  # type: ignore[attr-defined]
     except Exception:
@@ -272,46 +191,110 @@ def run_campaign(campaign_id: str) -> Dict[str, Any]:
     return {"ok": True, "sent": sent, "failed": failed, "completed": False}
 
 
+# Instances whose contacts are fetched and upserted concurrently
+SYNC_CONTACTS_WORKERS = 4
+
+
+def _contact_row(c: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": c.get("name") or c.get("push_name") or c.get("pushName") or "",
+        "phone": c.get("phone") or "",
+        "profile_picture": c.get("profile_picture") or c.get("profilePicture"),
+        "is_business": bool(c.get("is_business") or c.get("isBusiness") or False),
+    }
+
+
 @shared_task(time_limit=300, soft_time_limit=240)
 def sync_contacts(instance_id: Optional[str] = None) -> Dict[str, Any]:
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    from django.db import connection
+
+    from .contacts import upsert_contacts
+
     client = EngineClient()
     qs = WhatsAppInstance.objects.all()
     if instance_id:
         qs = qs.filter(id=instance_id)
+    instances = list(
+        qs.exclude(engine_instance_id__isnull=True)
+        .exclude(engine_instance_id="")
+        .values_list("id", "engine_instance_id", named=True)
+    )
 
     synced_instances = 0
     upserted = 0
     errors: List[str] = []
 
-    for instance in qs.exclude(engine_instance_id__isnull=True).exclude(engine_instance_id=""):
+    def _sync_one(inst_id, engine_id):
         try:
-            data = client.get_contacts(instance.engine_instance_id)
+            data = client.get_contacts(engine_id)
             contacts = data.get("contacts") or data.get("data") or data
             if not isinstance(contacts, list):
-                continue
+                return None
 
-            synced_instances += 1
+            rows: Dict[str, Dict[str, Any]] = {}
             for c in contacts:
                 if not isinstance(c, dict):
                     continue
                 jid = c.get("jid") or c.get("id")
-                if not jid:
-                    continue
-                Contact.objects.update_or_create(
-                    instance=instance,
-                    jid=jid,
-                    defaults={
-                        "name": c.get("name") or c.get("push_name") or c.get("pushName") or "",
-                        "phone": c.get("phone") or "",
-                        "profile_picture": c.get("profile_picture") or c.get("profilePicture"),
-                        "is_business": bool(c.get("is_business") or c.get("isBusiness") or False),
-                    },
-                )
-                upserted += 1
+                if jid:
+                    rows[jid] = _contact_row(c)
+            return ("ok", upsert_contacts(inst_id, rows))
         except EngineClientError as e:
-            errors.append(f"{instance.id}: {e}")
+            return ("error", f"{inst_id}: {e}")
+        finally:
+            # Worker threads get their own DB connection; don't leak it
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=SYNC_CONTACTS_WORKERS) as executor:
+        futures = [executor.submit(_sync_one, inst.id, inst.engine_instance_id) for inst in instances]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                continue
+            if result[0] == "error":
+                errors.append(result[1])
+            else:
+                synced_instances += 1
+                upserted += result[1]
 
     return {"synced_instances": synced_instances, "contacts_upserted": upserted, "errors": errors}
 
 
+@shared_task(time_limit=3600, soft_time_limit=3300)
+def reconcile_inbox_counters(instance_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Rebuild the per-instance inbox counters from Message and Conversation.
+
+    The counters are maintained incrementally on ingest; this nightly pass
+    corrects any drift (deleted messages, missed status transitions).
+    """
+    from .conversations import reconcile_instance_counters
+
+    qs = WhatsAppInstance.objects.all()
+    if instance_id:
+        qs = qs.filter(id=instance_id)
+
+    reconciled = 0
+    for inst_id in qs.values_list("id", flat=True):
+        reconcile_instance_counters(inst_id)
+        reconciled += 1
+
+    return {"reconciled": reconciled}
+
+
+@shared_task(time_limit=120, soft_time_limit=90)
+def flush_ingest_queue() -> Dict[str, Any]:
+    """
+    Commit queued engine message webhooks in batches (see ingest.py).
+
+    Armed by the first webhook of each window; the beat entry is only a
+    safety net for a lost trigger.
+    """
+    from .ingest import INGEST_WINDOW_S, flush_queue
 
+    result = flush_queue()
+    if result["pending"]:
+        flush_ingest_queue.apply_async(countdown=INGEST_WINDOW_S)  # type: ignore[attr-defined]
+    return result
@@ -0,0 +1,4 @@
+"""
+ChatCube tests module.
+"""
+# Tests are defined individually in test_*.py files
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from chatcube.contacts import upsert_contacts
+from chatcube.models import Contact, Conversation, Message, WhatsAppInstance
+
+
+User = get_user_model()
+
+JID = '5511999990000@s.whatsapp.net'
+
+
+class UpsertContactsTestCase(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='testpass123')
+        self.instance = WhatsAppInstance.objects.create(owner=owner, name='Main')
+        self.contact = Contact.objects.create(instance=self.instance, jid=JID, name='Old name')
+        # Creates the conversation, linked to the contact
+        Message.objects.create(instance=self.instance, remote_jid=JID, content='hi', status='delivered')
+
+    def test_new_contact_is_created(self):
+        written = upsert_contacts(self.instance.id, {'5511888880000@s.whatsapp.net': {'name': 'New'}})
+        self.assertEqual(written, 1)
+        self.assertEqual(Contact.objects.filter(instance=self.instance).count(), 2)
+
+    def test_unchanged_contact_is_skipped(self):
+        self.assertEqual(upsert_contacts(self.instance.id, {JID: {'name': 'Old name'}}), 0)
+
+    def test_rename_keeps_conversation_on_existing_contact(self):
+        upsert_contacts(self.instance.id, {JID: {'name': 'New name'}})
+
+        conversation = Conversation.objects.get(instance=self.instance)
+        self.assertEqual(conversation.contact_id, self.contact.id)
+        self.assertEqual(conversation.contact_name, 'New name')
+        self.assertEqual(Contact.objects.get(id=self.contact.id).name, 'New name')
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from chatcube.conversations import reconcile_instance_counters
+from chatcube.models import Message, WhatsAppInstance
+
+
+User = get_user_model()
+
+
+class ConversationCounterTestCase(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='testpass123')
+        self.instance = WhatsAppInstance.objects.create(owner=owner, name='Main')
+
+    def message(self, remote_jid):
+        Message.objects.create(instance=self.instance, remote_jid=remote_jid, content='hi')
+
+    def conversation_count(self):
+        return WhatsAppInstance.objects.get(id=self.instance.id).conversation_count
+
+    def test_counts_every_distinct_chat(self):
+        self.message('5511999990000@s.whatsapp.net')
+        self.message('5511999990000')
+        self.message('120363000000000000@g.us')
+        self.message('120363000000000000@g.us')
+        self.message('status@broadcast')
+        self.assertEqual(self.conversation_count(), 3)
+
+        reconcile_instance_counters(self.instance.id)
+        self.assertEqual(self.conversation_count(), 3)
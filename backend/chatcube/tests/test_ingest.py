@@ -0,0 +1,57 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase
+
+from chatcube import ingest
+from chatcube.models import Contact, Conversation, Message, WhatsAppInstance
+
+
+User = get_user_model()
+
+JID = '5511999990000@s.whatsapp.net'
+
+
+def webhook(instance, message_id, name, content):
+    return json.dumps({
+        'instance_id': str(instance.id),
+        'event': 'message_received',
+        'payload': {'data': {
+            'messageId': message_id,
+            'from': JID,
+            'fromName': name,
+            'type': 'text',
+            'content': content,
+        }},
+    }).encode()
+
+
+# Transactional so deferred FK checks run when the batch commits
+class BatchedIngestTestCase(TransactionTestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='testpass123')
+        self.instance = WhatsAppInstance.objects.create(owner=owner, name='Main')
+        self.contact = Contact.objects.create(instance=self.instance, jid=JID, name='Old name')
+        Message.objects.create(instance=self.instance, remote_jid=JID, content='hi', status='delivered')
+
+    def test_renamed_contact_commits_in_one_batch(self):
+        items = [
+            webhook(self.instance, 'm1', 'New name', 'first'),
+            webhook(self.instance, 'm2', 'New name', 'second'),
+        ]
+        with mock.patch.object(ingest, '_process_one') as process_one, \
+                mock.patch.object(ingest, '_dead_letter') as dead_letter:
+            processed = ingest._process_batch(items)
+
+        self.assertEqual(processed, 2)
+        process_one.assert_not_called()
+        dead_letter.assert_not_called()
+        self.assertEqual(
+            set(Message.objects.filter(wa_message_id__in=['m1', 'm2']).values_list('content', flat=True)),
+            {'first', 'second'},
+        )
+        conversation = Conversation.objects.get(instance=self.instance)
+        self.assertEqual(conversation.contact_id, self.contact.id)
+        self.assertEqual(conversation.contact_name, 'New name')
+        self.assertEqual(conversation.message_count, 3)
@@ -16,6 +16,7 @@ from rest_framework.response import Response
 
 from django.contrib.auth import get_user_model
 
+from .campaigns import publish_campaign_status
 from .engine_client import EngineClient, EngineClientError
 from .models import Campaign, Contact, Group, GroupNote, GroupTask, Message, MessageTemplate, WhatsAppInstance
 from .serializers import (
@@ -28,7 +29,7 @@ from .serializers import (
     MessageTemplateSerializer,
     WhatsAppInstanceSerializer,
 )
-from .webhooks import process_engine_webhook
+from .webhooks import accept_engine_webhook
 
 
 def _today_range():
@@ -405,6 +406,7 @@ class InstanceViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Campaign scheduled.", "scheduled_at": campaign.scheduled_at})
 
         Campaign.objects.filter(id=campaign.id).update(status="running", started_at=campaign.started_at or now)
+        publish_campaign_status(campaign.id, "running")
         try:
             from .tasks import run_campaign
 
@@ -417,12 +419,14 @@ class InstanceViewSet(viewsets.ModelViewSet):
     def pause(self, request, pk=None):
         campaign = self.get_object()
         Campaign.objects.filter(id=campaign.id).update(status="paused")
+        publish_campaign_status(campaign.id, "paused")
         return Response({"detail": "Campaign paused."})
 
     @action(detail=True, methods=["post"], url_path="resume")
     def resume(self, request, pk=None):
         campaign = self.get_object()
         Campaign.objects.filter(id=campaign.id).update(status="running")
+        publish_campaign_status(campaign.id, "running")
         try:
             from .tasks import run_campaign
 
@@ -580,6 +584,7 @@ class CampaignViewSet(viewsets.ModelViewSet):
             Campaign.objects.filter(id=campaign.id).update(status="scheduled")
             return Response({"detail": "Campaign scheduled.", "scheduled_at": campaign.scheduled_at})
         Campaign.objects.filter(id=campaign.id).update(status="running", started_at=campaign.started_at or now)
+        publish_campaign_status(campaign.id, "running")
         try:
             from .tasks import run_campaign
             run_campaign.delay(str(campaign.id))
@@ -591,12 +596,14 @@ class CampaignViewSet(viewsets.ModelViewSet):
     def pause(self, request, pk=None):
         campaign = self.get_object()
         Campaign.objects.filter(id=campaign.id).update(status="paused")
+        publish_campaign_status(campaign.id, "paused")
         return Response({"detail": "Campaign paused."})
 
     @action(detail=True, methods=["post"], url_path="resume")
     def resume(self, request, pk=None):
         campaign = self.get_object()
         Campaign.objects.filter(id=campaign.id).update(status="running")
+        publish_campaign_status(campaign.id, "running")
         try:
             from .tasks import run_campaign
             run_campaign.delay(str(campaign.id))
@@ -778,7 +785,7 @@ def engine_webhook(request):
         return Response({"ok": False, "detail": "Expected JSON object."}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        result = process_engine_webhook(request.data)
+        result = accept_engine_webhook(request.data)
         http_status = status.HTTP_200_OK if result.get("ok") else status.HTTP_400_BAD_REQUEST
         return Response(result, status=http_status)
     except WhatsAppInstance.DoesNotExist as e:
@@ -7,6 +7,8 @@ from django.db.models import F
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
+from .contacts import upsert_contacts
+from .conversations import UNREAD_STATUSES, mark_read, record_messages
 from .models import Contact, Group, Message, WhatsAppInstance
 
 logger = logging.getLogger(__name__)
@@ -107,79 +109,71 @@ def _upsert_contact_or_group(instance: WhatsAppInstance, remote_jid: str, *, nam
     )
 
 
-def process_engine_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Process webhook events emitted by chatcube-engine.
-
-    Supported events:
-      - message_received
-      - message_status_update
-      - instance_status_change
-      - qr_code_update
-    """
-
-    event = _get_event(payload)
-    instance = _resolve_instance(payload)
-
-    if event == "message_received":
-        # Baileys engine sends: {event, instanceId, timestamp, data: {messageId, from, fromName, to, type, content, isGroup, groupId, timestamp}}
-        message_data = payload.get("data") or payload.get("message") or payload
-
-        # remote_jid: group JID for groups, sender JID for 1:1
-        is_group = bool(message_data.get("isGroup") or message_data.get("is_group"))
-        if is_group:
-            remote_jid = (
-                message_data.get("groupId")
-                or message_data.get("group_id")
-                or message_data.get("remote_jid")
-                or message_data.get("remoteJid")
-            )
-        else:
-            remote_jid = (
-                message_data.get("remote_jid")
-                or message_data.get("remoteJid")
-                or message_data.get("from")
-                or message_data.get("jid")
-            )
+def _parse_message_received(instance: WhatsAppInstance, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Message fields of a message_received payload, or None without a remote_jid."""
+    # Baileys engine sends: {event, instanceId, timestamp, data: {messageId, from, fromName, to, type, content, isGroup, groupId, timestamp}}
+    message_data = payload.get("data") or payload.get("message") or payload
 
-        if not remote_jid:
-            return {"ok": False, "detail": "Missing remote_jid."}
-
-        message_type = (
-            message_data.get("message_type")
-            or message_data.get("messageType")
-            or message_data.get("type")
-            or "text"
+    # remote_jid: group JID for groups, sender JID for 1:1
+    is_group = bool(message_data.get("isGroup") or message_data.get("is_group"))
+    if is_group:
+        remote_jid = (
+            message_data.get("groupId")
+            or message_data.get("group_id")
+            or message_data.get("remote_jid")
+            or message_data.get("remoteJid")
         )
-        content = message_data.get("content") or message_data.get("text") or ""
-        media_url = message_data.get("media_url") or message_data.get("mediaUrl") or None
-        wa_message_id = (
-            message_data.get("wa_message_id")
-            or message_data.get("waMessageId")
-            or message_data.get("messageId")
-            or message_data.get("id")
+    else:
+        remote_jid = (
+            message_data.get("remote_jid")
+            or message_data.get("remoteJid")
+            or message_data.get("from")
+            or message_data.get("jid")
         )
 
-        # from_me: engine doesn't send fromMe; infer from instance phone number
-        from_me = bool(message_data.get("from_me") or message_data.get("fromMe") or False)
-        if not from_me and instance.phone_number:
-            sender = message_data.get("from") or ""
-            from_me = bool(sender and instance.phone_number and sender.startswith(instance.phone_number))
-
-        status = message_data.get("status") or ("sent" if from_me else "delivered")
-        timestamp = _parse_timestamp(message_data.get("timestamp") or message_data.get("ts"))
-
-        # Sender name: Baileys sends "fromName"
-        sender_name = (
-            message_data.get("fromName")
-            or message_data.get("from_name")
-            or message_data.get("name")
-            or message_data.get("push_name")
-            or message_data.get("pushName")
-            or ""
-        )
+    if not remote_jid:
+        return None
+
+    message_type = (
+        message_data.get("message_type")
+        or message_data.get("messageType")
+        or message_data.get("type")
+        or "text"
+    )
+    content = message_data.get("content") or message_data.get("text") or ""
+    media_url = message_data.get("media_url") or message_data.get("mediaUrl") or None
+    wa_message_id = (
+        message_data.get("wa_message_id")
+        or message_data.get("waMessageId")
+        or message_data.get("messageId")
+        or message_data.get("id")
+    )
 
-        defaults = {
+    # from_me: engine doesn't send fromMe; infer from instance phone number
+    from_me = bool(message_data.get("from_me") or message_data.get("fromMe") or False)
+    if not from_me and instance.phone_number:
+        sender = message_data.get("from") or ""
+        from_me = bool(sender and instance.phone_number and sender.startswith(instance.phone_number))
+
+    status = message_data.get("status") or ("sent" if from_me else "delivered")
+    timestamp = _parse_timestamp(message_data.get("timestamp") or message_data.get("ts"))
+
+    # Sender name: Baileys sends "fromName"
+    sender_name = (
+        message_data.get("fromName")
+        or message_data.get("from_name")
+        or message_data.get("name")
+        or message_data.get("push_name")
+        or message_data.get("pushName")
+        or ""
+    )
+
+    return {
+        "wa_message_id": wa_message_id,
+        "is_group": is_group,
+        "sender_jid": message_data.get("from") or "",
+        "sender_name": sender_name,
+        "defaults": {
             "remote_jid": remote_jid,
             "from_me": from_me,
             "message_type": message_type,
@@ -188,53 +182,122 @@ def process_engine_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
             "status": status,
             "timestamp": timestamp,
             "metadata": message_data,
-        }
+        },
+    }
 
-        with transaction.atomic():
-            if wa_message_id:
-                msg, created = Message.objects.update_or_create(
-                    instance=instance,
-                    wa_message_id=wa_message_id,
-                    defaults=defaults,
-                )
-            else:
-                msg = Message.objects.create(instance=instance, wa_message_id=None, **defaults)
-                created = True
-
-        # Upsert conversation contact/group
-        _upsert_contact_or_group(instance, remote_jid, name=sender_name, phone="")
-
-        # For group messages, also upsert individual sender as contact
-        if is_group:
-            sender_jid = message_data.get("from") or ""
-            if sender_jid and not sender_jid.endswith("@g.us"):
-                _upsert_contact_or_group(instance, sender_jid, name=sender_name, phone="")
 
-        if not remote_jid.endswith("@g.us"):
-            Contact.objects.filter(instance=instance, jid=remote_jid).update(last_message_at=timestamp)
+def _handle_message_received(instance: WhatsAppInstance, event: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    parsed = _parse_message_received(instance, payload)
+    if parsed is None:
+        return {"ok": False, "detail": "Missing remote_jid."}
 
-        if from_me and timestamp.date() == timezone.localdate():
-            WhatsAppInstance.objects.filter(id=instance.id).update(messages_sent_today=F("messages_sent_today") + 1)
+    defaults = parsed["defaults"]
+    wa_message_id = parsed["wa_message_id"]
+    remote_jid = defaults["remote_jid"]
+    timestamp = defaults["timestamp"]
+    sender_name = parsed["sender_name"]
 
-        return {"ok": True, "event": event, "message_id": str(msg.id), "created": created}
+    with transaction.atomic():
+        if wa_message_id:
+            msg, created = Message.objects.update_or_create(
+                instance=instance,
+                wa_message_id=wa_message_id,
+                defaults=defaults,
+            )
+        else:
+            msg = Message.objects.create(instance=instance, wa_message_id=None, **defaults)
+            created = True
 
-    if event == "message_status_update":
-        message_data = payload.get("data") or payload.get("message") or payload
-        wa_message_id = (
-            message_data.get("wa_message_id")
-            or message_data.get("waMessageId")
-            or message_data.get("messageId")
-            or message_data.get("id")
-        )
-        status = message_data.get("status")
-        if not wa_message_id or not status:
-            return {"ok": False, "detail": "Missing wa_message_id or status."}
+    # Upsert conversation contact/group
+    _upsert_contact_or_group(instance, remote_jid, name=sender_name, phone="")
+
+    # For group messages, also upsert individual sender as contact
+    if parsed["is_group"]:
+        sender_jid = parsed["sender_jid"]
+        if sender_jid and not sender_jid.endswith("@g.us"):
+            _upsert_contact_or_group(instance, sender_jid, name=sender_name, phone="")
+
+    if not remote_jid.endswith("@g.us"):
+        Contact.objects.filter(instance=instance, jid=remote_jid).update(last_message_at=timestamp)
 
-        updated = Message.objects.filter(instance=instance, wa_message_id=wa_message_id).update(
-            status=status,
-            metadata=message_data,
+    if defaults["from_me"] and timestamp.date() == timezone.localdate():
+        WhatsAppInstance.objects.filter(id=instance.id).update(messages_sent_today=F("messages_sent_today") + 1)
+
+    return {"ok": True, "event": event, "message_id": str(msg.id), "created": created}
+
+
+def _handle_status_update(instance: WhatsAppInstance, event: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    message_data = payload.get("data") or payload.get("message") or payload
+    wa_message_id = (
+        message_data.get("wa_message_id")
+        or message_data.get("waMessageId")
+        or message_data.get("messageId")
+        or message_data.get("id")
+    )
+    status = message_data.get("status")
+    if not wa_message_id or not status:
+        return {"ok": False, "detail": "Missing wa_message_id or status."}
+
+    messages = Message.objects.filter(instance=instance, wa_message_id=wa_message_id)
+    newly_read = []
+    if status == "read":
+        newly_read = list(
+            messages.filter(from_me=False, status__in=UNREAD_STATUSES).values_list("remote_jid", flat=True)
         )
-        return {"ok": True, "event": event, "updated": int(updated)}
+    updated = messages.update(
+        status=status,
+        metadata=message_data,
+    )
+    if newly_read:
+        mark_read(instance.id, newly_read)
+    return {"ok": True, "event": event, "updated": int(updated)}
+
+
+def accept_engine_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Entry point for the engine webhook view.
+
+    Message and status events are validated and queued for the batched
+    ingest (see ingest.py); everything else is processed right away.
+    """
+    from .ingest import BATCHED_EVENTS, batching_enabled, enqueue_webhook
+
+    event = _get_event(payload)
+    if event not in BATCHED_EVENTS or not batching_enabled():
+        return process_engine_webhook(payload)
+
+    # Resolve now so an unknown instance still gets a 404 (and an engine retry)
+    instance = _resolve_instance(payload)
+    if event == "message_received" and _parse_message_received(instance, payload) is None:
+        return {"ok": False, "detail": "Missing remote_jid."}
+
+    try:
+        enqueue_webhook(instance, event, payload)
+    except Exception:
+        logger.exception("Ingest queue unavailable; processing %s inline", event)
+        return process_engine_webhook(payload)
+    return {"ok": True, "event": event, "queued": True}
+
+
+def process_engine_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Process webhook events emitted by chatcube-engine.
+
+    Supported events:
+      - message_received
+      - message_status_update
+      - instance_status_change
+      - qr_code_update
+    """
+
+    event = _get_event(payload)
+    instance = _resolve_instance(payload)
+
+    if event == "message_received":
+        return _handle_message_received(instance, event, payload)
+
+    if event == "message_status_update":
+        return _handle_status_update(instance, event, payload)
 
     if event == "instance_status_change":
         new_status = payload.get("status") or (payload.get("data") or {}).get("status")
@@ -329,11 +392,10 @@ def process_engine_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
             imported = len(created_msgs)
 
         # Bulk upsert contacts
-        for jid, data in contacts_to_upsert.items():
-            Contact.objects.update_or_create(
-                instance=instance, jid=jid,
-                defaults=data,
-            )
+        upsert_contacts(instance.id, contacts_to_upsert)
+
+        # bulk_create skips post_save, so fold the batch into the inbox here
+        record_messages(instance.id, created_msgs)
 
         sync_type = data.get("syncType", "")
         logger.info("history_sync: imported=%d sync_type=%s instance=%s", imported, sync_type, instance.id)
@@ -0,0 +1,32 @@
+"""
+Keyset pagination cursors shared by list views.
+
+A cursor is the url-safe base64 of the last row's ``(timestamp, uuid)``
+sort key; the next page filters past it instead of using OFFSET.
+"""
+import base64
+import binascii
+import uuid
+from datetime import datetime
+from typing import Tuple
+
+from django.core.exceptions import ValidationError
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(timestamp: datetime, pk: uuid.UUID) -> str:
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Inverse of encode_cursor(); raises ValidationError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        ts, pk = raw.split("|", 1)
+        timestamp = parse_datetime(ts)
+        if timestamp is None:
+            raise ValueError(ts)
+        return timestamp, uuid.UUID(pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValidationError("Invalid cursor.")
@@ -11,22 +11,29 @@ Clients for sending emails via different providers:
 Created: 2026-02-02
 """
 import asyncio
+import json
 import logging
 import hashlib
 import hmac
 import base64
 import re
+import time
 from abc import ABC, abstractmethod
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-from typing import Optional, Dict, Any, List, Tuple
-from dataclasses import dataclass, field
-from datetime import datetime
+from typing import Optional, Callable, Dict, Any, List, Tuple
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from functools import lru_cache
 
 import aiohttp
 import aiosmtplib
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 
 
 logger = logging.getLogger(__name__)
@@ -50,6 +57,10 @@ class EmailMessage:
     tags: List[str] = field(default_factory=list)
     metadata: Dict[str, Any] = field(default_factory=dict)
     tracking_id: str = ""
+    # Set when the content was rendered from a template, so a provider can
+    # send the template once with each recipient's values
+    template: Optional["MessageTemplate"] = None
+    variables: Dict[str, str] = field(default_factory=dict)
 
     @property
     def to_formatted(self) -> str:
@@ -77,6 +88,101 @@ class SendResult:
     timestamp: datetime = field(default_factory=datetime.now)
 
 
+TEMPLATE_CACHE_PREFIX = "email_sequences:template:"
+TEMPLATE_CACHE_TIMEOUT = 2 * 86400  # Outlives the sends queued from a stored template
+
+
+@dataclass(frozen=True)
+class MessageTemplate:
+    """Unrendered subject and bodies that messages were rendered from."""
+    subject: str = ""
+    html_content: str = ""
+    text_content: str = ""
+
+    @property
+    def parts(self) -> Tuple[str, str, str]:
+        return (self.subject, self.html_content, self.text_content)
+
+    @property
+    def variables(self) -> List[str]:
+        names: List[str] = []
+        for part in self.parts:
+            names.extend(TemplateRenderer.compile(part).variables)
+        return list(dict.fromkeys(names))
+
+    def values(self, variables: Dict[str, Any]) -> Dict[str, str]:
+        """The template's variables in *variables*, as the text render() would insert."""
+        return {
+            name: "" if variables[name] is None else str(variables[name])
+            for name in self.variables
+            if name in variables
+        }
+
+    def render(self, variables: Dict[str, Any]) -> Tuple[str, str, str]:
+        """Rendered (subject, html, text)."""
+        return tuple(TemplateRenderer.compile(part).render(variables) for part in self.parts)
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(json.dumps(self.parts).encode()).hexdigest()
+
+    def store(self) -> str:
+        """Share the template with the send workers; returns its key."""
+        key = self.key
+        cache.set(TEMPLATE_CACHE_PREFIX + key, list(self.parts), TEMPLATE_CACHE_TIMEOUT)
+        return key
+
+    @classmethod
+    def load_many(cls, keys) -> Dict[str, "MessageTemplate"]:
+        """Stored templates by key; expired ones are missing."""
+        keys = [key for key in keys if key]
+        if not keys:
+            return {}
+        stored = cache.get_many([TEMPLATE_CACHE_PREFIX + key for key in keys])
+        return {
+            name[len(TEMPLATE_CACHE_PREFIX):]: cls(*parts)
+            for name, parts in stored.items()
+        }
+
+
+def _shared_content_groups(
+    messages: List[EmailMessage],
+    max_size: int,
+    can_share: Optional[Callable[[List[EmailMessage]], bool]] = None,
+) -> List[List[int]]:
+    """
+    Indexes of *messages* grouped so that each group can go out as one
+    provider request, at most *max_size* per group: messages that differ
+    only in recipient and tracking id, or that were rendered from the same
+    MessageTemplate.  Groups that *can_share* rejects, and messages with
+    cc, bcc or attachments, are sent on their own.
+    """
+    groups: Dict[Any, List[int]] = {}
+    for i, message in enumerate(messages):
+        if message.cc or message.bcc or message.attachments:
+            key = i
+        else:
+            if message.template is not None:
+                content = (message.template,)
+            else:
+                content = (message.subject, message.html_content, message.text_content)
+            key = (
+                message.from_email, message.from_name, message.reply_to, *content,
+                tuple(message.tags), tuple(sorted(message.headers.items())),
+            )
+        groups.setdefault(key, []).append(i)
+
+    result = []
+    for indexes in groups.values():
+        for start in range(0, len(indexes), max_size):
+            group = indexes[start:start + max_size]
+            if len(group) > 1 and can_share and not can_share([messages[i] for i in group]):
+                result.extend([i] for i in group)
+            else:
+                result.append(group)
+    return result
+
+
 class BaseEmailClient(ABC):
     """Abstract base class for email clients."""
 
@@ -114,67 +220,77 @@ class BaseEmailClient(ABC):
 class SMTPClient(BaseEmailClient):
     """SMTP email client for standard SMTP servers."""
 
-    async def send(self, message: EmailMessage) -> SendResult:
-        """Send email via SMTP."""
-        message = self._apply_defaults(message)
-
-        try:
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = message.subject
-            msg["From"] = message.from_formatted
-            msg["To"] = message.to_formatted
-
-            if message.reply_to:
-                msg["Reply-To"] = message.reply_to
-            if message.cc:
-                msg["Cc"] = ", ".join(message.cc)
+    def _build_mime(self, message: EmailMessage) -> MIMEMultipart:
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = message.subject
+        msg["From"] = message.from_formatted
+        msg["To"] = message.to_formatted
+
+        if message.reply_to:
+            msg["Reply-To"] = message.reply_to
+        if message.cc:
+            msg["Cc"] = ", ".join(message.cc)
+
+        for key, value in message.headers.items():
+            msg[key] = value
+
+        if message.tracking_id:
+            msg["X-FlowCube-Tracking-ID"] = message.tracking_id
+
+        if message.text_content:
+            msg.attach(MIMEText(message.text_content, "plain", "utf-8"))
+        if message.html_content:
+            msg.attach(MIMEText(message.html_content, "html", "utf-8"))
+
+        for attachment in message.attachments:
+            part = MIMEBase("application", "octet-stream")
+            part.set_payload(attachment.get("content", b""))
+            encoders.encode_base64(part)
+            part.add_header(
+                "Content-Disposition",
+                f"attachment; filename={attachment.get('filename', 'attachment')}"
+            )
+            msg.attach(part)
+        return msg
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        """Open and authenticate an SMTP connection."""
+        if self.provider.smtp_use_ssl:
+            smtp = aiosmtplib.SMTP(
+                hostname=self.provider.smtp_host,
+                port=self.provider.smtp_port,
+                use_tls=True
+            )
+        else:
+            smtp = aiosmtplib.SMTP(
+                hostname=self.provider.smtp_host,
+                port=self.provider.smtp_port,
+                start_tls=self.provider.smtp_use_tls
+            )
 
-            for key, value in message.headers.items():
-                msg[key] = value
+        await smtp.connect()
 
-            if message.tracking_id:
-                msg["X-FlowCube-Tracking-ID"] = message.tracking_id
+        if self.provider.smtp_username:
+            await smtp.login(
+                self.provider.smtp_username,
+                self.provider.smtp_password
+            )
+        return smtp
 
-            if message.text_content:
-                msg.attach(MIMEText(message.text_content, "plain", "utf-8"))
-            if message.html_content:
-                msg.attach(MIMEText(message.html_content, "html", "utf-8"))
-
-            for attachment in message.attachments:
-                part = MIMEBase("application", "octet-stream")
-                part.set_payload(attachment.get("content", b""))
-                encoders.encode_base64(part)
-                part.add_header(
-                    "Content-Disposition",
-                    f"attachment; filename={attachment.get('filename', 'attachment')}"
-                )
-                msg.attach(part)
+    async def send(self, message: EmailMessage, smtp: Optional[aiosmtplib.SMTP] = None) -> SendResult:
+        """Send email via SMTP, over *smtp* if given (it is left open)."""
+        message = self._apply_defaults(message)
 
+        try:
+            msg = self._build_mime(message)
             all_recipients = [message.to_email] + message.cc + message.bcc
 
-            if self.provider.smtp_use_ssl:
-                smtp = aiosmtplib.SMTP(
-                    hostname=self.provider.smtp_host,
-                    port=self.provider.smtp_port,
-                    use_tls=True
-                )
+            if smtp is None:
+                smtp = await self._connect()
+                response = await smtp.send_message(msg, recipients=all_recipients)
+                await smtp.quit()
             else:
-                smtp = aiosmtplib.SMTP(
-                    hostname=self.provider.smtp_host,
-                    port=self.provider.smtp_port,
-                    start_tls=self.provider.smtp_use_tls
-                )
-
-            await smtp.connect()
-
-            if self.provider.smtp_username:
-                await smtp.login(
-                    self.provider.smtp_username,
-                    self.provider.smtp_password
-                )
-
-            response = await smtp.send_message(msg, recipients=all_recipients)
-            await smtp.quit()
+                response = await smtp.send_message(msg, recipients=all_recipients)
 
             message_id = f"smtp-{message.tracking_id or hashlib.md5(f'{message.to_email}{datetime.now().isoformat()}'.encode()).hexdigest()}"
 
@@ -194,38 +310,30 @@ class SMTPClient(BaseEmailClient):
             return SendResult(success=False, error_message=str(e), error_code="UNKNOWN_ERROR")
 
     async def send_batch(self, messages: List[EmailMessage]) -> List[SendResult]:
-        """Send multiple emails via SMTP."""
+        """Send multiple emails via SMTP over one connection."""
+        try:
+            smtp = await self._connect()
+        except Exception as e:
+            self.logger.error(f"SMTP connection failed for batch of {len(messages)}: {e}")
+            return [SendResult(success=False, error_message=str(e), error_code="SMTP_ERROR") for _ in messages]
+
         results = []
-        for message in messages:
-            result = await self.send(message)
-            results.append(result)
-            await asyncio.sleep(0.1)
+        try:
+            for message in messages:
+                result = await self.send(message, smtp)
+                results.append(result)
+                await asyncio.sleep(0.1)
+        finally:
+            try:
+                await smtp.quit()
+            except Exception:
+                pass
         return results
 
     async def test_connection(self) -> Tuple[bool, str]:
         """Test SMTP connection."""
         try:
-            if self.provider.smtp_use_ssl:
-                smtp = aiosmtplib.SMTP(
-                    hostname=self.provider.smtp_host,
-                    port=self.provider.smtp_port,
-                    use_tls=True
-                )
-            else:
-                smtp = aiosmtplib.SMTP(
-                    hostname=self.provider.smtp_host,
-                    port=self.provider.smtp_port,
-                    start_tls=self.provider.smtp_use_tls
-                )
-
-            await smtp.connect()
-
-            if self.provider.smtp_username:
-                await smtp.login(
-                    self.provider.smtp_username,
-                    self.provider.smtp_password
-                )
-
+            smtp = await self._connect()
             await smtp.quit()
             return True, "SMTP connection successful"
 
@@ -237,101 +345,164 @@ class SendGridClient(BaseEmailClient):
     """SendGrid API v3 email client."""
 
     BASE_URL = "https://api.sendgrid.com/v3"
+    MAX_PERSONALIZATIONS = 1000
+    MAX_SUBSTITUTIONS_BYTES = 10000
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.provider.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _build_payload(self, message: EmailMessage) -> Dict[str, Any]:
+        payload = {
+            "personalizations": [{
+                "to": [{"email": message.to_email, "name": message.to_name}],
+            }],
+            "from": {
+                "email": message.from_email,
+                "name": message.from_name
+            },
+            "subject": message.subject,
+            "content": []
+        }
+
+        if message.cc:
+            payload["personalizations"][0]["cc"] = [{"email": e} for e in message.cc]
+        if message.bcc:
+            payload["personalizations"][0]["bcc"] = [{"email": e} for e in message.bcc]
+
+        if message.reply_to:
+            payload["reply_to"] = {"email": message.reply_to}
+
+        if message.text_content:
+            payload["content"].append({"type": "text/plain", "value": message.text_content})
+        if message.html_content:
+            payload["content"].append({"type": "text/html", "value": message.html_content})
+
+        payload["tracking_settings"] = {
+            "click_tracking": {"enable": True},
+            "open_tracking": {"enable": True}
+        }
+
+        if message.tracking_id:
+            payload["personalizations"][0]["custom_args"] = {"tracking_id": message.tracking_id}
+
+        if message.tags:
+            payload["categories"] = message.tags[:10]
+
+        if message.headers:
+            payload["headers"] = message.headers
+
+        if message.attachments:
+            payload["attachments"] = []
+            for att in message.attachments:
+                payload["attachments"].append({
+                    "content": base64.b64encode(att.get("content", b"")).decode(),
+                    "filename": att.get("filename", "attachment"),
+                    "type": att.get("content_type", "application/octet-stream")
+                })
+        return payload
+
+    async def _post(self, session: aiohttp.ClientSession, payload: Dict[str, Any], to: str) -> SendResult:
+        async with session.post(f"{self.BASE_URL}/mail/send", json=payload, headers=self._headers()) as response:
+            if response.status in (200, 202):
+                message_id = response.headers.get("X-Message-Id", "")
+                self.logger.info(f"Email sent to {to} via SendGrid: {message_id}")
+                return SendResult(success=True, message_id=message_id, provider_response={"status": response.status})
+            else:
+                error_body = await response.text()
+                self.logger.error(f"SendGrid error: {response.status} - {error_body}")
+                return SendResult(success=False, error_message=error_body, error_code=str(response.status))
 
-    async def send(self, message: EmailMessage) -> SendResult:
-        """Send email via SendGrid API."""
+    async def send(self, message: EmailMessage, session: Optional[aiohttp.ClientSession] = None) -> SendResult:
+        """Send email via SendGrid API, over *session* if given."""
         message = self._apply_defaults(message)
 
         try:
-            payload = {
-                "personalizations": [{
-                    "to": [{"email": message.to_email, "name": message.to_name}],
-                }],
-                "from": {
-                    "email": message.from_email,
-                    "name": message.from_name
-                },
-                "subject": message.subject,
-                "content": []
-            }
-
-            if message.cc:
-                payload["personalizations"][0]["cc"] = [{"email": e} for e in message.cc]
-            if message.bcc:
-                payload["personalizations"][0]["bcc"] = [{"email": e} for e in message.bcc]
+            payload = self._build_payload(message)
+            if session is None:
+                async with aiohttp.ClientSession() as session:
+                    return await self._post(session, payload, message.to_email)
+            return await self._post(session, payload, message.to_email)
 
-            if message.reply_to:
-                payload["reply_to"] = {"email": message.reply_to}
-
-            if message.text_content:
-                payload["content"].append({"type": "text/plain", "value": message.text_content})
-            if message.html_content:
-                payload["content"].append({"type": "text/html", "value": message.html_content})
+        except Exception as e:
+            self.logger.error(f"Error sending via SendGrid to {message.to_email}: {e}")
+            return SendResult(success=False, error_message=str(e), error_code="SENDGRID_ERROR")
 
-            payload["tracking_settings"] = {
-                "click_tracking": {"enable": True},
-                "open_tracking": {"enable": True}
-            }
+    @classmethod
+    def _can_share(cls, messages: List[EmailMessage]) -> bool:
+        if messages[0].template is None:
+            return True
+        # SendGrid caps the substitutions of one personalization
+        return all(
+            len(json.dumps(cls._substitutions(message))) < cls.MAX_SUBSTITUTIONS_BYTES
+            for message in messages
+        )
 
+    @staticmethod
+    def _substitutions(message: EmailMessage) -> Dict[str, str]:
+        return {"{{%s}}" % name: value for name, value in message.variables.items()}
+
+    async def _send_personalized(self, session: aiohttp.ClientSession, messages: List[EmailMessage]) -> List[SendResult]:
+        """
+        One request for messages that differ only in recipient (one
+        personalization each).  Messages rendered from a template send it
+        once, with each recipient's values as substitutions.
+        """
+        template = messages[0].template
+        if template is not None:
+            messages[0] = replace(
+                messages[0], html_content=template.html_content, text_content=template.text_content
+            )
+        payload = self._build_payload(messages[0])
+        personalizations = []
+        for message in messages:
+            personalization = {"to": [{"email": message.to_email, "name": message.to_name}]}
+            if template is not None:
+                personalization["subject"] = message.subject
+                personalization["substitutions"] = self._substitutions(message)
             if message.tracking_id:
-                payload["personalizations"][0]["custom_args"] = {"tracking_id": message.tracking_id}
-
-            if message.tags:
-                payload["categories"] = message.tags[:10]
-
-            if message.headers:
-                payload["headers"] = message.headers
-
-            if message.attachments:
-                payload["attachments"] = []
-                for att in message.attachments:
-                    payload["attachments"].append({
-                        "content": base64.b64encode(att.get("content", b"")).decode(),
-                        "filename": att.get("filename", "attachment"),
-                        "type": att.get("content_type", "application/octet-stream")
-                    })
-
-            headers = {
-                "Authorization": f"Bearer {self.provider.api_key}",
-                "Content-Type": "application/json"
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.BASE_URL}/mail/send", json=payload, headers=headers) as response:
-                    if response.status in (200, 202):
-                        message_id = response.headers.get("X-Message-Id", "")
-                        self.logger.info(f"Email sent to {message.to_email} via SendGrid: {message_id}")
-                        return SendResult(success=True, message_id=message_id, provider_response={"status": response.status})
-                    else:
-                        error_body = await response.text()
-                        self.logger.error(f"SendGrid error: {response.status} - {error_body}")
-                        return SendResult(success=False, error_message=error_body, error_code=str(response.status))
+                personalization["custom_args"] = {"tracking_id": message.tracking_id}
+            personalizations.append(personalization)
+        payload["personalizations"] = personalizations
 
+        try:
+            result = await self._post(session, payload, f"{len(messages)} recipients")
         except Exception as e:
-            self.logger.error(f"Error sending via SendGrid to {message.to_email}: {e}")
-            return SendResult(success=False, error_message=str(e), error_code="SENDGRID_ERROR")
+            self.logger.error(f"Error sending batch of {len(messages)} via SendGrid: {e}")
+            result = SendResult(success=False, error_message=str(e), error_code="SENDGRID_ERROR")
+        return [replace(result) for _ in messages]
 
     async def send_batch(self, messages: List[EmailMessage]) -> List[SendResult]:
-        """Send multiple emails via SendGrid."""
+        """
+        Send multiple emails via SendGrid over one HTTP session.  Messages
+        that differ only in recipient, or were rendered from the same
+        template, share a request, one personalization per recipient.
+        """
+        messages = [self._apply_defaults(message) for message in messages]
+        results: List[Optional[SendResult]] = [None] * len(messages)
         semaphore = asyncio.Semaphore(10)
 
-        async def send_with_limit(msg):
-            async with semaphore:
-                return await self.send(msg)
+        async with aiohttp.ClientSession() as session:
+            async def send_group(indexes):
+                async with semaphore:
+                    if len(indexes) == 1:
+                        group_results = [await self.send(messages[indexes[0]], session)]
+                    else:
+                        group_results = await self._send_personalized(session, [messages[i] for i in indexes])
+                for i, result in zip(indexes, group_results):
+                    results[i] = result
 
-        tasks = [send_with_limit(msg) for msg in messages]
-        return await asyncio.gather(*tasks)
+            groups = _shared_content_groups(messages, self.MAX_PERSONALIZATIONS, self._can_share)
+            await asyncio.gather(*(send_group(group) for group in groups))
+        return results
 
     async def test_connection(self) -> Tuple[bool, str]:
         """Test SendGrid API connection."""
         try:
-            headers = {
-                "Authorization": f"Bearer {self.provider.api_key}",
-                "Content-Type": "application/json"
-            }
-
             async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.BASE_URL}/user/profile", headers=headers) as response:
+                async with session.get(f"{self.BASE_URL}/user/profile", headers=self._headers()) as response:
                     if response.status == 200:
                         data = await response.json()
                         return True, f"Connected as {data.get('username', 'unknown')}"
@@ -346,6 +517,9 @@ class SendGridClient(BaseEmailClient):
 class MailgunClient(BaseEmailClient):
     """Mailgun API email client."""
 
+    MAX_BATCH_RECIPIENTS = 1000
+    _RECIPIENT_VARIABLE = re.compile(r"\w+")
+
     def __init__(self, provider):
         super().__init__(provider)
         if provider.api_region and provider.api_region.upper() == "EU":
@@ -358,77 +532,145 @@ class MailgunClient(BaseEmailClient):
 
         self.domain = provider.api_secret
 
-    async def send(self, message: EmailMessage) -> SendResult:
-        """Send email via Mailgun API."""
-        message = self._apply_defaults(message)
-
-        try:
-            data = aiohttp.FormData()
-            data.add_field("from", message.from_formatted)
+    @classmethod
+    def _can_share(cls, messages: List[EmailMessage]) -> bool:
+        # recipient-variables are keyed by address
+        if len({message.to_email.lower() for message in messages}) < len(messages):
+            return False
+        template = messages[0].template
+        if template is None:
+            return True
+        # Every placeholder must become a %recipient.name% with a value for everyone
+        names = template.variables
+        if any(name == "tracking_id" or not cls._RECIPIENT_VARIABLE.fullmatch(name) for name in names):
+            return False
+        return all(name in message.variables for message in messages for name in names)
+
+    def _build_form(self, message: EmailMessage, recipients: Optional[List[EmailMessage]] = None) -> aiohttp.FormData:
+        """
+        Form for *message*; with *recipients*, a batch send to all of them
+        whose tracking id travels in recipient-variables.  A template is
+        sent once, its placeholders turned into %recipient.name% variables.
+        """
+        template = message.template if recipients else None
+        if template is not None:
+            subject, html_content, text_content = template.render(
+                {name: f"%recipient.{name}%" for name in template.variables}
+            )
+            message = replace(message, subject=subject, html_content=html_content, text_content=text_content)
+
+        data = aiohttp.FormData()
+        data.add_field("from", message.from_formatted)
+        if recipients:
+            for recipient in recipients:
+                data.add_field("to", recipient.to_formatted)
+            data.add_field("recipient-variables", json.dumps({
+                recipient.to_email: {
+                    **(recipient.variables if template is not None else {}),
+                    "tracking_id": recipient.tracking_id,
+                }
+                for recipient in recipients
+            }))
+        else:
             data.add_field("to", message.to_formatted)
-            data.add_field("subject", message.subject)
-
-            if message.text_content:
-                data.add_field("text", message.text_content)
-            if message.html_content:
-                data.add_field("html", message.html_content)
-            if message.reply_to:
-                data.add_field("h:Reply-To", message.reply_to)
-
-            for cc in message.cc:
-                data.add_field("cc", cc)
-            for bcc in message.bcc:
-                data.add_field("bcc", bcc)
-
-            data.add_field("o:tracking", "yes")
-            data.add_field("o:tracking-clicks", "yes")
-            data.add_field("o:tracking-opens", "yes")
-
-            if message.tracking_id:
-                data.add_field("v:tracking_id", message.tracking_id)
-
-            for tag in message.tags[:3]:
-                data.add_field("o:tag", tag)
-
-            for key, value in message.headers.items():
-                data.add_field(f"h:{key}", value)
+        data.add_field("subject", message.subject)
+
+        if message.text_content:
+            data.add_field("text", message.text_content)
+        if message.html_content:
+            data.add_field("html", message.html_content)
+        if message.reply_to:
+            data.add_field("h:Reply-To", message.reply_to)
+
+        for cc in message.cc:
+            data.add_field("cc", cc)
+        for bcc in message.bcc:
+            data.add_field("bcc", bcc)
+
+        data.add_field("o:tracking", "yes")
+        data.add_field("o:tracking-clicks", "yes")
+        data.add_field("o:tracking-opens", "yes")
+
+        if recipients:
+            data.add_field("v:tracking_id", "%recipient.tracking_id%")
+        elif message.tracking_id:
+            data.add_field("v:tracking_id", message.tracking_id)
+
+        for tag in message.tags[:3]:
+            data.add_field("o:tag", tag)
+
+        for key, value in message.headers.items():
+            data.add_field(f"h:{key}", value)
+
+        for att in message.attachments:
+            data.add_field(
+                "attachment",
+                att.get("content", b""),
+                filename=att.get("filename", "attachment"),
+                content_type=att.get("content_type", "application/octet-stream")
+            )
+        return data
 
-            for att in message.attachments:
-                data.add_field(
-                    "attachment",
-                    att.get("content", b""),
-                    filename=att.get("filename", "attachment"),
-                    content_type=att.get("content_type", "application/octet-stream")
-                )
+    async def _post(self, session: aiohttp.ClientSession, data: aiohttp.FormData, to: str) -> SendResult:
+        auth = aiohttp.BasicAuth("api", self.provider.api_key)
+        async with session.post(f"{self.base_url}/{self.domain}/messages", data=data, auth=auth) as response:
+            result = await response.json()
 
-            auth = aiohttp.BasicAuth("api", self.provider.api_key)
+            if response.status == 200:
+                message_id = result.get("id", "")
+                self.logger.info(f"Email sent to {to} via Mailgun: {message_id}")
+                return SendResult(success=True, message_id=message_id, provider_response=result)
+            else:
+                self.logger.error(f"Mailgun error: {response.status} - {result}")
+                return SendResult(success=False, error_message=result.get("message", str(result)), error_code=str(response.status))
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.base_url}/{self.domain}/messages", data=data, auth=auth) as response:
-                    result = await response.json()
+    async def send(self, message: EmailMessage, session: Optional[aiohttp.ClientSession] = None) -> SendResult:
+        """Send email via Mailgun API, over *session* if given."""
+        message = self._apply_defaults(message)
 
-                    if response.status == 200:
-                        message_id = result.get("id", "")
-                        self.logger.info(f"Email sent to {message.to_email} via Mailgun: {message_id}")
-                        return SendResult(success=True, message_id=message_id, provider_response=result)
-                    else:
-                        self.logger.error(f"Mailgun error: {response.status} - {result}")
-                        return SendResult(success=False, error_message=result.get("message", str(result)), error_code=str(response.status))
+        try:
+            data = self._build_form(message)
+            if session is None:
+                async with aiohttp.ClientSession() as session:
+                    return await self._post(session, data, message.to_email)
+            return await self._post(session, data, message.to_email)
 
         except Exception as e:
             self.logger.error(f"Error sending via Mailgun to {message.to_email}: {e}")
             return SendResult(success=False, error_message=str(e), error_code="MAILGUN_ERROR")
 
+    async def _send_batch_message(self, session: aiohttp.ClientSession, messages: List[EmailMessage]) -> List[SendResult]:
+        """One batch-sending request for messages that differ only in recipient."""
+        try:
+            result = await self._post(session, self._build_form(messages[0], messages), f"{len(messages)} recipients")
+        except Exception as e:
+            self.logger.error(f"Error sending batch of {len(messages)} via Mailgun: {e}")
+            result = SendResult(success=False, error_message=str(e), error_code="MAILGUN_ERROR")
+        return [replace(result) for _ in messages]
+
     async def send_batch(self, messages: List[EmailMessage]) -> List[SendResult]:
-        """Send multiple emails via Mailgun."""
+        """
+        Send multiple emails via Mailgun over one HTTP session.  Messages
+        that differ only in recipient, or were rendered from the same
+        template, go out as one batch send.
+        """
+        messages = [self._apply_defaults(message) for message in messages]
+        results: List[Optional[SendResult]] = [None] * len(messages)
         semaphore = asyncio.Semaphore(10)
 
-        async def send_with_limit(msg):
-            async with semaphore:
-                return await self.send(msg)
+        async with aiohttp.ClientSession() as session:
+            async def send_group(indexes):
+                async with semaphore:
+                    if len(indexes) == 1:
+                        group_results = [await self.send(messages[indexes[0]], session)]
+                    else:
+                        group_results = await self._send_batch_message(session, [messages[i] for i in indexes])
+                for i, result in zip(indexes, group_results):
+                    results[i] = result
 
-        tasks = [send_with_limit(msg) for msg in messages]
-        return await asyncio.gather(*tasks)
+            groups = _shared_content_groups(messages, self.MAX_BATCH_RECIPIENTS, self._can_share)
+            await asyncio.gather(*(send_group(group) for group in groups))
+        return results
 
     async def test_connection(self) -> Tuple[bool, str]:
         """Test Mailgun API connection."""
@@ -454,12 +696,11 @@ class SESClient(BaseEmailClient):
     def __init__(self, provider):
         super().__init__(provider)
         self.region = provider.api_region or "us-east-1"
+        self._ses_client = None
 
-    async def send(self, message: EmailMessage) -> SendResult:
-        """Send email via Amazon SES."""
-        message = self._apply_defaults(message)
-
-        try:
+    def _client(self):
+        """boto3 SES client, created once and shared by every send of this client."""
+        if self._ses_client is None:
             import boto3
             from botocore.config import Config
 
@@ -471,12 +712,20 @@ class SESClient(BaseEmailClient):
                 access_key = self.provider.api_key
                 secret_key = self.provider.api_secret
 
-            ses_client = boto3.client(
+            self._ses_client = boto3.client(
                 "ses",
                 aws_access_key_id=access_key,
                 aws_secret_access_key=secret_key,
                 config=config
             )
+        return self._ses_client
+
+    async def send(self, message: EmailMessage) -> SendResult:
+        """Send email via Amazon SES."""
+        message = self._apply_defaults(message)
+
+        try:
+            ses_client = self._client()
 
             email_message = {
                 "Subject": {"Data": message.subject, "Charset": "UTF-8"},
@@ -601,17 +850,78 @@ class EmailClientFactory:
         return list(cls._clients.keys())
 
 
+TEMPLATE_CACHE_SIZE = 256  # Compiled templates kept per process
+
+_PLACEHOLDER = re.compile(r"\{\{([^{}]+)\}\}")
+
+
+class CompiledTemplate:
+    """
+    A template split once into literal text and ``{{variable}}`` slots, so
+    rendering is a single join instead of one full-string replace per
+    variable.  Placeholders without a value are left as written.
+    """
+
+    __slots__ = ("_literals", "_names", "_placeholders")
+
+    def __init__(self, template: str):
+        literals: List[str] = []
+        names: List[str] = []
+        placeholders: List[str] = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(template):
+            literals.append(template[position:match.start()])
+            names.append(match.group(1))
+            placeholders.append(match.group(0))
+            position = match.end()
+        literals.append(template[position:])
+        self._literals = tuple(literals)
+        self._names = tuple(names)
+        self._placeholders = tuple(placeholders)
+
+    @property
+    def variables(self) -> List[str]:
+        return list(dict.fromkeys(self._names))
+
+    def render(self, variables: Dict[str, Any]) -> str:
+        literals = self._literals
+        if not self._names:
+            return literals[0]
+        parts = [literals[0]]
+        for name, placeholder, literal in zip(self._names, self._placeholders, literals[1:]):
+            if name in variables:
+                value = variables[name]
+                parts.append(str(value) if value is not None else "")
+            else:
+                parts.append(placeholder)
+            parts.append(literal)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _compile(template: str) -> CompiledTemplate:
+    # Keyed by the template text itself: edited templates compile afresh
+    return CompiledTemplate(template)
+
+
 class TemplateRenderer:
     """Render email templates with variable substitution."""
 
+    @staticmethod
+    def compile(template: str) -> CompiledTemplate:
+        """Compiled form of *template*, shared through a per-process LRU cache."""
+        return _compile(template or "")
+
     @staticmethod
     def render(template: str, variables: Dict[str, Any]) -> str:
         """Render a template string with variable substitution."""
-        result = template
-        for key, value in variables.items():
-            placeholder = "{{" + key + "}}"
-            result = result.replace(placeholder, str(value) if value is not None else "")
-        return result
+        return TemplateRenderer.compile(template).render(variables)
+
+    @staticmethod
+    def render_many(template: str, variables_list: List[Dict[str, Any]]) -> List[str]:
+        """Render *template* once per variables dict."""
+        compiled = TemplateRenderer.compile(template)
+        return [compiled.render(variables) for variables in variables_list]
 
     @staticmethod
     def render_message(message: EmailMessage, variables: Dict[str, Any]) -> EmailMessage:
@@ -681,40 +991,160 @@ class WebhookSignatureVerifier:
             return False
 
 
-class RateLimiter:
-    """Simple rate limiter for email sending."""
+RATE_LIMIT_PREFIX = "email_sequences:rate"
+RATE_LIMIT_MAX_WAIT = 30  # Seconds acquire() blocks for per-second capacity
+RATE_LIMIT_RETRY_DELAY = 60  # Seconds before a send that got no capacity is tried again
+
+# Sustained sends per second by provider type; hourly and daily quotas are
+# configured on the EmailProvider
+PER_SECOND_LIMITS = {
+    "smtp": 10,
+    "sendgrid": 100,
+    "mailgun": 50,
+    "ses": 14,
+}
+
+# KEYS: bucket, hour counter, day counter
+# ARGV: n, per second, per hour, per day, hour ttl, day ttl
+# Returns {granted, wait_ms}: up to n sends within the hourly and daily
+# quotas, or the time until the per-second bucket can cover them.
+_ACQUIRE_LUA = """
+local rate = tonumber(ARGV[2])
+local quota = math.min(
+    tonumber(ARGV[3]) - tonumber(redis.call('GET', KEYS[2]) or '0'),
+    tonumber(ARGV[4]) - tonumber(redis.call('GET', KEYS[3]) or '0'))
+if quota <= 0 then
+    return {0, 0}
+end
+local n = math.min(tonumber(ARGV[1]), quota)
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or rate
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(rate, tokens + math.max(0, now - ts) * rate / 1000)
+
+-- A batch larger than the bucket waits for a full bucket and leaves a debt
+local need = math.min(n, rate)
+if tokens < need then
+    return {0, math.ceil((need - tokens) * 1000 / rate)}
+end
+tokens = tokens - n
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((rate - tokens) * 1000 / rate) + 1000)
+redis.call('INCRBY', KEYS[2], n)
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('INCRBY', KEYS[3], n)
+redis.call('EXPIRE', KEYS[3], ARGV[6])
+return {n, 0}
+"""
 
-    def __init__(self, max_per_second: int = 10, max_per_hour: int = 500):
-        self.max_per_second = max_per_second
-        self.max_per_hour = max_per_hour
-        self._second_counts: Dict[int, int] = {}
-        self._hour_counts: Dict[int, int] = {}
 
-    async def acquire(self) -> bool:
-        """Acquire permission to send an email."""
-        import time
+# KEYS: hour counter, day counter  ARGV: n
+# Gives back quota taken for sends that then failed
+_RELEASE_LUA = """
+for _, key in ipairs(KEYS) do
+    local used = tonumber(redis.call('GET', key) or '0')
+    if used > 0 then
+        redis.call('DECRBY', key, math.min(used, tonumber(ARGV[1])))
+    end
+end
+return 0
+"""
 
-        now = int(time.time())
-        current_hour = now // 3600
 
-        second_count = self._second_counts.get(now, 0)
-        if second_count >= self.max_per_second:
-            await asyncio.sleep(1)
-            now = int(time.time())
-            second_count = 0
+@lru_cache(maxsize=1)
+def _get_redis():
+    redis_url = getattr(settings, "CELERY_BROKER_URL", "redis://flowcube-redis:6379/3")
+    return redis.from_url(redis_url)
 
-        hour_count = self._hour_counts.get(current_hour, 0)
-        if hour_count >= self.max_per_hour:
-            return False
 
-        self._second_counts[now] = second_count + 1
-        self._hour_counts[current_hour] = hour_count + 1
+@lru_cache(maxsize=1)
+def _scripts():
+    r = _get_redis()
+    return r.register_script(_ACQUIRE_LUA), r.register_script(_RELEASE_LUA)
+
+
+class RateLimiter:
+    """
+    Send quotas of one provider, shared by all workers through Redis.
+
+    A token bucket holds the per-second rate; hourly and daily counts are
+    per clock hour and local day.  Each acquire is one Lua script call, so
+    concurrent workers cannot overshoot any of the limits.
+    """
 
-        self._cleanup(now, current_hour)
+    def __init__(self, key: str, max_per_second: int = 10, max_per_hour: int = 500, max_per_day: int = 10000):
+        self.key = key
+        self.max_per_second = max(1, max_per_second)
+        self.max_per_hour = max_per_hour
+        self.max_per_day = max_per_day
 
-        return True
+    @classmethod
+    def for_provider(cls, provider) -> "RateLimiter":
+        return cls(
+            str(provider.id),
+            max_per_second=PER_SECOND_LIMITS.get(provider.provider_type, 10),
+            max_per_hour=provider.rate_limit_per_hour,
+            max_per_day=provider.rate_limit_per_day,
+        )
 
-    def _cleanup(self, current_second: int, current_hour: int):
-        """Remove old count entries."""
-        self._second_counts = {k: v for k, v in self._second_counts.items() if k >= current_second - 60}
-        self._hour_counts = {k: v for k, v in self._hour_counts.items() if k >= current_hour - 24}
+    def _keys(self) -> List[str]:
+        prefix = f"{RATE_LIMIT_PREFIX}:{self.key}"
+        return [
+            f"{prefix}:bucket",
+            f"{prefix}:hour:{int(time.time()) // 3600}",
+            f"{prefix}:day:{timezone.localdate().isoformat()}",
+        ]
+
+    def try_acquire(self, n: int = 1) -> Tuple[int, float]:
+        """
+        Take up to *n* sends without waiting.
+        Returns (granted, seconds to wait before retrying); both are 0 once
+        the hourly or daily quota is used up.
+        """
+        acquire, _ = _scripts()
+        granted, wait_ms = acquire(
+            keys=self._keys(),
+            args=[n, self.max_per_second, self.max_per_hour, self.max_per_day, 2 * 3600, 2 * 86400],
+        )
+        return int(granted), int(wait_ms) / 1000
+
+    def acquire(self, n: int = 1, timeout: float = RATE_LIMIT_MAX_WAIT) -> int:
+        """
+        Block until up to *n* sends are allowed; returns how many were.
+        Fewer than *n* means the hourly or daily quota ran out, 0 that it
+        is used up or *timeout* passed.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            granted, wait = self.try_acquire(n)
+            if granted or not wait:
+                return granted
+            if time.monotonic() + wait > deadline:
+                return 0
+            time.sleep(wait)
+
+    def release(self, n: int) -> None:
+        """Return hourly and daily quota taken for *n* sends that failed."""
+        if n > 0:
+            _, release = _scripts()
+            release(keys=self._keys()[1:], args=[n])
+
+    def retry_after(self) -> float:
+        """Seconds until sends that got no capacity are worth trying again."""
+        _, hour_key, day_key = self._keys()
+        hour_used, day_used = _get_redis().mget(hour_key, day_key)
+        now = timezone.localtime()
+        if int(day_used or 0) >= self.max_per_day:
+            tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            return (tomorrow - now).total_seconds()
+        if int(hour_used or 0) >= self.max_per_hour:
+            return 3600 - time.time() % 3600
+        return RATE_LIMIT_RETRY_DELAY
+
+    def remaining_today(self) -> int:
+        """Sends left in today's quota."""
+        used = _get_redis().get(self._keys()[2])
+        return max(0, self.max_per_day - int(used or 0))
@@ -0,0 +1,244 @@
+"""
+Email Provider Event Processing
+email_sequences/events.py
+
+Set-based application of provider webhook events (SendGrid, Mailgun, SES).
+The provider parsers in tasks.py turn a webhook into ProviderEvent records
+and apply_events() handles the whole batch with a fixed number of queries:
+
+- one EmailSend lookup, by tracking id (the EmailSend id we send as
+  custom args / user variables) or by exact provider message id
+- one lookup of already stored provider_event_ids, so redelivered events
+  are skipped
+- one EmailEvent bulk insert
+- grouped UPDATEs for send status transitions, recipient flags and
+  EmailStep counters
+"""
+import logging
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import EmailEvent, EmailRecipient, EmailSend, EmailStep
+
+
+logger = logging.getLogger(__name__)
+
+# Statuses a delivery notification may move forward; later ones are kept
+BEFORE_DELIVERY = (
+    EmailSend.Status.PENDING,
+    EmailSend.Status.QUEUED,
+    EmailSend.Status.SENDING,
+    EmailSend.Status.SENT,
+    EmailSend.Status.DEFERRED,
+)
+
+
+@dataclass
+class ProviderEvent:
+    """A provider webhook event, normalized."""
+    event_type: str
+    timestamp: datetime
+    tracking_id: str = ""
+    message_id: str = ""
+    email: str = ""
+    provider_event_id: str = ""
+    url: str = ""
+    ip_address: str = ""
+    user_agent: str = ""
+    bounce_type: str = "hard"
+    reason: str = ""
+    details: Dict[str, str] = field(default_factory=dict)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+def increment(model, field_name: str, counts: Counter, **changes) -> None:
+    """Add ``counts[pk]`` to *field_name* of each row; one UPDATE per distinct increment."""
+    by_increment: Dict[int, List] = {}
+    for pk, count in counts.items():
+        if pk is not None:
+            by_increment.setdefault(count, []).append(pk)
+    for count, pks in by_increment.items():
+        model.objects.filter(id__in=pks).update(**{field_name: F(field_name) + count}, **changes)
+
+
+def _bare_message_id(message_id: str) -> str:
+    # Mailgun returns "<id@domain>" on send but reports "id@domain" in events
+    return (message_id or "").strip().strip("<>")
+
+
+def _resolve_sends(events: List[ProviderEvent]) -> List[Optional[EmailSend]]:
+    tracking_ids = set()
+    message_ids = set()
+    for event in events:
+        if event.tracking_id:
+            try:
+                tracking_ids.add(uuid.UUID(str(event.tracking_id)))
+            except ValueError:
+                pass
+        bare = _bare_message_id(event.message_id)
+        if bare:
+            message_ids.update((bare, f"<{bare}>"))
+
+    query = Q()
+    if tracking_ids:
+        query |= Q(id__in=tracking_ids)
+    if message_ids:
+        query |= Q(provider_message_id__in=message_ids)
+    if not query:
+        return [None] * len(events)
+
+    by_id: Dict[str, EmailSend] = {}
+    by_message: Dict[str, EmailSend] = {}
+    by_message_email: Dict[Tuple[str, str], EmailSend] = {}
+    for send in EmailSend.objects.filter(query):
+        by_id[str(send.id)] = send
+        bare = _bare_message_id(send.provider_message_id)
+        if bare:
+            # Sends batched into one provider request share the message id
+            by_message.setdefault(bare, send)
+            by_message_email[(bare, send.to_email.lower())] = send
+
+    resolved = []
+    for event in events:
+        bare = _bare_message_id(event.message_id)
+        resolved.append(
+            by_id.get(str(event.tracking_id))
+            or by_message_email.get((bare, event.email.lower()))
+            or by_message.get(bare)
+        )
+    return resolved
+
+
+def apply_events(events: List[ProviderEvent]) -> int:
+    """
+    Record *events* and apply their effects; returns how many were applied.
+    Events whose send is unknown or that were already recorded are skipped.
+    """
+    if not events:
+        return 0
+
+    sends = _resolve_sends(events)
+    event_ids = {event.provider_event_id for event in events if event.provider_event_id}
+    seen = set(
+        EmailEvent.objects.filter(provider_event_id__in=event_ids).values_list("provider_event_id", flat=True)
+    ) if event_ids else set()
+
+    fresh: List[Tuple[ProviderEvent, EmailSend]] = []
+    for event, send in zip(events, sends):
+        if send is None:
+            continue
+        if event.provider_event_id:
+            if event.provider_event_id in seen:
+                continue
+            seen.add(event.provider_event_id)
+        fresh.append((event, send))
+    if not fresh:
+        return 0
+
+    now = timezone.now()
+    delivered = set()
+    opens: Counter = Counter()
+    clicks: Counter = Counter()
+    bounces: Dict[Tuple[str, str], set] = {}
+    spam = set()
+    sends_by_id: Dict[Any, EmailSend] = {}
+    for event, send in fresh:
+        sends_by_id[send.id] = send
+        if event.event_type == EmailEvent.EventType.DELIVERED:
+            delivered.add(send.id)
+        elif event.event_type == EmailEvent.EventType.OPEN:
+            opens[send.id] += 1
+        elif event.event_type == EmailEvent.EventType.CLICK:
+            clicks[send.id] += 1
+        elif event.event_type == EmailEvent.EventType.BOUNCE:
+            bounces.setdefault((event.bounce_type, event.reason), set()).add(send.id)
+        elif event.event_type == EmailEvent.EventType.SPAM_REPORT:
+            spam.add(send.id)
+
+    with transaction.atomic():
+        EmailEvent.objects.bulk_create([
+            EmailEvent(
+                send=send,
+                event_type=event.event_type,
+                timestamp=event.timestamp,
+                url=event.url,
+                ip_address=event.ip_address or None,
+                user_agent=event.user_agent,
+                provider_event_id=event.provider_event_id,
+                metadata=event.metadata,
+                **event.details,
+            )
+            for event, send in fresh
+        ], batch_size=500)
+
+        if delivered:
+            EmailSend.objects.filter(id__in=delivered).update(
+                delivered_at=now,
+                status=Case(
+                    When(status__in=BEFORE_DELIVERY, then=Value(EmailSend.Status.DELIVERED)),
+                    default=F("status"),
+                ),
+            )
+
+        # Opens and clicks: the first one sets the unique flag, timestamp and status
+        for counts, count_field, unique_field, at_field, status, step_field, recipient_field, recipient_at in (
+            (opens, "open_count", "unique_opens", "opened_at", EmailSend.Status.OPENED,
+             "total_opened", "emails_opened", "last_opened_at"),
+            (clicks, "click_count", "unique_clicks", "clicked_at", EmailSend.Status.CLICKED,
+             "total_clicked", "emails_clicked", "last_clicked_at"),
+        ):
+            if not counts:
+                continue
+            first = When(**{unique_field: 0}, then=Value(now))
+            increment(
+                EmailSend, count_field, counts,
+                **{
+                    at_field: Case(first, default=F(at_field)),
+                    unique_field: Case(When(**{unique_field: 0}, then=Value(1)), default=F(unique_field)),
+                },
+                status=Case(When(**{unique_field: 0}, then=Value(status)), default=F("status")),
+            )
+            firsts = [sends_by_id[pk] for pk in counts if getattr(sends_by_id[pk], unique_field) == 0]
+            increment(EmailStep, step_field, Counter(send.step_id for send in firsts))
+            increment(
+                EmailRecipient, recipient_field, Counter(send.recipient_id for send in firsts),
+                **{recipient_at: now},
+            )
+
+        bounced_steps: Counter = Counter()
+        for (bounce_type, reason), ids in bounces.items():
+            EmailSend.objects.filter(id__in=ids).update(
+                status=EmailSend.Status.BOUNCED,
+                bounced_at=now,
+                error_message=reason,
+                error_code=bounce_type,
+            )
+            recipient_changes = {"is_bounced": True, "bounced_at": now, "bounce_type": bounce_type}
+            if bounce_type == "hard":
+                recipient_changes["is_subscribed"] = False
+            EmailRecipient.objects.filter(id__in={sends_by_id[pk].recipient_id for pk in ids}).update(
+                **recipient_changes
+            )
+            bounced_steps.update(
+                sends_by_id[pk].step_id for pk in ids
+                if sends_by_id[pk].status != EmailSend.Status.BOUNCED
+            )
+        increment(EmailStep, "total_bounced", bounced_steps)
+
+        if spam:
+            EmailSend.objects.filter(id__in=spam).update(status=EmailSend.Status.SPAM)
+            EmailRecipient.objects.filter(id__in={sends_by_id[pk].recipient_id for pk in spam}).update(
+                is_complained=True,
+                complained_at=now,
+                is_subscribed=False,
+            )
+
+    logger.info(f"Applied {len(fresh)} of {len(events)} provider events")
+    return len(fresh)
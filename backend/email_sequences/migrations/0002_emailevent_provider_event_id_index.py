@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-16 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email_sequences', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailevent',
+            index=models.Index(fields=['provider_event_id'], name='email_seque_provide_fca841_idx'),
+        ),
+    ]
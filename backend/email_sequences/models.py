@@ -173,12 +173,16 @@ class EmailProvider(models.Model):
         self.last_error = ""
         self.save(update_fields=["is_verified", "last_verified_at", "last_error"])
     
-    def increment_sent_count(self):
+    def increment_sent_count(self, count: int = 1):
         """Increment sent email counters"""
-        self.emails_sent_today += 1
-        self.emails_sent_total += 1
         self.last_sent_at = timezone.now()
-        self.save(update_fields=["emails_sent_today", "emails_sent_total", "last_sent_at"])
+        EmailProvider.objects.filter(id=self.id).update(
+            emails_sent_today=models.F("emails_sent_today") + count,
+            emails_sent_total=models.F("emails_sent_total") + count,
+            last_sent_at=self.last_sent_at,
+        )
+        self.emails_sent_today += count
+        self.emails_sent_total += count
     
     def reset_daily_count(self):
         """Reset daily email counter"""
@@ -1233,6 +1237,7 @@ class EmailEvent(models.Model):
             models.Index(fields=["send", "event_type"]),
             models.Index(fields=["event_type", "timestamp"]),
             models.Index(fields=["timestamp"]),
+            models.Index(fields=["provider_event_id"]),
         ]
     
     def __str__(self):
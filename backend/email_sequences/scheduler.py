@@ -0,0 +1,313 @@
+"""
+Email Sequence Scheduler
+email_sequences/scheduler.py
+
+Claims due enrollments and processes them a chunk at a time.
+
+claim_due_enrollments() locks due rows with SELECT ... FOR UPDATE SKIP
+LOCKED, so concurrent scheduler runs never claim the same enrollment, and
+pushes their next_send_at forward by CLAIM_LEASE before committing.  A
+chunk whose worker dies is therefore picked up again once the lease runs
+out instead of being lost.
+
+process_enrollments() handles a claimed chunk grouped by step: step
+content is compiled once, sends are bulk-inserted and handed to one
+send_email_batch task per step (one provider client), and enrollments
+are advanced with bulk updates.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .client import MessageTemplate
+from .events import increment
+from .models import (
+    EmailSend,
+    EmailSequence,
+    EmailStep,
+    EmailTemplate,
+    SequenceEnrollment,
+)
+
+
+logger = logging.getLogger(__name__)
+
+ENROLLMENT_CHUNK_SIZE = 200              # Enrollments claimed and processed per task
+CLAIM_LEASE = timedelta(minutes=10)      # A claimed chunk is retried after this
+PROVIDER_RETRY_DELAY = timedelta(minutes=5)
+
+
+def claim_due_enrollments(limit: int = ENROLLMENT_CHUNK_SIZE) -> List[str]:
+    """Claim up to *limit* due enrollments; returns their ids."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            SequenceEnrollment.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(
+                status=SequenceEnrollment.Status.ACTIVE,
+                next_send_at__lte=now,
+                sequence__is_active=True,
+            )
+            .order_by("next_send_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        if ids:
+            SequenceEnrollment.objects.filter(id__in=ids).update(next_send_at=now + CLAIM_LEASE)
+    return [str(pk) for pk in ids]
+
+
+def condition_met(step: EmailStep, enrollment: SequenceEnrollment, previous_send: Optional[EmailSend]) -> bool:
+    """Whether *step*'s condition holds, given the enrollment's latest earlier send."""
+    condition = step.condition_type
+
+    if condition == EmailStep.ConditionType.NONE:
+        return True
+
+    if not previous_send:
+        return True
+
+    if condition == EmailStep.ConditionType.OPENED_PREVIOUS:
+        return previous_send.unique_opens > 0
+
+    if condition == EmailStep.ConditionType.NOT_OPENED_PREVIOUS:
+        return previous_send.unique_opens == 0
+
+    if condition == EmailStep.ConditionType.CLICKED_PREVIOUS:
+        return previous_send.unique_clicks > 0
+
+    if condition == EmailStep.ConditionType.NOT_CLICKED_PREVIOUS:
+        return previous_send.unique_clicks == 0
+
+    if condition == EmailStep.ConditionType.HAS_TAG:
+        required_tag = step.condition_config.get("tag")
+        if required_tag:
+            return enrollment.recipient.has_tag(required_tag)
+
+    return True
+
+
+def _previous_sends(step: EmailStep, enrollments: List[SequenceEnrollment]) -> Dict[Any, EmailSend]:
+    """Latest send before *step* for each enrollment, in one query."""
+    if step.condition_type == EmailStep.ConditionType.NONE:
+        return {}
+    sends = (
+        EmailSend.objects.filter(
+            enrollment_id__in=[enrollment.id for enrollment in enrollments],
+            step__order__lt=step.order,
+        )
+        .order_by("enrollment_id", "-created_at")
+        .distinct("enrollment_id")
+        .only("id", "enrollment_id", "unique_opens", "unique_clicks")
+    )
+    return {send.enrollment_id: send for send in sends}
+
+
+def _variables(enrollment: SequenceEnrollment) -> Dict[str, Any]:
+    recipient = enrollment.recipient
+    return {
+        **(recipient.variables or {}),
+        **(enrollment.variables or {}),
+        "email": recipient.email,
+        "name": recipient.name or recipient.first_name or "",
+        "first_name": recipient.first_name or "",
+        "last_name": recipient.last_name or "",
+        "unsubscribe_url": "{{unsubscribe_url}}",  # Will be replaced by tracking system
+    }
+
+
+class _Advance:
+    """Enrollment changes of one chunk, written with bulk updates."""
+
+    def __init__(self, now):
+        self.now = now
+        self.steps: Dict[Any, List[EmailStep]] = {}
+        self.advanced: List[SequenceEnrollment] = []
+        self.completed: List[SequenceEnrollment] = []
+        self.unsubscribed: List[SequenceEnrollment] = []
+        self.postponed: List[SequenceEnrollment] = []
+
+    def active_steps(self, sequence: EmailSequence) -> List[EmailStep]:
+        if sequence.id not in self.steps:
+            self.steps[sequence.id] = list(sequence.steps.filter(is_active=True).order_by("order"))
+        return self.steps[sequence.id]
+
+    def first_step(self, enrollment: SequenceEnrollment) -> Optional[EmailStep]:
+        steps = self.active_steps(enrollment.sequence)
+        return steps[0] if steps else None
+
+    def next_step(self, enrollment: SequenceEnrollment) -> bool:
+        """advance_to_next_step(), deferred; returns False when the sequence is done."""
+        current = enrollment.current_step
+        steps = self.active_steps(enrollment.sequence)
+        if current:
+            following = next((step for step in steps if step.order > current.order), None)
+        else:
+            following = steps[0] if steps else None
+
+        if following:
+            enrollment.current_step = following
+            enrollment.completed_steps += 1
+            enrollment.next_send_at = self.now + timedelta(minutes=following.delay_total_minutes)
+            self.advanced.append(enrollment)
+            return True
+        self.complete(enrollment)
+        return False
+
+    def complete(self, enrollment: SequenceEnrollment) -> None:
+        enrollment.status = SequenceEnrollment.Status.COMPLETED
+        enrollment.completed_at = self.now
+        enrollment.next_send_at = None
+        self.completed.append(enrollment)
+
+    def postpone(self, enrollment: SequenceEnrollment, delay: timedelta) -> None:
+        enrollment.next_send_at = self.now + delay
+        self.postponed.append(enrollment)
+
+    def save(self, counted_completions: List[SequenceEnrollment]) -> None:
+        if self.advanced:
+            SequenceEnrollment.objects.bulk_update(
+                self.advanced, ["current_step", "completed_steps", "next_send_at"], batch_size=500
+            )
+        if self.completed:
+            SequenceEnrollment.objects.bulk_update(
+                self.completed, ["status", "completed_at", "next_send_at"], batch_size=500
+            )
+        if self.postponed:
+            SequenceEnrollment.objects.bulk_update(self.postponed, ["next_send_at"], batch_size=500)
+        if self.unsubscribed:
+            SequenceEnrollment.objects.filter(id__in=[e.id for e in self.unsubscribed]).update(
+                status=SequenceEnrollment.Status.UNSUBSCRIBED
+            )
+            increment(
+                EmailSequence, "total_unsubscribed", Counter(e.sequence_id for e in self.unsubscribed)
+            )
+        increment(EmailSequence, "total_completed", Counter(e.sequence_id for e in counted_completions))
+
+
+def process_enrollments(enrollment_ids: List[str]) -> Dict[str, Any]:
+    """
+    Send the current step of each given active enrollment and advance it.
+
+    Mirrors process_sequence_step for a whole chunk: recipients that can no
+    longer receive email are unsubscribed, steps whose condition fails are
+    skipped, and enrollments whose provider is unavailable are retried
+    after PROVIDER_RETRY_DELAY.
+    """
+    from .tasks import send_email_batch
+
+    enrollments = list(
+        SequenceEnrollment.objects.select_related(
+            "sequence", "sequence__provider", "recipient", "current_step", "current_step__template"
+        ).filter(id__in=enrollment_ids, status=SequenceEnrollment.Status.ACTIVE)
+    )
+    now = timezone.now()
+    advance = _Advance(now)
+    by_step: Dict[Any, List[SequenceEnrollment]] = {}
+    steps: Dict[Any, EmailStep] = {}
+    skipped = 0
+
+    for enrollment in enrollments:
+        if not enrollment.sequence.is_active:
+            continue
+        if not enrollment.recipient.can_receive_email():
+            advance.unsubscribed.append(enrollment)
+            continue
+        step = enrollment.current_step or advance.first_step(enrollment)
+        if not step:
+            advance.complete(enrollment)
+            continue
+        enrollment.current_step = step
+        steps[step.id] = step
+        by_step.setdefault(step.id, []).append(enrollment)
+
+    completions: List[SequenceEnrollment] = []
+    batches: List[List[str]] = []
+    sent = 0
+    with transaction.atomic():
+        for step_id, step_enrollments in by_step.items():
+            step = steps[step_id]
+            sequence = step_enrollments[0].sequence
+
+            previous = _previous_sends(step, step_enrollments)
+            due = []
+            for enrollment in step_enrollments:
+                if condition_met(step, enrollment, previous.get(enrollment.id)):
+                    due.append(enrollment)
+                else:
+                    # Condition not met: skip to the next step
+                    skipped += 1
+                    advance.next_step(enrollment)
+            if not due:
+                continue
+
+            provider = sequence.provider
+            if not provider or not provider.can_send():
+                logger.warning(f"Provider unavailable for sequence {sequence.id}")
+                for enrollment in due:
+                    advance.postpone(enrollment, PROVIDER_RETRY_DELAY)
+                continue
+
+            content = step.get_effective_content()
+            if not content["subject"] or not content["html_content"]:
+                # Left claimed; retried when the lease runs out
+                logger.error(f"Step {step.id} has no content")
+                continue
+
+            template = MessageTemplate(content["subject"], content["html_content"], content["text_content"])
+            template_key = template.store()
+            sends = []
+            for enrollment in due:
+                variables = _variables(enrollment)
+                subject, html, text = template.render(variables)
+                sends.append(EmailSend(
+                    step=step,
+                    enrollment=enrollment,
+                    recipient=enrollment.recipient,
+                    provider=provider,
+                    from_email=provider.default_from_email,
+                    from_name=provider.default_from_name,
+                    to_email=enrollment.recipient.email,
+                    reply_to=provider.default_reply_to,
+                    subject=subject,
+                    html_content=html,
+                    text_content=text,
+                    status=EmailSend.Status.QUEUED,
+                    metadata={
+                        "step_order": step.order,
+                        "sequence_id": str(sequence.id),
+                        "template": template_key,
+                        "variables": template.values(variables),
+                    }
+                ))
+                if not advance.next_step(enrollment):
+                    completions.append(enrollment)
+            EmailSend.objects.bulk_create(sends, batch_size=500)
+            batches.append([str(send.id) for send in sends])
+            sent += len(sends)
+
+            if step.template_id:
+                EmailTemplate.objects.filter(id=step.template_id).update(
+                    times_used=F("times_used") + len(sends),
+                    last_used_at=now,
+                )
+
+        advance.save(completions)
+        for send_ids in batches:
+            transaction.on_commit(lambda ids=send_ids: send_email_batch.delay(ids))
+
+    logger.info(
+        f"Processed {len(enrollments)} enrollments: {sent} sends queued, {skipped} steps skipped"
+    )
+    return {
+        "success": True,
+        "processed": len(enrollments),
+        "sent": sent,
+        "skipped": skipped,
+        "completed": len(advance.completed),
+        "unsubscribed": len(advance.unsubscribed),
+    }
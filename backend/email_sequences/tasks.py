@@ -6,12 +6,13 @@ Background tasks for email processing, sending, and maintenance.
 Created: 2026-02-02
 """
 import logging
-from datetime import timedelta
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
 from typing import Optional, List, Dict, Any
 
 from celery import shared_task
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import F, Q
 from django.utils import timezone
 
 from .models import (
@@ -20,11 +21,12 @@ from .models import (
     EmailSequence,
     EmailStep,
     EmailRecipient,
-    SequenceEnrollment,
     EmailSend,
     EmailEvent,
 )
-from .client import EmailClientFactory, EmailMessage, TemplateRenderer
+from .client import EmailClientFactory, EmailMessage, MessageTemplate, RateLimiter
+from .events import ProviderEvent, apply_events, increment
+from .scheduler import ENROLLMENT_CHUNK_SIZE, claim_due_enrollments, process_enrollments
 
 
 logger = logging.getLogger(__name__)
@@ -67,6 +69,12 @@ def send_email_async(self, send_id: str) -> Dict[str, Any]:
         send.mark_failed("Provider cannot send (inactive, unverified, or rate limited)", "PROVIDER_UNAVAILABLE")
         return {"success": False, "error": "Provider unavailable"}
 
+    limiter = RateLimiter.for_provider(provider)
+    if not limiter.acquire():
+        # Not a failure: try again once there is capacity, without using a retry
+        send_email_async.apply_async(args=[send_id], countdown=limiter.retry_after())
+        return {"success": False, "error": "Rate limited", "deferred": True}
+
     # Update status to sending
     send.status = EmailSend.Status.SENDING
     send.save(update_fields=["status"])
@@ -123,6 +131,7 @@ def send_email_async(self, send_id: str) -> Dict[str, Any]:
             return {"success": True, "message_id": result.message_id}
 
         else:
+            limiter.release(1)
             send.mark_failed(result.error_message, result.error_code)
             logger.error(f"Failed to send email {send_id}: {result.error_message}")
 
@@ -142,10 +151,10 @@ def send_email_async(self, send_id: str) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=300)
-def process_sequence_step(self, enrollment_id: str) -> Dict[str, Any]:
+@shared_task
+def process_sequence_step(enrollment_id: str) -> Dict[str, Any]:
     """
-    Process a sequence step for an enrollment.
+    Process the current sequence step of a single enrollment.
 
     Args:
         enrollment_id: UUID of the SequenceEnrollment
@@ -153,160 +162,210 @@ def process_sequence_step(self, enrollment_id: str) -> Dict[str, Any]:
     Returns:
         Dict with processing status
     """
-    try:
-        enrollment = SequenceEnrollment.objects.select_related(
-            "sequence", "recipient", "current_step"
-        ).get(id=enrollment_id)
-    except SequenceEnrollment.DoesNotExist:
-        logger.error(f"Enrollment {enrollment_id} not found")
-        return {"success": False, "error": "Enrollment not found"}
-
-    # Check if enrollment is active
-    if enrollment.status != SequenceEnrollment.Status.ACTIVE:
-        logger.info(f"Enrollment {enrollment_id} is not active: {enrollment.status}")
-        return {"success": False, "error": f"Enrollment not active: {enrollment.status}"}
-
-    # Check if sequence is active
-    sequence = enrollment.sequence
-    if not sequence.is_active:
-        logger.info(f"Sequence {sequence.id} is not active")
-        return {"success": False, "error": "Sequence not active"}
-
-    # Check if recipient can receive emails
-    recipient = enrollment.recipient
-    if not recipient.can_receive_email():
-        enrollment.status = SequenceEnrollment.Status.UNSUBSCRIBED
-        enrollment.save(update_fields=["status"])
-        sequence.total_unsubscribed += 1
-        sequence.save(update_fields=["total_unsubscribed"])
-        return {"success": False, "error": "Recipient cannot receive emails"}
-
-    # Get current step
-    step = enrollment.current_step
-    if not step:
-        # Try to get first step
-        step = sequence.steps.filter(is_active=True).first()
-        if not step:
-            enrollment.status = SequenceEnrollment.Status.COMPLETED
-            enrollment.completed_at = timezone.now()
-            enrollment.save(update_fields=["status", "completed_at"])
-            return {"success": False, "error": "No steps in sequence"}
-
-    # Check step conditions
-    if not _check_step_condition(step, enrollment):
-        logger.info(f"Step condition not met for enrollment {enrollment_id}")
-        # Skip to next step
-        if enrollment.advance_to_next_step():
-            # Schedule next step
-            process_sequence_step.apply_async(
-                args=[str(enrollment.id)],
-                eta=enrollment.next_send_at
-            )
-        return {"success": True, "skipped": True, "reason": "Condition not met"}
+    return process_enrollments([enrollment_id])
+
+
+@shared_task
+def process_enrollment_chunk(enrollment_ids: List[str]) -> Dict[str, Any]:
+    """Process a chunk of enrollments claimed by process_pending_enrollments."""
+    return process_enrollments(enrollment_ids)
 
-    # Get provider
-    provider = sequence.provider
-    if not provider or not provider.can_send():
-        logger.warning(f"Provider unavailable for sequence {sequence.id}")
-        # Retry later
-        raise self.retry(countdown=300)
-
-    # Get content
-    content = step.get_effective_content()
-    if not content["subject"] or not content["html_content"]:
-        logger.error(f"Step {step.id} has no content")
-        return {"success": False, "error": "Step has no content"}
-
-    # Merge variables
-    variables = {
-        **(recipient.variables or {}),
-        **(enrollment.variables or {}),
-        "email": recipient.email,
-        "name": recipient.name or recipient.first_name or "",
-        "first_name": recipient.first_name or "",
-        "last_name": recipient.last_name or "",
-        "unsubscribe_url": f"{{{{unsubscribe_url}}}}",  # Will be replaced by tracking system
-    }
 
-    # Render content
-    rendered_subject = TemplateRenderer.render(content["subject"], variables)
-    rendered_html = TemplateRenderer.render(content["html_content"], variables)
-    rendered_text = TemplateRenderer.render(content["text_content"], variables)
-
-    # Create EmailSend record
-    send = EmailSend.objects.create(
-        step=step,
-        enrollment=enrollment,
-        recipient=recipient,
-        provider=provider,
-        from_email=provider.default_from_email,
-        from_name=provider.default_from_name,
-        to_email=recipient.email,
-        reply_to=provider.default_reply_to,
-        subject=rendered_subject,
-        html_content=rendered_html,
-        text_content=rendered_text,
-        status=EmailSend.Status.QUEUED,
-        metadata={"step_order": step.order, "sequence_id": str(sequence.id)}
+def _fail_sends(sends: List[EmailSend], error: str, error_code: str) -> None:
+    """mark_failed() for many sends in one UPDATE."""
+    now = timezone.now()
+    for send in sends:
+        send.status = EmailSend.Status.FAILED
+        send.failed_at = now
+        send.error_message = error
+        send.error_code = error_code
+        send.retry_count += 1
+    EmailSend.objects.bulk_update(
+        sends, ["status", "failed_at", "error_message", "error_code", "retry_count"], batch_size=500
     )
 
-    # Increment template usage
-    if step.template:
-        step.template.increment_usage()
 
-    # Send email async
-    result = send_email_async.delay(str(send.id))
+def _retry_failed(sends: List[EmailSend]) -> None:
+    """Failed sends of a batch are retried one by one."""
+    for send in sends:
+        if send.can_retry():
+            send_email_async.apply_async(args=[str(send.id)], countdown=60)
+
+
+def _record_batch_results(provider: EmailProvider, sends: List[EmailSend], results) -> Dict[str, int]:
+    """Apply a batch's SendResults with bulk writes; returns sent/failed counts."""
+    now = timezone.now()
+    sent, failed = [], []
+    for send, result in zip(sends, results):
+        if result.success:
+            send.status = EmailSend.Status.SENT
+            send.sent_at = now
+            if result.message_id:
+                send.provider_message_id = result.message_id
+            sent.append(send)
+        else:
+            failed.append((send, result))
+
+    with transaction.atomic():
+        if sent:
+            EmailSend.objects.bulk_update(sent, ["status", "sent_at", "provider_message_id"], batch_size=500)
+            provider.increment_sent_count(len(sent))
+
+            increment(
+                EmailRecipient, "emails_received", Counter(send.recipient_id for send in sent),
+                last_email_at=now,
+            )
+            increment(EmailStep, "total_sent", Counter(send.step_id for send in sent))
+
+            EmailEvent.objects.bulk_create([
+                EmailEvent(send=send, event_type=EmailEvent.EventType.SENT, timestamp=now)
+                for send in sent
+            ])
+
+        for send, result in failed:
+            logger.error(f"Failed to send email {send.id}: {result.error_message}")
+            send.status = EmailSend.Status.FAILED
+            send.failed_at = now
+            send.error_message = result.error_message
+            send.error_code = result.error_code
+            send.retry_count += 1
+        if failed:
+            EmailSend.objects.bulk_update(
+                [send for send, _ in failed],
+                ["status", "failed_at", "error_message", "error_code", "retry_count"],
+                batch_size=500,
+            )
+
+    _retry_failed([send for send, _ in failed])
+    return {"sent": len(sent), "failed": len(failed)}
 
-    # Advance to next step
-    if enrollment.advance_to_next_step():
-        # Schedule next step
-        process_sequence_step.apply_async(
-            args=[str(enrollment.id)],
-            eta=enrollment.next_send_at
+
+def _send_chunk(provider: EmailProvider, client, loop, limiter: RateLimiter, sends: List[EmailSend]) -> Dict[str, int]:
+    """Send *sends* in one send_batch() call; quota of failed sends is returned."""
+    EmailSend.objects.filter(id__in=[send.id for send in sends]).update(status=EmailSend.Status.SENDING)
+    # Sends rendered from a stored template let the provider substitute per recipient
+    templates = MessageTemplate.load_many({(send.metadata or {}).get("template") for send in sends})
+    messages = [
+        EmailMessage(
+            to_email=send.to_email,
+            to_name=send.recipient.name if send.recipient else "",
+            subject=send.subject,
+            html_content=send.html_content,
+            text_content=send.text_content,
+            from_email=send.from_email,
+            from_name=send.from_name,
+            reply_to=send.reply_to,
+            tracking_id=str(send.id),
+            template=templates.get((send.metadata or {}).get("template")),
+            variables=(send.metadata or {}).get("variables", {}),
         )
-    else:
-        # Sequence completed
-        sequence.total_completed += 1
-        sequence.save(update_fields=["total_completed"])
+        for send in sends
+    ]
 
-    logger.info(f"Processed step {step.order} for enrollment {enrollment_id}")
-    return {"success": True, "send_id": str(send.id)}
+    try:
+        results = loop.run_until_complete(client.send_batch(messages))
+    except Exception as e:
+        logger.exception(f"Exception sending batch of {len(sends)} via provider {provider.id}")
+        limiter.release(len(sends))
+        _fail_sends(sends, str(e), "EXCEPTION")
+        _retry_failed(sends)
+        return {"sent": 0, "failed": len(sends)}
 
+    counts = _record_batch_results(provider, sends, results)
+    limiter.release(counts["failed"])
+    return counts
 
-def _check_step_condition(step: EmailStep, enrollment: SequenceEnrollment) -> bool:
-    """Check if step condition is met."""
-    condition = step.condition_type
 
-    if condition == EmailStep.ConditionType.NONE:
-        return True
+@shared_task
+def send_email_batch(send_ids: List[str]) -> Dict[str, Any]:
+    """
+    Send a chunk of queued EmailSend records.
 
-    # Get previous send
-    previous_send = EmailSend.objects.filter(
-        enrollment=enrollment,
-        step__order__lt=step.order
-    ).order_by("-created_at").first()
+    Each provider's share goes through one client, in
+    BaseEmailClient.send_batch() calls of at most the provider's per-second
+    rate as RateLimiter grants capacity, and results are written back with
+    bulk updates.  Sends that fail are retried one by one by
+    send_email_async; sends that get no capacity are queued again.
 
-    if not previous_send:
-        return True
+    Args:
+        send_ids: UUIDs of the EmailSend records
 
-    if condition == EmailStep.ConditionType.OPENED_PREVIOUS:
-        return previous_send.unique_opens > 0
+    Returns:
+        Dict with sent/failed counts
+    """
+    import asyncio
 
-    if condition == EmailStep.ConditionType.NOT_OPENED_PREVIOUS:
-        return previous_send.unique_opens == 0
+    sends = list(
+        EmailSend.objects.select_related("provider", "recipient").filter(
+            id__in=send_ids,
+            status__in=[EmailSend.Status.PENDING, EmailSend.Status.QUEUED],
+        )
+    )
+    by_provider: Dict[Any, List[EmailSend]] = {}
+    for send in sends:
+        by_provider.setdefault(send.provider_id, []).append(send)
+
+    totals = {"sent": 0, "failed": 0, "deferred": 0}
+    for provider_id, provider_sends in by_provider.items():
+        provider = provider_sends[0].provider
+        if not provider:
+            _fail_sends(provider_sends, "No provider configured", "NO_PROVIDER")
+            totals["failed"] += len(provider_sends)
+            continue
+        if not provider.can_send():
+            _fail_sends(
+                provider_sends,
+                "Provider cannot send (inactive, unverified, or rate limited)",
+                "PROVIDER_UNAVAILABLE",
+            )
+            totals["failed"] += len(provider_sends)
+            continue
 
-    if condition == EmailStep.ConditionType.CLICKED_PREVIOUS:
-        return previous_send.unique_clicks > 0
+        limiter = RateLimiter.for_provider(provider)
+        deferred: List[EmailSend] = []
+        try:
+            client = EmailClientFactory.create(provider)
+        except Exception as e:
+            logger.exception(f"Cannot create client for provider {provider_id}")
+            _fail_sends(provider_sends, str(e), "EXCEPTION")
+            totals["failed"] += len(provider_sends)
+            continue
 
-    if condition == EmailStep.ConditionType.NOT_CLICKED_PREVIOUS:
-        return previous_send.unique_clicks == 0
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            # Slices no larger than the per-second rate go out as capacity arrives
+            for start in range(0, len(provider_sends), limiter.max_per_second):
+                chunk = provider_sends[start:start + limiter.max_per_second]
+                granted = limiter.acquire(len(chunk))
+                if granted < len(chunk):
+                    deferred = provider_sends[start + granted:]
+                    chunk = chunk[:granted]
+                if chunk:
+                    counts = _send_chunk(provider, client, loop, limiter, chunk)
+                    totals["sent"] += counts["sent"]
+                    totals["failed"] += counts["failed"]
+                if deferred:
+                    break
+        finally:
+            loop.close()
 
-    if condition == EmailStep.ConditionType.HAS_TAG:
-        required_tag = step.condition_config.get("tag")
-        if required_tag:
-            return enrollment.recipient.has_tag(required_tag)
+        if deferred:
+            # Still QUEUED; tried again once there is capacity, without using a retry
+            send_email_batch.apply_async(
+                args=[[str(send.id) for send in deferred]], countdown=limiter.retry_after()
+            )
+            totals["deferred"] += len(deferred)
+
+    logger.info(
+        f"Batch of {len(send_ids)} sends: {totals['sent']} sent, {totals['failed']} failed, "
+        f"{totals['deferred']} deferred"
+    )
+    return {"success": True, **totals}
 
-    return True
+
+BULK_CHUNK_SIZE = 500  # Recipients upserted, rendered and queued per send_email_batch task
+SCHEDULER_MAX_CHUNKS = 500  # Enrollment chunks claimed per process_pending_enrollments run
 
 
 @shared_task
@@ -316,18 +375,22 @@ def send_bulk_emails(
     subject: str,
     html_content: str,
     text_content: str = "",
-    batch_size: int = 100
+    batch_size: int = BULK_CHUNK_SIZE
 ) -> Dict[str, Any]:
     """
     Send bulk emails to multiple recipients.
 
+    Each chunk of *batch_size* recipients costs one recipient upsert, one
+    recipient lookup, one EmailSend bulk insert and one send_email_batch
+    task.  Sends stop at the provider's remaining daily quota.
+
     Args:
         provider_id: UUID of the EmailProvider
         recipients: List of dicts with email, name, variables
         subject: Email subject template
         html_content: HTML content template
         text_content: Text content template
-        batch_size: Number of emails to send in each batch
+        batch_size: Number of emails to queue per send task
 
     Returns:
         Dict with send statistics
@@ -341,46 +404,67 @@ def send_bulk_emails(
         return {"success": False, "error": "Provider cannot send"}
 
     total = len(recipients)
+    remaining = RateLimiter.for_provider(provider).remaining_today()
     sent = 0
     failed = 0
     errors = []
+    batch_size = max(1, batch_size)
+    template = MessageTemplate(subject, html_content, text_content)
+    template_key = template.store()
 
     # Process in batches
     for i in range(0, total, batch_size):
-        batch = recipients[i:i + batch_size]
-
-        for recipient_data in batch:
+        batch = []
+        for recipient_data in recipients[i:i + batch_size]:
             email = recipient_data.get("email")
             if not email:
                 failed += 1
                 continue
+            batch.append((email, recipient_data))
+        if not batch:
+            continue
 
-            variables = {
-                "email": email,
-                "name": recipient_data.get("name", ""),
-                **(recipient_data.get("variables", {}))
-            }
-
-            rendered_subject = TemplateRenderer.render(subject, variables)
-            rendered_html = TemplateRenderer.render(html_content, variables)
-            rendered_text = TemplateRenderer.render(text_content, variables) if text_content else ""
-
-            # Get or create recipient
-            recipient, _ = EmailRecipient.objects.get_or_create(
+        # Existing recipients are left untouched, as with get_or_create
+        EmailRecipient.objects.bulk_create(
+            [
+                EmailRecipient(
+                    owner_id=provider.owner_id,
+                    email=email.lower(),
+                    name=recipient_data.get("name", ""),
+                    source="bulk_send",
+                )
+                for email, recipient_data in batch
+            ],
+            ignore_conflicts=True,
+        )
+        recipients_by_email = {
+            recipient.email: recipient
+            for recipient in EmailRecipient.objects.filter(
                 owner_id=provider.owner_id,
-                email=email.lower(),
-                defaults={
-                    "name": recipient_data.get("name", ""),
-                    "source": "bulk_send"
-                }
+                email__in={email.lower() for email, _ in batch},
             )
+        }
 
-            if not recipient.can_receive_email():
+        sends = []
+        for email, recipient_data in batch:
+            recipient = recipients_by_email.get(email.lower())
+            if recipient is None or not recipient.can_receive_email():
                 failed += 1
                 continue
 
-            # Create send record
-            send = EmailSend.objects.create(
+            # Check rate limits
+            if sent + len(sends) >= remaining:
+                errors.append(f"Rate limit reached after {sent + len(sends)} emails")
+                break
+
+            variables = {
+                "email": email,
+                "name": recipient_data.get("name", ""),
+                **(recipient_data.get("variables", {}))
+            }
+
+            rendered_subject, rendered_html, rendered_text = template.render(variables)
+            sends.append(EmailSend(
                 recipient=recipient,
                 provider=provider,
                 from_email=provider.default_from_email,
@@ -391,17 +475,15 @@ def send_bulk_emails(
                 html_content=rendered_html,
                 text_content=rendered_text,
                 status=EmailSend.Status.QUEUED,
-                metadata={"bulk_send": True}
-            )
-
-            # Queue for sending
-            send_email_async.delay(str(send.id))
-            sent += 1
+                metadata={"bulk_send": True, "template": template_key, "variables": template.values(variables)}
+            ))
 
-            # Check rate limits
-            if not provider.can_send():
-                errors.append(f"Rate limit reached after {sent} emails")
-                break
+        if sends:
+            EmailSend.objects.bulk_create(sends)
+            send_email_batch.delay([str(send.id) for send in sends])
+            sent += len(sends)
+        if errors:
+            break
 
     return {
         "success": True,
@@ -413,27 +495,23 @@ def send_bulk_emails(
 
 
 @shared_task
-def process_pending_enrollments() -> Dict[str, Any]:
+def process_pending_enrollments(max_chunks: int = SCHEDULER_MAX_CHUNKS) -> Dict[str, Any]:
     """
-    Process all enrollments that are due to send.
+    Claim all enrollments that are due to send and queue them in chunks.
     Should be run periodically (e.g., every minute).
     """
-    now = timezone.now()
-
-    # Find enrollments due to send
-    enrollments = SequenceEnrollment.objects.filter(
-        status=SequenceEnrollment.Status.ACTIVE,
-        next_send_at__lte=now,
-        sequence__is_active=True
-    ).select_related("sequence", "recipient", "current_step")[:100]
-
     processed = 0
-    for enrollment in enrollments:
-        process_sequence_step.delay(str(enrollment.id))
-        processed += 1
+    chunks = 0
+    while chunks < max_chunks:
+        enrollment_ids = claim_due_enrollments(ENROLLMENT_CHUNK_SIZE)
+        if not enrollment_ids:
+            break
+        process_enrollment_chunk.delay(enrollment_ids)
+        processed += len(enrollment_ids)
+        chunks += 1
 
-    logger.info(f"Queued {processed} enrollments for processing")
-    return {"processed": processed}
+    logger.info(f"Queued {processed} enrollments for processing in {chunks} chunks")
+    return {"processed": processed, "chunks": chunks}
 
 
 @shared_task
@@ -465,66 +543,66 @@ def process_webhook_event(
         return {"success": False, "error": str(e)}
 
 
-def _process_sendgrid_webhook(events: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Process SendGrid webhook events."""
-    processed = 0
+def _event_time(timestamp) -> datetime:
+    """Provider unix timestamp as an aware datetime; now if missing."""
+    if not timestamp:
+        return timezone.now()
+    return datetime.fromtimestamp(float(timestamp), tz=dt_timezone.utc)
 
-    for event in events:
-        event_type = event.get("event")
-        sg_message_id = event.get("sg_message_id", "").split(".")[0]
 
-        if not sg_message_id:
-            continue
+SENDGRID_EVENTS = {
+    "delivered": EmailEvent.EventType.DELIVERED,
+    "open": EmailEvent.EventType.OPEN,
+    "click": EmailEvent.EventType.CLICK,
+    "bounce": EmailEvent.EventType.BOUNCE,
+    "dropped": EmailEvent.EventType.DROPPED,
+    "spamreport": EmailEvent.EventType.SPAM_REPORT,
+    "unsubscribe": EmailEvent.EventType.UNSUBSCRIBE,
+}
 
-        # Find the send record
-        send = EmailSend.objects.filter(provider_message_id__startswith=sg_message_id).first()
-        if not send:
-            continue
+MAILGUN_EVENTS = {
+    "delivered": EmailEvent.EventType.DELIVERED,
+    "opened": EmailEvent.EventType.OPEN,
+    "clicked": EmailEvent.EventType.CLICK,
+    "failed": EmailEvent.EventType.BOUNCE,
+    "complained": EmailEvent.EventType.SPAM_REPORT,
+    "unsubscribed": EmailEvent.EventType.UNSUBSCRIBE,
+}
 
-        # Map SendGrid events to our event types
-        event_map = {
-            "delivered": (EmailEvent.EventType.DELIVERED, "mark_delivered"),
-            "open": (EmailEvent.EventType.OPEN, "mark_opened"),
-            "click": (EmailEvent.EventType.CLICK, "mark_clicked"),
-            "bounce": (EmailEvent.EventType.BOUNCE, None),
-            "dropped": (EmailEvent.EventType.DROPPED, None),
-            "spamreport": (EmailEvent.EventType.SPAM_REPORT, None),
-            "unsubscribe": (EmailEvent.EventType.UNSUBSCRIBE, None),
-        }
+SES_EVENTS = {
+    "Delivery": EmailEvent.EventType.DELIVERED,
+    "Bounce": EmailEvent.EventType.BOUNCE,
+    "Complaint": EmailEvent.EventType.SPAM_REPORT,
+}
 
-        if event_type not in event_map:
-            continue
 
-        our_event_type, method = event_map[event_type]
+def _process_sendgrid_webhook(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Process a batch of SendGrid webhook events."""
+    parsed = []
+    for event in events:
+        event_type = SENDGRID_EVENTS.get(event.get("event"))
+        sg_message_id = (event.get("sg_message_id") or "").split(".")[0]
+        tracking_id = event.get("tracking_id") or ""
+
+        if event_type is None or not (sg_message_id or tracking_id):
+            continue
 
-        # Create event record
-        EmailEvent.objects.create(
-            send=send,
-            event_type=our_event_type,
-            timestamp=timezone.datetime.fromtimestamp(event.get("timestamp", 0), tz=timezone.utc),
+        parsed.append(ProviderEvent(
+            event_type=event_type,
+            timestamp=_event_time(event.get("timestamp")),
+            tracking_id=tracking_id,
+            message_id=sg_message_id,
+            email=event.get("email", ""),
+            provider_event_id=event.get("sg_event_id", ""),
             url=event.get("url", ""),
             ip_address=event.get("ip", ""),
             user_agent=event.get("useragent", ""),
-            provider_event_id=event.get("sg_event_id", ""),
-            metadata=event
-        )
+            bounce_type=event.get("type", "hard"),
+            reason=event.get("reason", ""),
+            metadata=event,
+        ))
 
-        # Update send record
-        if method:
-            getattr(send, method)()
-        elif event_type == "bounce":
-            send.mark_bounced(event.get("type", "hard"), event.get("reason", ""))
-            if send.recipient:
-                send.recipient.mark_bounced(event.get("type", "hard"))
-        elif event_type == "spamreport":
-            send.status = EmailSend.Status.SPAM
-            send.save(update_fields=["status"])
-            if send.recipient:
-                send.recipient.mark_complained()
-
-        processed += 1
-
-    return {"success": True, "processed": processed}
+    return {"success": True, "processed": apply_events(parsed)}
 
 
 def _process_mailgun_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -532,56 +610,41 @@ def _process_mailgun_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
     event_data = payload.get("event-data", {})
     event_type = event_data.get("event")
     message_id = event_data.get("message", {}).get("headers", {}).get("message-id", "")
+    tracking_id = (event_data.get("user-variables") or {}).get("tracking_id", "")
 
-    if not message_id:
+    if not message_id and not tracking_id:
         return {"success": False, "error": "No message ID"}
 
-    send = EmailSend.objects.filter(provider_message_id=message_id).first()
-    if not send:
-        return {"success": False, "error": "Send not found"}
-
-    event_map = {
-        "delivered": EmailEvent.EventType.DELIVERED,
-        "opened": EmailEvent.EventType.OPEN,
-        "clicked": EmailEvent.EventType.CLICK,
-        "failed": EmailEvent.EventType.BOUNCE,
-        "complained": EmailEvent.EventType.SPAM_REPORT,
-        "unsubscribed": EmailEvent.EventType.UNSUBSCRIBE,
-    }
-
-    if event_type not in event_map:
+    if event_type not in MAILGUN_EVENTS:
         return {"success": False, "error": f"Unknown event type: {event_type}"}
 
-    # Create event
-    EmailEvent.objects.create(
-        send=send,
-        event_type=event_map[event_type],
-        timestamp=timezone.datetime.fromtimestamp(event_data.get("timestamp", 0), tz=timezone.utc),
+    client_info = event_data.get("client-info", {})
+    geolocation = event_data.get("geolocation", {})
+    severity = event_data.get("severity", "permanent")
+    event = ProviderEvent(
+        event_type=MAILGUN_EVENTS[event_type],
+        timestamp=_event_time(event_data.get("timestamp")),
+        tracking_id=tracking_id,
+        message_id=message_id,
+        email=event_data.get("recipient", ""),
+        provider_event_id=event_data.get("id", ""),
         url=event_data.get("url", ""),
         ip_address=event_data.get("ip", ""),
-        user_agent=event_data.get("client-info", {}).get("user-agent", ""),
-        country=event_data.get("geolocation", {}).get("country", ""),
-        city=event_data.get("geolocation", {}).get("city", ""),
-        device_type=event_data.get("client-info", {}).get("device-type", ""),
-        client_name=event_data.get("client-info", {}).get("client-name", ""),
-        client_os=event_data.get("client-info", {}).get("client-os", ""),
-        metadata=event_data
+        user_agent=client_info.get("user-agent", ""),
+        bounce_type="hard" if severity == "permanent" else "soft",
+        reason=event_data.get("reason", ""),
+        details={
+            "country": geolocation.get("country", ""),
+            "city": geolocation.get("city", ""),
+            "device_type": client_info.get("device-type", ""),
+            "client_name": client_info.get("client-name", ""),
+            "client_os": client_info.get("client-os", ""),
+        },
+        metadata=event_data,
     )
 
-    # Update send
-    if event_type == "delivered":
-        send.mark_delivered()
-    elif event_type == "opened":
-        send.mark_opened()
-    elif event_type == "clicked":
-        send.mark_clicked(event_data.get("url", ""))
-    elif event_type == "failed":
-        severity = event_data.get("severity", "permanent")
-        bounce_type = "hard" if severity == "permanent" else "soft"
-        send.mark_bounced(bounce_type, event_data.get("reason", ""))
-        if send.recipient:
-            send.recipient.mark_bounced(bounce_type)
-
+    if not apply_events([event]):
+        return {"success": False, "error": "Send not found or event already processed"}
     return {"success": True, "event_type": event_type}
 
 
@@ -605,44 +668,24 @@ def _process_ses_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
     if not message_id:
         return {"success": False, "error": "No message ID"}
 
-    send = EmailSend.objects.filter(provider_message_id=message_id).first()
-    if not send:
-        return {"success": False, "error": "Send not found"}
-
-    if notification_type == "Delivery":
-        send.mark_delivered()
-        EmailEvent.objects.create(
-            send=send,
-            event_type=EmailEvent.EventType.DELIVERED,
-            timestamp=timezone.now(),
-            metadata=message
-        )
-
-    elif notification_type == "Bounce":
-        bounce = message.get("bounce", {})
-        bounce_type = "hard" if bounce.get("bounceType") == "Permanent" else "soft"
-        send.mark_bounced(bounce_type, bounce.get("bouncedRecipients", [{}])[0].get("diagnosticCode", ""))
-        if send.recipient:
-            send.recipient.mark_bounced(bounce_type)
-        EmailEvent.objects.create(
-            send=send,
-            event_type=EmailEvent.EventType.BOUNCE,
-            timestamp=timezone.now(),
-            metadata=message
-        )
-
-    elif notification_type == "Complaint":
-        send.status = EmailSend.Status.SPAM
-        send.save(update_fields=["status"])
-        if send.recipient:
-            send.recipient.mark_complained()
-        EmailEvent.objects.create(
-            send=send,
-            event_type=EmailEvent.EventType.SPAM_REPORT,
-            timestamp=timezone.now(),
-            metadata=message
-        )
+    if notification_type not in SES_EVENTS:
+        return {"success": True, "notification_type": notification_type}
+
+    bounce = message.get("bounce", {})
+    event = ProviderEvent(
+        event_type=SES_EVENTS[notification_type],
+        timestamp=timezone.now(),
+        message_id=message_id,
+        email=(mail.get("destination") or [""])[0],
+        # SNS notification id; redeliveries of one notification share it
+        provider_event_id=payload.get("MessageId", ""),
+        bounce_type="hard" if bounce.get("bounceType") == "Permanent" else "soft",
+        reason=(bounce.get("bouncedRecipients") or [{}])[0].get("diagnosticCode", ""),
+        metadata=message,
+    )
 
+    if not apply_events([event]):
+        return {"success": False, "error": "Send not found or event already processed"}
     return {"success": True, "notification_type": notification_type}
 
 
@@ -750,7 +793,7 @@ def retry_failed_sends(max_age_hours: int = 24) -> Dict[str, Any]:
     failed_sends = EmailSend.objects.filter(
         status=EmailSend.Status.FAILED,
         created_at__gte=cutoff,
-        retry_count__lt=models.F("max_retries")
+        retry_count__lt=F("max_retries")
     )[:100]
 
     queued = 0
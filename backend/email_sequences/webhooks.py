@@ -174,8 +174,10 @@ def _get_mailgun_api_key(payload) -> Optional[str]:
 
         if message_id:
             from .models import EmailSend
+            bare_id = message_id.strip("<>")
+            # Stored as returned by the send API, with angle brackets
             send = EmailSend.objects.filter(
-                provider_message_id=message_id
+                provider_message_id__in=[bare_id, f"<{bare_id}>"]
             ).select_related("provider").first()
             if send and send.provider:
                 return send.provider.api_key
@@ -9,3 +9,4 @@ class FlowcubeConfig(AppConfig):
     def ready(self):
         # Import tasks to register with Celery
         import flowcube.tasks  # noqa
+        import flowcube.signals  # noqa: F401
@@ -10,6 +10,8 @@ import logging
 
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from workflows.engine.broadcast import mark_watched
+
 logger = logging.getLogger("flowcube.ws")
 
 
@@ -29,6 +31,8 @@ class ExecutionProgressConsumer(AsyncWebsocketConsumer):
         # Join group
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
+        # Executor skips broadcasting for executions nobody is watching
+        await mark_watched(self.execution_id)
 
         logger.info("WS connected: %s", self.group_name)
 
@@ -42,6 +46,7 @@ class ExecutionProgressConsumer(AsyncWebsocketConsumer):
             try:
                 data = json.loads(text_data)
                 if data.get("type") == "ping":
+                    await mark_watched(self.execution_id)
                     await self.send(text_data=json.dumps({"type": "pong"}))
             except json.JSONDecodeError:
                 pass
@@ -55,3 +60,9 @@ class ExecutionProgressConsumer(AsyncWebsocketConsumer):
         # Remove the internal 'type' field used by channels routing
         payload = {k: v for k, v in event.items() if k != "type"}
         await self.send(text_data=json.dumps(payload, default=str))
+
+    async def execution_progress_batch(self, event):
+        """Forward a coalesced batch of progress events as one frame."""
+        await self.send(text_data=json.dumps(
+            {"event_type": "batch", "events": event["events"]}, default=str,
+        ))
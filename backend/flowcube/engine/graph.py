@@ -0,0 +1,93 @@
+"""
+Compiled chatbot graphs for ChatbotRuntime.
+
+A chatbot step only needs "what comes after this node on this handle" and
+"where does a new conversation start"; both are resolved once per graph
+revision and shared by every runtime in the process through a PlanCache,
+keyed like the workflow engine's plans by ``(workflow_id, updated_at)``.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+
+from workflows.engine.plan import PlanCache
+from workflows.models import Workflow
+
+CHATBOT_GRAPH_CACHE_SIZE = 256  # Compiled chatbot graphs kept per process
+
+TRIGGER_TYPES = frozenset({"whatsapp_trigger", "webhook_trigger", "schedule"})
+INPUT_NODE_TYPES = frozenset({"text_input", "email_input", "phone_input", "choice"})
+
+
+class ChatbotGraph:
+    """
+    Immutable, indexed view of a chatbot workflow graph.
+
+    Attributes:
+        nodes_by_id: node_id -> node dict
+        start_node: first trigger node, else first node without incoming
+            edges, else the first node (None for an empty graph)
+        input_node_ids: ids of nodes that wait for user input
+    """
+
+    def __init__(self, graph: dict):
+        nodes: list[dict] = list(graph.get("nodes", []))
+        edges: list[dict] = graph.get("edges", [])
+        self.nodes_by_id: dict[str, dict] = {node["id"]: node for node in nodes}
+
+        # Edges whose target exists, in declaration order, by source and by (source, handle)
+        self._out: dict[str, tuple[dict, ...]] = {}
+        self._out_by_handle: dict[tuple[str, Any], tuple[dict, ...]] = {}
+        for edge in edges:
+            target = self.nodes_by_id.get(edge["target"])
+            if target is None:
+                continue
+            item = {"node": target, "edge": edge}
+            source = edge["source"]
+            handle = edge.get("sourceHandle", "default")
+            self._out[source] = self._out.get(source, ()) + (item,)
+            self._out_by_handle[(source, handle)] = self._out_by_handle.get((source, handle), ()) + (item,)
+
+        self.start_node: Optional[dict] = self._find_start_node(nodes, edges)
+        self.input_node_ids: frozenset[str] = frozenset(
+            node["id"] for node in nodes if node.get("type") in INPUT_NODE_TYPES
+        )
+
+    @staticmethod
+    def _find_start_node(nodes: list[dict], edges: list[dict]) -> Optional[dict]:
+        for node in nodes:
+            if node.get("type") in TRIGGER_TYPES:
+                return node
+        target_ids = {edge["target"] for edge in edges}
+        for node in nodes:
+            if node["id"] not in target_ids:
+                return node
+        return nodes[0] if nodes else None
+
+    def next_nodes(self, node_id: str, output_handle: str = "default") -> list[dict]:
+        """
+        ``{"node", "edge"}`` items leaving *node_id*.  The ``default``
+        handle follows every outgoing edge; any other handle only its own.
+        """
+        if output_handle == "default":
+            return list(self._out.get(node_id, ()))
+        return list(self._out_by_handle.get((node_id, output_handle), ()))
+
+
+chatbot_graph_cache = PlanCache(maxsize=CHATBOT_GRAPH_CACHE_SIZE, compile=ChatbotGraph)
+
+
+def chatbot_graph(workflow_id: Any) -> ChatbotGraph:
+    """
+    Compiled graph for the current draft of *workflow_id*.
+
+    Only ``updated_at`` is read on a cache hit; the graph JSON is loaded
+    when a revision is seen for the first time.
+    """
+    updated_at = Workflow.objects.filter(id=workflow_id).values_list("updated_at", flat=True).get()
+    revision = f"draft:{updated_at.isoformat() if updated_at else ''}"
+    cached = chatbot_graph_cache.get(workflow_id, revision)
+    if cached is not None:
+        return cached
+    graph = Workflow.objects.filter(id=workflow_id).values_list("graph", flat=True).get()
+    return chatbot_graph_cache.get_or_compile(workflow_id, revision, graph or {"nodes": [], "edges": []})
@@ -14,10 +14,13 @@ from django.conf import settings
 from django.db import transaction
 from asgiref.sync import sync_to_async
 
+from flowcube.engine.graph import INPUT_NODE_TYPES, ChatbotGraph, chatbot_graph
+from flowcube.engine.session_store import hot_sessions_enabled, load_hot_session, store_hot_session
 from flowcube.models import ChatSession, ChatMessage, HandoffRequest
-from chatcube.engine_client import EngineClient as _EngineClient
+from chatcube.engine_client import AsyncEngineClient as _AsyncEngineClient
 from chatcube.models import WhatsAppInstance as _WhatsAppInstance
 from flowcube.integrations.http_client import GenericHTTPClient, WebhookClient
+from workflows.engine.worker import worker_loop
 from workflows.models import Workflow
 
 logger = logging.getLogger("flowcube.runtime")
@@ -32,7 +35,7 @@ class ChatbotRuntime:
         "text_response", "image_response", "whatsapp_template",
         "choice", "text_input", "email_input", "phone_input",
     }
-    INPUT_NODE_TYPES = {"text_input", "email_input", "phone_input", "choice"}
+    INPUT_NODE_TYPES = INPUT_NODE_TYPES
     HANDOFF_KEYWORDS = [
         "falar com humano", "falar com pessoa", "atendente",
         "falar com alguém", "talk to human", "agent", "operador",
@@ -41,9 +44,13 @@ class ChatbotRuntime:
     def __init__(self, workflow_id: str):
         self.workflow_id = workflow_id
         self._workflow = None
-        self._graph = None
-        self._nodes_by_id = {}
+        self._graph: Optional[ChatbotGraph] = None
         self._http_client = GenericHTTPClient()
+        # Writes of the current turn, flushed together by _flush_turn()
+        self._session_is_new = False
+        self._dirty_fields: set = set()
+        self._pending_messages: List[ChatMessage] = []
+        self._pending_handoff: Optional[str] = None
 
     @property
     async def workflow(self) -> Workflow:
@@ -52,76 +59,71 @@ class ChatbotRuntime:
         return self._workflow
 
     @property
-    async def graph(self) -> Dict:
+    async def graph(self) -> ChatbotGraph:
+        # Compiled once per workflow revision and shared across runtimes
         if self._graph is None:
-            wf = await self.workflow
-            self._graph = wf.graph or {"nodes": [], "edges": []}
-            self._nodes_by_id = {node["id"]: node for node in self._graph.get("nodes", [])}
+            self._graph = await sync_to_async(chatbot_graph)(self.workflow_id)
         return self._graph
 
     def get_node(self, node_id: str) -> Optional[Dict]:
-        return self._nodes_by_id.get(node_id)
+        return self._graph.nodes_by_id.get(node_id) if self._graph else None
 
     def find_start_node(self) -> Optional[Dict]:
-        graph = self._graph
-        if not graph:
-            return None
-        nodes = graph.get("nodes", [])
-        edges = graph.get("edges", [])
-        trigger_types = {"whatsapp_trigger", "webhook_trigger", "schedule"}
-        for node in nodes:
-            if node.get("type") in trigger_types:
-                return node
-        target_ids = {edge["target"] for edge in edges}
-        for node in nodes:
-            if node["id"] not in target_ids:
-                return node
-        return nodes[0] if nodes else None
+        return self._graph.start_node if self._graph else None
 
     def get_next_nodes(self, current_node_id: str, output_handle: str = "default") -> List[Dict]:
-        graph = self._graph
-        next_nodes = []
-        for edge in graph.get("edges", []):
-            if edge["source"] == current_node_id:
-                edge_handle = edge.get("sourceHandle", "default")
-                if edge_handle == output_handle or output_handle == "default":
-                    target_node = self.get_node(edge["target"])
-                    if target_node:
-                        next_nodes.append({"node": target_node, "edge": edge})
-        return next_nodes
-
-    async def get_or_create_session(self, phone: str, instance: str = "", contact_name: str = "") -> ChatSession:
-        wf = await self.workflow
-        session = await sync_to_async(
-            ChatSession.objects.filter(
-                workflow=wf, contact_phone=phone,
-                status__in=["active", "waiting_input", "waiting_ai"],
-            ).first
-        )()
+        return self._graph.next_nodes(current_node_id, output_handle)
+
+    async def _load_or_start_session(self, phone: str, instance: str = "", contact_name: str = "") -> ChatSession:
+        """Active session for *phone*, or a new unsaved one that _flush_turn() inserts."""
+        session = None
+        if hot_sessions_enabled():
+            session = await load_hot_session(self.workflow_id, phone)
+        if session is None:
+            session = await sync_to_async(
+                ChatSession.objects.filter(
+                    workflow_id=self.workflow_id, contact_phone=phone,
+                    status__in=["active", "waiting_input", "waiting_ai"],
+                ).first
+            )()
         if session:
             return session
         await self.graph
         start_node = self.find_start_node()
-        session = await sync_to_async(ChatSession.objects.create)(
-            workflow=wf, contact_phone=phone, contact_name=contact_name,
+        self._session_is_new = True
+        return ChatSession(
+            workflow_id=self.workflow_id, contact_phone=phone, contact_name=contact_name,
             whatsapp_instance=instance,
             current_node_id=start_node["id"] if start_node else "",
             status=ChatSession.Status.ACTIVE,
         )
-        logger.info(f"Created new session {session.id} for {phone}")
+
+    async def get_or_create_session(self, phone: str, instance: str = "", contact_name: str = "") -> ChatSession:
+        session = await self._load_or_start_session(phone, instance, contact_name)
+        await self._flush_turn(session)
         return session
 
     async def process_message(
         self, phone: str, message_text: str, instance: str = "",
         contact_name: str = "", message_id: str = ""
     ) -> List[Dict]:
-        responses = []
-        session = await self.get_or_create_session(phone, instance, contact_name)
+        session = await self._load_or_start_session(phone, instance, contact_name)
         await self.graph
-        await self._save_message(session=session, content=message_text, direction="inbound", whatsapp_message_id=message_id)
+        variables_before = json.dumps(session.variables, sort_keys=True, default=str)
+        try:
+            return await self._run_turn(session, message_text, message_id)
+        finally:
+            # Nodes mutate session.variables in place
+            if json.dumps(session.variables, sort_keys=True, default=str) != variables_before:
+                self._dirty_fields.add("variables")
+            await self._flush_turn(session)
+
+    async def _run_turn(self, session: ChatSession, message_text: str, message_id: str) -> List[Dict]:
+        responses = []
+        self._record_message(session, content=message_text, direction="inbound", whatsapp_message_id=message_id)
 
         if self._should_handoff(message_text):
-            await self._trigger_handoff(session, HandoffRequest.Reason.EXPLICIT_REQUEST)
+            self._trigger_handoff(session, HandoffRequest.Reason.EXPLICIT_REQUEST)
             responses.append({"type": "text", "content": "Entendi! Vou transferir você para um de nossos atendentes. Aguarde um momento."})
             return responses
 
@@ -130,7 +132,7 @@ class ChatbotRuntime:
             current_node = self.find_start_node()
             if current_node:
                 session.current_node_id = current_node["id"]
-                await sync_to_async(session.save)(update_fields=["current_node_id"])
+                self._dirty_fields.add("current_node_id")
 
         if not current_node:
             logger.warning(f"No nodes found for workflow {self.workflow_id}")
@@ -139,7 +141,7 @@ class ChatbotRuntime:
         node_type = current_node.get("type", "")
         node_data = current_node.get("data", {})
 
-        if node_type in self.INPUT_NODE_TYPES:
+        if current_node["id"] in self._graph.input_node_ids:
             valid, extracted_value = self._validate_input(message_text, node_type, node_data)
             if valid:
                 var_name = node_data.get("variable_name", f'input_{current_node["id"]}')
@@ -150,33 +152,32 @@ class ChatbotRuntime:
                     session.current_node_id = current_node["id"]
                 else:
                     session.status = ChatSession.Status.COMPLETED
-                await sync_to_async(session.save)(update_fields=["current_node_id", "variables", "status"])
+                self._dirty_fields.update(("current_node_id", "variables", "status"))
             else:
                 error_msg = node_data.get("error_message", "Por favor, tente novamente.")
                 responses.append({"type": "text", "content": error_msg})
                 return responses
 
         while current_node:
-            node_type = current_node.get("type", "")
             response = await self._execute_node(current_node, session)
             if response:
                 responses.append(response)
-            if node_type in self.INPUT_NODE_TYPES:
+            if current_node["id"] in self._graph.input_node_ids:
                 session.status = ChatSession.Status.WAITING_INPUT
                 session.current_node_id = current_node["id"]
-                await sync_to_async(session.save)(update_fields=["current_node_id", "status"])
+                self._dirty_fields.update(("current_node_id", "status"))
                 break
             next_items = self.get_next_nodes(current_node["id"])
             if not next_items:
                 session.status = ChatSession.Status.COMPLETED
-                await sync_to_async(session.save)(update_fields=["status"])
+                self._dirty_fields.add("status")
                 break
             if len(next_items) > 1:
                 current_node = await self._evaluate_conditions(next_items, session)
             else:
                 current_node = next_items[0]["node"]
             session.current_node_id = current_node["id"] if current_node else ""
-            await sync_to_async(session.save)(update_fields=["current_node_id"])
+            self._dirty_fields.add("current_node_id")
 
         return responses
 
@@ -477,22 +478,53 @@ class ChatbotRuntime:
         message_lower = message_text.lower()
         return any(keyword in message_lower for keyword in self.HANDOFF_KEYWORDS)
 
-    async def _trigger_handoff(self, session: ChatSession, reason: str):
+    def _trigger_handoff(self, session: ChatSession, reason: str):
         session.status = ChatSession.Status.HANDOFF
         session.handoff_reason = reason
-        await sync_to_async(session.save)(update_fields=["status", "handoff_reason"])
-        await sync_to_async(HandoffRequest.objects.create)(session=session, reason=reason, collected_variables=session.variables)
+        self._dirty_fields.update(("status", "handoff_reason"))
+        self._pending_handoff = reason
         logger.info(f"Handoff triggered for session {session.id}: {reason}")
 
-    async def _save_message(self, session: ChatSession, content: str, direction: str, message_type: str = "text", whatsapp_message_id: str = ""):
-        await sync_to_async(ChatMessage.objects.create)(session=session, direction=direction, message_type=message_type, content=content, whatsapp_message_id=whatsapp_message_id)
+    def _record_message(
+        self, session: ChatSession, content: str, direction: str, message_type: str = "text",
+        whatsapp_message_id: str = "",
+    ):
+        self._pending_messages.append(ChatMessage(
+            session=session, direction=direction, message_type=message_type, content=content,
+            whatsapp_message_id=whatsapp_message_id,
+        ))
         session.message_count += 1
         session.last_message_at = timezone.now()
-        await sync_to_async(session.save)(update_fields=["message_count", "last_message_at"])
+        self._dirty_fields.update(("message_count", "last_message_at"))
+
+    def _write_turn(self, session: ChatSession):
+        with transaction.atomic():
+            if self._session_is_new:
+                session.save()
+            elif self._dirty_fields:
+                session.save(update_fields=sorted(self._dirty_fields | {"updated_at"}))
+            if self._pending_messages:
+                ChatMessage.objects.bulk_create(self._pending_messages)
+            if self._pending_handoff:
+                HandoffRequest.objects.create(
+                    session=session, reason=self._pending_handoff, collected_variables=session.variables,
+                )
+
+    async def _flush_turn(self, session: ChatSession):
+        """Persist the turn: one session write plus the turn's messages, in one transaction."""
+        try:
+            await sync_to_async(self._write_turn)(session)
+        finally:
+            self._session_is_new = False
+            self._dirty_fields = set()
+            self._pending_messages = []
+            self._pending_handoff = None
+        if hot_sessions_enabled():
+            await store_hot_session(session)
 
 
 async def send_responses(instance: str, to: str, responses: List[Dict]) -> None:
-    """Send responses via ChatCube EngineClient."""
+    """Send responses via the ChatCube engine, as one ordered batch."""
     from asgiref.sync import sync_to_async
 
     # Resolve engine_instance_id from instance name
@@ -506,26 +538,46 @@ async def send_responses(instance: str, to: str, responses: List[Dict]) -> None:
         logger.error(f"No engine_instance_id for instance {instance}")
         return
 
-    client = _EngineClient()
-
+    messages = []
     for response in responses:
-        try:
-            msg_type = response.get("type", "text")
-            content = response.get("content", response.get("text", ""))
-            media_url = response.get("url")
-            metadata = None
-
-            if msg_type == "buttons":
-                metadata = {"buttons": response.get("buttons", [])}
-                content = response.get("text", "")
-
-            await sync_to_async(client.send_message)(
-                engine_id,
-                to=to,
-                message_type=msg_type if msg_type in ("text", "image", "audio", "document") else "text",
-                content=content,
-                media_url=media_url,
-                metadata=metadata,
-            )
-        except Exception as e:
-            logger.error(f"Failed to send response: {e}")
+        msg_type = response.get("type", "text")
+        content = response.get("content", response.get("text", ""))
+        metadata = None
+
+        if msg_type == "buttons":
+            metadata = {"buttons": response.get("buttons", [])}
+            content = response.get("text", "")
+
+        message_type = msg_type if msg_type in ("text", "image", "audio", "document") else "text"
+        media_url = response.get("url")
+        # The engine rejects the whole batch if any message is invalid
+        if (message_type == "text" and not content) or (message_type != "text" and not media_url):
+            logger.error(f"Skipping invalid {msg_type} response for {to}")
+            continue
+
+        messages.append({
+            "to": to,
+            "message_type": message_type,
+            "content": content,
+            "media_url": media_url,
+            "metadata": metadata,
+        })
+
+    if not messages:
+        return
+
+    try:
+        # On the worker loop every turn shares one pooled engine client
+        client = worker_loop.resource("chatcube_engine", _AsyncEngineClient)
+        if client is not None:
+            results = await client.send_messages(engine_id, messages)
+        else:
+            async with _AsyncEngineClient(max_connections=1) as client:
+                results = await client.send_messages(engine_id, messages)
+    except Exception as e:
+        logger.error(f"Failed to send responses: {e}")
+        return
+
+    for result in results:
+        if not result.get("success"):
+            logger.error(f"Failed to send response: {result.get('error')}")
@@ -0,0 +1,55 @@
+"""
+Hot store for active chatbot sessions.
+
+When FLOWCUBE_HOT_SESSIONS is on, ChatbotRuntime keeps each active
+session's row in the Django cache (Redis) after every turn, so the next
+inbound message skips the session lookup query.  Any ChatSession save or
+delete evicts the entry (see flowcube.signals), so changes made outside
+the runtime — an agent taking over, a session closed from the API — are
+never shadowed by a stale copy.
+"""
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from flowcube.models import ChatSession
+
+HOT_SESSION_TTL = 15 * 60   # Idle conversations fall back to the database
+ACTIVE_STATUSES = (
+    ChatSession.Status.ACTIVE,
+    ChatSession.Status.WAITING_INPUT,
+    ChatSession.Status.WAITING_AI,
+)
+
+
+def hot_sessions_enabled() -> bool:
+    return getattr(settings, "FLOWCUBE_HOT_SESSIONS", False)
+
+
+def _key(workflow_id: Any, phone: str) -> str:
+    return f"flowcube:chat_session:{workflow_id}:{phone}"
+
+
+def _attnames():
+    return [field.attname for field in ChatSession._meta.concrete_fields]
+
+
+async def load_hot_session(workflow_id: Any, phone: str) -> Optional[ChatSession]:
+    values = await cache.aget(_key(workflow_id, phone))
+    if values is None:
+        return None
+    names = _attnames()
+    return ChatSession.from_db("default", names, [values.get(name) for name in names])
+
+
+async def store_hot_session(session: ChatSession) -> None:
+    key = _key(session.workflow_id, session.contact_phone)
+    if session.status not in ACTIVE_STATUSES:
+        await cache.adelete(key)
+        return
+    await cache.aset(key, {name: getattr(session, name) for name in _attnames()}, timeout=HOT_SESSION_TTL)
+
+
+def evict_hot_session(session: ChatSession) -> None:
+    cache.delete(_key(session.workflow_id, session.contact_phone))
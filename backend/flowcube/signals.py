@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from workflows.models import Workflow
+
+from .models import ChatSession
+
+
+@receiver(post_save, sender=Workflow)
+@receiver(post_delete, sender=Workflow)
+def invalidate_chatbot_graphs(sender, instance, **kwargs):
+    from .engine.graph import chatbot_graph_cache
+
+    chatbot_graph_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=ChatSession)
+@receiver(post_delete, sender=ChatSession)
+def evict_hot_chat_session(sender, instance, **kwargs):
+    from .engine.session_store import evict_hot_session, hot_sessions_enabled
+
+    if hot_sessions_enabled():
+        evict_hot_session(instance)
@@ -30,6 +30,7 @@ def process_webhook_async(self, workflow_id: str, payload: Dict[str, Any]):
 
         from flowcube.engine.runtime import ChatbotRuntime, send_responses
         from asgiref.sync import async_to_sync
+        from workflows.engine.worker import worker_loop
 
         # Generic webhook processing — source-agnostic
         source = payload.get('source', 'unknown')
@@ -61,7 +62,8 @@ def process_webhook_async(self, workflow_id: str, payload: Dict[str, Any]):
                 )
 
                 if responses:
-                    async_to_sync(send_responses)(instance, phone, responses)
+                    # On the worker loop, so the engine client is reused across turns
+                    worker_loop.run(send_responses(instance, phone, responses))
 
                 logger.info(f"Processed message from {phone}, {len(responses)} responses sent")
                 return {'status': 'success', 'responses': len(responses)}
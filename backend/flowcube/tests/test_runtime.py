@@ -0,0 +1,64 @@
+from django.test import SimpleTestCase
+
+from flowcube.engine.graph import ChatbotGraph
+from workflows.engine.plan import PlanCache
+
+
+def node(node_id, node_type='text_response'):
+    return {'id': node_id, 'type': node_type, 'data': {}}
+
+
+def edge(source, target, handle=None):
+    e = {'id': f'{source}-{target}', 'source': source, 'target': target}
+    if handle is not None:
+        e['sourceHandle'] = handle
+    return e
+
+
+class ChatbotGraphTestCase(SimpleTestCase):
+    def setUp(self):
+        self.graph = {
+            'nodes': [
+                node('hello'),
+                node('ask', 'choice'),
+                node('yes'),
+                node('no'),
+            ],
+            'edges': [
+                edge('hello', 'ask'),
+                edge('ask', 'yes', 'choice_0'),
+                edge('ask', 'no', 'choice_1'),
+                edge('ask', 'missing', 'choice_2'),
+            ],
+        }
+
+    def test_start_node_without_trigger(self):
+        self.assertEqual(ChatbotGraph(self.graph).start_node['id'], 'hello')
+
+    def test_trigger_node_is_start(self):
+        self.graph['nodes'].append(node('trigger', 'whatsapp_trigger'))
+        self.assertEqual(ChatbotGraph(self.graph).start_node['id'], 'trigger')
+
+    def test_empty_graph(self):
+        graph = ChatbotGraph({'nodes': [], 'edges': []})
+        self.assertIsNone(graph.start_node)
+        self.assertEqual(graph.next_nodes('anything'), [])
+
+    def test_default_handle_follows_every_edge(self):
+        items = ChatbotGraph(self.graph).next_nodes('ask')
+        self.assertEqual([i['node']['id'] for i in items], ['yes', 'no'])
+
+    def test_specific_handle(self):
+        items = ChatbotGraph(self.graph).next_nodes('ask', 'choice_1')
+        self.assertEqual([i['node']['id'] for i in items], ['no'])
+        self.assertEqual(items[0]['edge']['sourceHandle'], 'choice_1')
+
+    def test_input_nodes(self):
+        self.assertEqual(ChatbotGraph(self.graph).input_node_ids, frozenset({'ask'}))
+
+    def test_cached_per_revision(self):
+        cache = PlanCache(compile=ChatbotGraph)
+        first = cache.get_or_compile('wf', 'draft:1', self.graph)
+        self.assertIsInstance(first, ChatbotGraph)
+        self.assertIs(cache.get('wf', 'draft:1'), first)
+        self.assertIsNone(cache.get('wf', 'draft:2'))
@@ -1,7 +1,28 @@
+"""
+Redis list buffer between the track endpoint and the database.
+
+push_event() LPUSHes onto BUFFER_KEY; flush_buffer() drains it in batches.
+Several flush tasks may run at once: each claims a batch atomically (a Lua
+script moves up to BATCH_SIZE events into a per-consumer in-flight list
+guarded by a lease key) and acknowledges it by deleting that list once the
+events are in the database.  Batches whose lease expired — a worker died
+mid-flush — are pushed back onto the buffer by the next flush, so delivery
+is at least once; events carry a stable id and are inserted with
+ignore_conflicts, so a redelivered batch does not duplicate rows.
+Requeued batches go to the head of the buffer, so a batch that keeps
+failing does not block the events behind it.  Session counters are only
+updated once a batch is acknowledged, so a redelivery cannot count an
+event twice.
+
+Payloads that cannot be parsed, that name an unknown project, or that the
+database rejects (found by bisecting the failed insert) go to
+DEAD_LETTER_KEY instead of being dropped.  buffer_stats() reports backlog, in-flight and dead-letter depth.
+"""
 import json
 import logging
 import uuid
 from datetime import datetime
+from functools import lru_cache
 
 from django.conf import settings
 from django.utils import timezone
@@ -10,89 +31,297 @@ import redis
 logger = logging.getLogger(__name__)
 
 BUFFER_KEY = "funnelcube:event_buffer"
+INFLIGHT_KEY = "funnelcube:event_buffer:inflight:{consumer}"
+LEASE_KEY = "funnelcube:event_buffer:lease:{consumer}"
+CONSUMERS_KEY = "funnelcube:event_buffer:consumers"
+DEAD_LETTER_KEY = "funnelcube:event_buffer:dead"
+
 BATCH_SIZE = 4000
+LEASE_TIMEOUT = 300        # Seconds a claimed batch may stay unacknowledged
+DEAD_LETTER_MAX = 10000    # Newest unparsable payloads kept for inspection
+
+# Stable ids for payloads buffered before push_event() assigned one
+EVENT_ID_NAMESPACE = uuid.UUID("6f1c2b1e-5d4a-4c3b-9a8e-2f7d0c1b3a59")
+
+# KEYS: buffer, inflight, lease, consumers  ARGV: count, lease ttl, consumer
+_CLAIM_LUA = """
+local items = redis.call('LRANGE', KEYS[1], -tonumber(ARGV[1]), -1)
+if #items == 0 then
+    return items
+end
+redis.call('LTRIM', KEYS[1], 0, -#items - 1)
+for i = 1, #items, 1000 do
+    redis.call('RPUSH', KEYS[2], unpack(items, i, math.min(i + 999, #items)))
+end
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[2])
+redis.call('SADD', KEYS[4], ARGV[3])
+return items
+"""
+
+# KEYS: inflight, buffer, consumers  ARGV: consumer
+# Claims take from the tail, so requeued items go to the head
+_REQUEUE_LUA = """
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+for i = 1, #items, 1000 do
+    redis.call('LPUSH', KEYS[2], unpack(items, i, math.min(i + 999, #items)))
+end
+redis.call('DEL', KEYS[1])
+redis.call('SREM', KEYS[3], ARGV[1])
+return #items
+"""
 
 
+@lru_cache(maxsize=1)
 def _get_redis():
+    # One client (and connection pool) per process instead of per call
     redis_url = getattr(settings, "CELERY_BROKER_URL", "redis://flowcube-redis:6379/3")
     return redis.from_url(redis_url)
 
 
+@lru_cache(maxsize=1)
+def _scripts():
+    r = _get_redis()
+    return r.register_script(_CLAIM_LUA), r.register_script(_REQUEUE_LUA)
+
+
 def push_event(event_data: dict):
+    event_data.setdefault("event_id", str(uuid.uuid4()))
     r = _get_redis()
     r.lpush(BUFFER_KEY, json.dumps(event_data, default=str))
 
 
-def flush_buffer():
+def _claim_batch(consumer, count=BATCH_SIZE):
+    claim, _ = _scripts()
+    keys = [
+        BUFFER_KEY,
+        INFLIGHT_KEY.format(consumer=consumer),
+        LEASE_KEY.format(consumer=consumer),
+        CONSUMERS_KEY,
+    ]
+    items = claim(keys=keys, args=[count, LEASE_TIMEOUT, consumer])
+    # LRANGE returns newest first; process in arrival order
+    items.reverse()
+    return items
+
+
+def _ack_batch(consumer):
+    pipe = _get_redis().pipeline()
+    pipe.delete(INFLIGHT_KEY.format(consumer=consumer), LEASE_KEY.format(consumer=consumer))
+    pipe.srem(CONSUMERS_KEY, consumer)
+    pipe.execute()
+
+
+def _requeue_batch(consumer):
+    _, requeue = _scripts()
+    keys = [INFLIGHT_KEY.format(consumer=consumer), BUFFER_KEY, CONSUMERS_KEY]
+    return requeue(keys=keys, args=[consumer])
+
+
+def recover_stale_batches():
+    """Return batches whose consumer lost its lease to the buffer."""
+    r = _get_redis()
+    recovered = 0
+    for consumer in r.smembers(CONSUMERS_KEY):
+        consumer = consumer.decode() if isinstance(consumer, bytes) else consumer
+        if not r.exists(LEASE_KEY.format(consumer=consumer)):
+            count = _requeue_batch(consumer)
+            if count:
+                logger.warning("Requeued %d events from stale consumer %s", count, consumer)
+            recovered += count
+    return recovered
+
+
+def _dead_letter(entries):
+    pipe = _get_redis().pipeline(transaction=False)
+    for raw, error in entries:
+        payload = raw.decode(errors="replace") if isinstance(raw, bytes) else raw
+        pipe.lpush(DEAD_LETTER_KEY, json.dumps({
+            "payload": payload,
+            "error": error,
+            "failed_at": timezone.now().isoformat(),
+        }))
+    pipe.ltrim(DEAD_LETTER_KEY, 0, DEAD_LETTER_MAX - 1)
+    pipe.execute()
+
+
+def _insert_events(events):
+    """
+    Insert *events*; returns ``(event, error)`` for those the database rejects.
+    A failed insert is bisected so one bad row doesn't hold back the rest.
+    """
+    from django.db import DataError, IntegrityError, transaction
+
+    from funnelcube.models import AnalyticsEvent
+
+    if not events:
+        return []
+    try:
+        with transaction.atomic():
+            AnalyticsEvent.objects.bulk_create(events, ignore_conflicts=True)
+        return []
+    except (DataError, IntegrityError, ValueError, TypeError) as exc:
+        if len(events) == 1:
+            return [(events[0], f"{type(exc).__name__}: {exc}")]
+    middle = len(events) // 2
+    return _insert_events(events[:middle]) + _insert_events(events[middle:])
+
+
+def _build_event(raw, data):
     from funnelcube.models import AnalyticsEvent
+
+    event_id = data.get("event_id") or uuid.uuid5(EVENT_ID_NAMESPACE, raw)
+    return AnalyticsEvent(
+        id=event_id,
+        project_id=uuid.UUID(str(data["project_id"])),
+        name=data["name"],
+        device_id=data.get("device_id", ""),
+        profile_id=data.get("profile_id", ""),
+        session_id=data.get("session_id", ""),
+        path=data.get("path", ""),
+        origin=data.get("origin", ""),
+        referrer=data.get("referrer", ""),
+        referrer_name=data.get("referrer_name", ""),
+        referrer_type=data.get("referrer_type", ""),
+        revenue=data.get("revenue", 0),
+        duration=data.get("duration", 0),
+        properties=data.get("properties", {}),
+        country=data.get("country", ""),
+        city=data.get("city", ""),
+        region=data.get("region", ""),
+        longitude=data.get("longitude"),
+        latitude=data.get("latitude"),
+        os=data.get("os", ""),
+        os_version=data.get("os_version", ""),
+        browser=data.get("browser", ""),
+        browser_version=data.get("browser_version", ""),
+        device=data.get("device", ""),
+        brand=data.get("brand", ""),
+        model_name=data.get("model_name", ""),
+        created_at=data.get("created_at", timezone.now()),
+    )
+
+
+def _flush_batch(consumer):
+    """Claim, persist and acknowledge one batch; returns (claimed, created)."""
+    from funnelcube.models import AnalyticsProject
     from funnelcube.services.session_manager import update_session
 
-    r = _get_redis()
-    events_to_create = []
-    count = 0
+    items = _claim_batch(consumer)
+    if not items:
+        return 0, 0
+
+    try:
+        parsed = []
+        dead = []
+
+        for raw in items:
+            try:
+                if isinstance(raw, bytes):
+                    raw = raw.decode()
+                data = json.loads(raw)
+                parsed.append((raw, data, _build_event(raw, data)))
+            except (ValueError, TypeError, KeyError, AttributeError) as exc:
+                dead.append((raw, f"{type(exc).__name__}: {exc}"))
+
+        # A deleted project would fail the whole insert on its foreign key
+        project_ids = {event.project_id for _, _, event in parsed}
+        known_projects = set(
+            AnalyticsProject.objects.filter(id__in=project_ids).values_list("id", flat=True)
+        )
+
+        accepted = []
+        for raw, data, event in parsed:
+            if event.project_id not in known_projects:
+                dead.append((raw, f"Unknown project {event.project_id}"))
+                continue
+            accepted.append((raw, data, event))
+
+        rejected = {id(event): error for event, error in _insert_events([event for _, _, event in accepted])}
+        if rejected:
+            dead.extend((raw, rejected[id(event)]) for raw, _, event in accepted if id(event) in rejected)
+            accepted = [entry for entry in accepted if id(entry[2]) not in rejected]
+        if dead:
+            logger.warning("Moved %d invalid events to %s", len(dead), DEAD_LETTER_KEY)
+            _dead_letter(dead)
+    except Exception:
+        # Hand the batch back right away instead of waiting for the lease
+        _requeue_batch(consumer)
+        raise
+
+    _ack_batch(consumer)
+
+    # Session updates for the whole batch go to Redis in one round trip
+    session_pipe = _get_redis().pipeline(transaction=False)
+    for _, data, _ in accepted:
+        update_session(
+            project_id=data["project_id"],
+            session_id=data.get("session_id", ""),
+            device_id=data.get("device_id", ""),
+            profile_id=data.get("profile_id", ""),
+            event_name=data["name"],
+            path=data.get("path", ""),
+            referrer=data.get("referrer", ""),
+            utm_source=data.get("utm_source", ""),
+            utm_medium=data.get("utm_medium", ""),
+            utm_campaign=data.get("utm_campaign", ""),
+            country=data.get("country", ""),
+            city=data.get("city", ""),
+            device=data.get("device", ""),
+            browser=data.get("browser", ""),
+            os=data.get("os", ""),
+            revenue=data.get("revenue", 0),
+            timestamp=data.get("created_at", timezone.now()),
+            pipeline=session_pipe,
+        )
+    session_pipe.execute()
+    return len(items), len(accepted)
 
-    while count < BATCH_SIZE:
-        raw = r.rpop(BUFFER_KEY)
-        if raw is None:
+
+def flush_buffer(max_batches=1):
+    """
+    Drain up to *max_batches* batches from the buffer.
+
+    Safe to run from several workers at once.  Returns the number of
+    events written.
+    """
+    from funnelcube.services.session_manager import flush_sessions
+
+    recover_stale_batches()
+    consumer = uuid.uuid4().hex
+    flushed = 0
+
+    for _ in range(max_batches):
+        claimed, created = _flush_batch(consumer)
+        flushed += created
+        if claimed < BATCH_SIZE:
             break
-        count += 1
-        try:
-            data = json.loads(raw)
-            event = AnalyticsEvent(
-                id=uuid.uuid4(),
-                project_id=data["project_id"],
-                name=data["name"],
-                device_id=data.get("device_id", ""),
-                profile_id=data.get("profile_id", ""),
-                session_id=data.get("session_id", ""),
-                path=data.get("path", ""),
-                origin=data.get("origin", ""),
-                referrer=data.get("referrer", ""),
-                referrer_name=data.get("referrer_name", ""),
-                referrer_type=data.get("referrer_type", ""),
-                revenue=data.get("revenue", 0),
-                duration=data.get("duration", 0),
-                properties=data.get("properties", {}),
-                country=data.get("country", ""),
-                city=data.get("city", ""),
-                region=data.get("region", ""),
-                longitude=data.get("longitude"),
-                latitude=data.get("latitude"),
-                os=data.get("os", ""),
-                os_version=data.get("os_version", ""),
-                browser=data.get("browser", ""),
-                browser_version=data.get("browser_version", ""),
-                device=data.get("device", ""),
-                brand=data.get("brand", ""),
-                model_name=data.get("model_name", ""),
-                created_at=data.get("created_at", timezone.now()),
-            )
-            events_to_create.append(event)
-
-            update_session(
-                project_id=data["project_id"],
-                session_id=data.get("session_id", ""),
-                device_id=data.get("device_id", ""),
-                profile_id=data.get("profile_id", ""),
-                event_name=data["name"],
-                path=data.get("path", ""),
-                referrer=data.get("referrer", ""),
-                utm_source=data.get("utm_source", ""),
-                utm_medium=data.get("utm_medium", ""),
-                utm_campaign=data.get("utm_campaign", ""),
-                country=data.get("country", ""),
-                city=data.get("city", ""),
-                device=data.get("device", ""),
-                browser=data.get("browser", ""),
-                os=data.get("os", ""),
-                revenue=data.get("revenue", 0),
-                timestamp=data.get("created_at", timezone.now()),
-            )
-        except Exception:
-            logger.exception("Failed to parse buffered event")
-
-    if events_to_create:
-        AnalyticsEvent.objects.bulk_create(events_to_create, ignore_conflicts=True)
-        logger.info("Flushed %d events to database", len(events_to_create))
-
-    return len(events_to_create)
+
+    if flushed:
+        logger.info("Flushed %d events to database", flushed)
+
+    sessions = flush_sessions()
+    if sessions:
+        logger.info("Upserted %d sessions", sessions)
+
+    return flushed
+
+
+def buffer_stats():
+    """Queue depths for monitoring: pending, claimed and dead-lettered events."""
+    r = _get_redis()
+    consumers = r.smembers(CONSUMERS_KEY)
+
+    pipe = r.pipeline(transaction=False)
+    pipe.llen(BUFFER_KEY)
+    pipe.llen(DEAD_LETTER_KEY)
+    for consumer in consumers:
+        consumer = consumer.decode() if isinstance(consumer, bytes) else consumer
+        pipe.llen(INFLIGHT_KEY.format(consumer=consumer))
+    backlog, dead, *inflight = pipe.execute()
+
+    return {
+        "backlog": backlog,
+        "in_flight": sum(inflight),
+        "consumers": len(consumers),
+        "dead_letter": dead,
+    }
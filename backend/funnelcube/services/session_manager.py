@@ -1,39 +1,79 @@
+"""
+Session state for funnelcube ingestion, kept in Redis.
+
+Ingestion only touches Redis:
+
+- ``funnelcube:device_session:<project>:<device>`` maps a device to its
+  current session id and expires after SESSION_TIMEOUT of inactivity.
+- ``funnelcube:session:<id>`` is a hash with the session's aggregate
+  state: counters via HINCRBY, first-touch fields via HSETNX, last-touch
+  fields via HSET.  Every update refreshes its TTL.
+- ``funnelcube:sessions:dirty`` is the set of sessions changed since the
+  last flush.
+
+flush_sessions() (called at the end of every event buffer flush) upserts
+the dirty sessions into AnalyticsSession in one bulk statement.
+"""
+import logging
 import uuid
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from funnelcube.models import AnalyticsSession
+from funnelcube.services.event_buffer import _get_redis
+
+logger = logging.getLogger(__name__)
 
 SESSION_TIMEOUT = timedelta(minutes=30)
+# Session hashes outlive the device mapping so late buffered events still
+# land on the full aggregate rather than starting a fresh one
+SESSION_STATE_TTL = SESSION_TIMEOUT * 2
+SESSION_FLUSH_BATCH = 1000
 
+DEVICE_SESSION_KEY = "funnelcube:device_session:{project_id}:{device_id}"
+SESSION_KEY = "funnelcube:session:{session_id}"
+DIRTY_SESSIONS_KEY = "funnelcube:sessions:dirty"
 
-def get_or_create_session(project_id, device_id, profile_id="", timestamp=None):
-    now = timestamp or timezone.now()
-    cutoff = now - SESSION_TIMEOUT
-
-    session = (
-        AnalyticsSession.objects.filter(
-            project_id=project_id,
-            device_id=device_id,
-            created_at__gte=cutoff,
-        )
-        .order_by("-created_at")
-        .first()
-    )
+# Fields that keep the first non-empty value seen in the session
+FIRST_TOUCH_FIELDS = (
+    "profile_id", "referrer", "utm_source", "utm_medium", "utm_campaign",
+    "country", "city", "device", "browser", "os",
+)
+UPSERT_FIELDS = [
+    "ended_at", "is_bounce", "entry_path", "exit_path",
+    "screen_view_count", "event_count", "duration", "revenue",
+    *FIRST_TOUCH_FIELDS,
+]
 
-    if session:
-        return session.id
 
-    session_id = str(uuid.uuid4())
-    AnalyticsSession.objects.create(
-        id=session_id,
-        project_id=project_id,
-        device_id=device_id,
-        profile_id=profile_id,
-        created_at=now,
-    )
-    return session_id
+def _session_ttl():
+    return int(SESSION_TIMEOUT.total_seconds())
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is not None:
+            return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+    return timezone.now()
+
+
+def get_or_create_session(project_id, device_id, profile_id="", timestamp=None):
+    """Return the device's current session id, starting one if it expired."""
+    key = DEVICE_SESSION_KEY.format(project_id=project_id, device_id=device_id)
+    ttl = _session_ttl()
+
+    # One round trip: claim the key if free, read the winner, extend its TTL
+    pipe = _get_redis().pipeline(transaction=False)
+    pipe.set(key, str(uuid.uuid4()), nx=True, ex=ttl)
+    pipe.get(key)
+    pipe.expire(key, ttl)
+    _, session_id, _ = pipe.execute()
+    return session_id.decode() if isinstance(session_id, bytes) else session_id
 
 
 def update_session(
@@ -54,64 +94,119 @@ def update_session(
     os="",
     revenue=0,
     timestamp=None,
+    pipeline=None,
 ):
-    now = timestamp if isinstance(timestamp, str) is False else timezone.now()
-    if isinstance(now, str):
-        from django.utils.dateparse import parse_datetime
-        now = parse_datetime(now) or timezone.now()
-
-    try:
-        session = AnalyticsSession.objects.get(id=session_id)
-    except AnalyticsSession.DoesNotExist:
-        session = AnalyticsSession(
-            id=session_id,
-            project_id=project_id,
-            device_id=device_id,
-            profile_id=profile_id,
-            created_at=now,
-            entry_path=path,
-        )
-
-    session.ended_at = now
-    session.event_count = (session.event_count or 0) + 1
-    session.exit_path = path
-
+    """
+    Fold one event into the session's Redis aggregate.
+
+    Commands are queued on *pipeline* when given (the buffer flush sends a
+    whole batch in one round trip); otherwise they are sent immediately.
+    """
+    if not session_id:
+        return
+
+    pipe = pipeline if pipeline is not None else _get_redis().pipeline(transaction=False)
+    key = SESSION_KEY.format(session_id=session_id)
+    ts = _as_datetime(timestamp).timestamp()
+
+    pipe.hsetnx(key, "project_id", str(project_id))
+    pipe.hsetnx(key, "device_id", device_id)
+    pipe.hsetnx(key, "created_at", ts)
+    pipe.hset(key, mapping={"ended_at": ts, "exit_path": path})
+    pipe.hincrby(key, "event_count", 1)
     if event_name == "screen_view":
-        session.screen_view_count = (session.screen_view_count or 0) + 1
-
-    if not session.entry_path and path:
-        session.entry_path = path
+        pipe.hincrby(key, "screen_view_count", 1)
+    if path:
+        pipe.hsetnx(key, "entry_path", path)
+    if revenue:
+        pipe.hincrbyfloat(key, "revenue", float(revenue))
+
+    first_touch = {
+        "profile_id": profile_id, "referrer": referrer, "utm_source": utm_source,
+        "utm_medium": utm_medium, "utm_campaign": utm_campaign, "country": country,
+        "city": city, "device": device, "browser": browser, "os": os,
+    }
+    for field, value in first_touch.items():
+        if value:
+            pipe.hsetnx(key, field, value)
+
+    pipe.expire(key, int(SESSION_STATE_TTL.total_seconds()))
+    pipe.sadd(DIRTY_SESSIONS_KEY, session_id)
+
+    if pipeline is None:
+        pipe.execute()
+
+
+def _session_from_state(session_id, state):
+    state = {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in state.items()
+    }
+    created = float(state["created_at"])
+    ended = float(state.get("ended_at") or created)
+    screen_views = int(state.get("screen_view_count") or 0)
+
+    session = AnalyticsSession(
+        id=session_id,
+        project_id=state["project_id"],
+        device_id=state.get("device_id", ""),
+        created_at=datetime.fromtimestamp(created, tz=dt_timezone.utc),
+        ended_at=datetime.fromtimestamp(ended, tz=dt_timezone.utc),
+        entry_path=state.get("entry_path", ""),
+        exit_path=state.get("exit_path", ""),
+        event_count=int(state.get("event_count") or 0),
+        screen_view_count=screen_views,
+        duration=max(int(ended - created), 0),
+        is_bounce=screen_views <= 1,
+        revenue=float(state.get("revenue") or 0),
+    )
+    for field in FIRST_TOUCH_FIELDS:
+        setattr(session, field, state.get(field, ""))
+    return session
+
+
+def flush_sessions(batch_size=SESSION_FLUSH_BATCH):
+    """Upsert every dirty session into AnalyticsSession; returns the count."""
+    r = _get_redis()
+    flushed = 0
+
+    while True:
+        session_ids = [
+            sid.decode() if isinstance(sid, bytes) else sid
+            for sid in (r.spop(DIRTY_SESSIONS_KEY, batch_size) or [])
+        ]
+        if not session_ids:
+            break
+
+        pipe = r.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipe.hgetall(SESSION_KEY.format(session_id=session_id))
+        states = pipe.execute()
+
+        sessions = []
+        for session_id, state in zip(session_ids, states):
+            if not state:
+                logger.warning("Session %s expired before it was flushed", session_id)
+                continue
+            try:
+                sessions.append(_session_from_state(session_id, state))
+            except (KeyError, ValueError):
+                logger.exception("Invalid session state for %s", session_id)
 
-    if session.created_at and now:
         try:
-            session.duration = int((now - session.created_at).total_seconds())
-        except (TypeError, AttributeError):
-            pass
-
-    session.is_bounce = session.screen_view_count <= 1
-
-    if revenue:
-        session.revenue = (session.revenue or 0) + revenue
-
-    if profile_id and not session.profile_id:
-        session.profile_id = profile_id
-    if referrer and not session.referrer:
-        session.referrer = referrer
-    if utm_source and not session.utm_source:
-        session.utm_source = utm_source
-    if utm_medium and not session.utm_medium:
-        session.utm_medium = utm_medium
-    if utm_campaign and not session.utm_campaign:
-        session.utm_campaign = utm_campaign
-    if country and not session.country:
-        session.country = country
-    if city and not session.city:
-        session.city = city
-    if device and not session.device:
-        session.device = device
-    if browser and not session.browser:
-        session.browser = browser
-    if os and not session.os:
-        session.os = os
-
-    session.save()
+            AnalyticsSession.objects.bulk_create(
+                sessions,
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=UPSERT_FIELDS,
+            )
+        except Exception:
+            # Leave them dirty for the next flush
+            r.sadd(DIRTY_SESSIONS_KEY, *session_ids)
+            raise
+
+        flushed += len(sessions)
+        if len(session_ids) < batch_size:
+            break
+
+    return flushed
@@ -7,14 +7,28 @@ from django.utils import timezone
 logger = logging.getLogger(__name__)
 
 
+FLUSH_BATCHES_PER_RUN = 5     # Batches one flush task drains before returning
+MAX_PARALLEL_FLUSHES = 4      # Flush tasks allowed to run at once on a backlog
+
+
 @shared_task(bind=True, queue="analytics", max_retries=3, default_retry_delay=30)
-def flush_event_buffer(self):
+def flush_event_buffer(self, fan_out=True):
     try:
-        from funnelcube.services.event_buffer import flush_buffer
+        from funnelcube.services.event_buffer import BATCH_SIZE, buffer_stats, flush_buffer
+
+        count = flush_buffer(max_batches=FLUSH_BATCHES_PER_RUN)
+        stats = buffer_stats()
+        if count or stats["backlog"]:
+            logger.info(
+                "flush_event_buffer: flushed %d events, backlog=%d in_flight=%d dead_letter=%d",
+                count, stats["backlog"], stats["in_flight"], stats["dead_letter"],
+            )
 
-        count = flush_buffer()
-        if count:
-            logger.info("flush_event_buffer: flushed %d events", count)
+        # Spread a large backlog over extra one-shot workers
+        if fan_out:
+            extra = min(stats["backlog"] // BATCH_SIZE, MAX_PARALLEL_FLUSHES - 1)
+            for _ in range(extra):
+                flush_event_buffer.apply_async(kwargs={"fan_out": False})
         return count
     except Exception as exc:
         logger.exception("flush_event_buffer failed: %s", exc)
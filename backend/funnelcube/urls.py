@@ -21,6 +21,7 @@ urlpatterns = [
     # Public endpoints (auth via client_id/client_secret headers)
     path("track/", views.track_event, name="funnelcube-track"),
     path("identify/", views.identify_profile, name="funnelcube-identify"),
+    path("ingestion/stats/", views.ingestion_stats, name="funnelcube-ingestion-stats"),
     # Overview
     path(
         "projects/<uuid:project_id>/overview/",
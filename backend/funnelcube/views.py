@@ -6,7 +6,7 @@ from django.db.models import Avg, Count, Sum, Q
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes, authentication_classes, throttle_classes, action
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 
 from .models import (
@@ -35,7 +35,7 @@ from .serializers import (
     TrackEventSerializer,
 )
 from .services.device_id import generate_device_id, get_daily_salt
-from .services.event_buffer import push_event
+from .services.event_buffer import buffer_stats, push_event
 from .services.session_manager import get_or_create_session
 
 
@@ -538,6 +538,12 @@ def identify_profile(request):
     )
 
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def ingestion_stats(request):
+    return Response(buffer_stats())
+
+
 # ============================================================================
 # Legacy Overview (kept for backwards compatibility)
 # ============================================================================
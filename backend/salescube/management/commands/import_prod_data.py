@@ -74,6 +74,7 @@ from salescube.models import (
     Ticket,
     TicketMessage,
 )
+from salescube.stats import rebuild_lead_stats
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -153,6 +154,7 @@ class Command(BaseCommand):
             ("tags", self.import_tags),
             ("leads", self.import_leads),
             ("lead_m2m", self.import_lead_m2m),
+            ("lead_stats", self.rebuild_lead_stats),
             ("comments", self.import_comments),
             ("tag_assignments", self.import_tag_assignments),
             ("sales", self.import_sales),
@@ -839,6 +841,14 @@ class Command(BaseCommand):
             if franchises:
                 self._lead_franchises[lead.id] = franchises
 
+    def rebuild_lead_stats(self):
+        """Leads are bulk-created without signals, so recompute the stats rollup."""
+        if self.dry_run:
+            self.stdout.write("  Dry run - skipping lead stats")
+            return
+        rows = rebuild_lead_stats()
+        self.stdout.write(f"  Rebuilt {rows} lead stat rows")
+
     def import_lead_m2m(self):
         """Set M2M relationships for leads (responsibles, squads, franchises)."""
         if self.dry_run:
@@ -0,0 +1,17 @@
+"""Backfill/recompute the lead statistics rollup (LeadDailyStat)."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from salescube.stats import rebuild_lead_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the SalesCube lead statistics rollup from the Lead table"
+
+    def handle(self, *args, **options):
+        start = time.time()
+        rows = rebuild_lead_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Lead stats rebuilt: {rows} rows in {time.time() - start:.1f}s"
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-16 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salescube', '0009_alter_emailtemplate_created_by'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('source', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('assigned_to', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('pipeline', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='salescube.pipeline')),
+                ('stage', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='salescube.pipelinestage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pipeline', 'day'], name='salescube_l_pipelin_08474e_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'pipeline', 'stage', 'source', 'assigned_to'), name='uniq_lead_daily_stat', nulls_distinct=False)],
+            },
+        ),
+    ]
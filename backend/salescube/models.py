@@ -182,6 +182,45 @@ class Lead(models.Model):
         return f"{self.name} ({self.stage})"
 
 
+class LeadDailyStat(models.Model):
+    """
+    Rollup of leads by creation day and current pipeline/stage/source/assignee.
+
+    Kept up to date by salescube.stats from lead signals; rebuild it with
+    ``manage.py rebuild_lead_stats``.  The foreign keys carry no database
+    constraint: rows of a deleted stage or user are folded into the NULL
+    key instead of blocking the delete.
+    """
+    day = models.DateField()
+    pipeline = models.ForeignKey(
+        Pipeline, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name="+"
+    )
+    stage = models.ForeignKey(
+        PipelineStage, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name="+"
+    )
+    source = models.CharField(max_length=20)
+    assigned_to = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name="+"
+    )
+    count = models.IntegerField(default=0)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "pipeline", "stage", "source", "assigned_to"],
+                name="uniq_lead_daily_stat",
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["pipeline", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.stage_id}: {self.count}"
+
+
 class LeadNote(models.Model):
     NOTE_TYPE_CHOICES = [
         ("note", "Nota"),
@@ -1,6 +1,8 @@
-from django.db.models.signals import post_save, pre_save
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from . import stats
 from .models import Lead, LeadActivity, Pipeline, PipelineStage
 
 
@@ -41,6 +43,7 @@ def track_lead_changes(sender, instance, **kwargs):
     instance._old_stage = old.stage
     instance._old_score = old.score
     instance._old_assigned_to = old.assigned_to
+    instance._old_stats = (stats.lead_key(old), old.value)
 
 
 @receiver(post_save, sender=Lead)
@@ -86,3 +89,30 @@ def log_lead_activity(sender, instance, created, **kwargs):
             old_value=str(old_score),
             new_value=str(instance.score),
         )
+
+
+@receiver(post_save, sender=Lead)
+def update_lead_stats(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.record_lead_saved(instance)
+        return
+    previous = getattr(instance, "_old_stats", None)
+    if previous is not None and previous != (stats.lead_key(instance), instance.value):
+        stats.record_lead_saved(instance, previous)
+
+
+@receiver(post_delete, sender=Lead)
+def remove_lead_stats(sender, instance, **kwargs):
+    stats.record_lead_deleted(instance)
+
+
+@receiver(post_delete, sender=PipelineStage)
+def fold_stage_stats(sender, instance, **kwargs):
+    stats.fold_stage(instance.id)
+
+
+@receiver(post_delete, sender=get_user_model())
+def fold_assignee_stats(sender, instance, **kwargs):
+    stats.fold_assignee(instance.pk)
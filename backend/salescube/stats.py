@@ -0,0 +1,165 @@
+"""
+Maintenance of the LeadDailyStat rollup behind LeadViewSet.stats.
+
+Every lead counts once, with its value, under the key (day it was
+created, current pipeline, stage, source, assignee).  Lead signals move a
+lead's contribution between keys as it is created, moved, reassigned or
+deleted; update_leads() does the same for queryset updates, which send no
+signals.  Rows of a deleted stage or user are folded into the NULL key,
+mirroring the leads' own SET_NULL.  rebuild_lead_stats() recomputes the
+whole table from Lead.
+"""
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Lead, LeadDailyStat
+
+Key = Tuple  # (day, pipeline_id, stage_id, source, assigned_to_id)
+
+_COLUMNS = ("day", "pipeline_id", "stage_id", "source", "assigned_to_id", "count", "value")
+
+_UPSERT_SQL = """
+INSERT INTO salescube_leaddailystat AS s ({columns})
+VALUES {values}
+ON CONFLICT ON CONSTRAINT uniq_lead_daily_stat DO UPDATE SET
+    count = s.count + EXCLUDED.count,
+    value = s.value + EXCLUDED.value
+RETURNING id, count
+"""
+
+_FOLD_SQL = """
+INSERT INTO salescube_leaddailystat AS s ({columns})
+SELECT day, {pipeline}, {stage}, source, {assigned_to}, SUM(count), SUM(value)
+FROM salescube_leaddailystat
+WHERE {column} = %s
+GROUP BY 1, 2, 3, 4, 5
+ON CONFLICT ON CONSTRAINT uniq_lead_daily_stat DO UPDATE SET
+    count = s.count + EXCLUDED.count,
+    value = s.value + EXCLUDED.value
+"""
+
+
+def lead_key(lead: Lead) -> Key:
+    pipeline_id = lead.stage.pipeline_id if lead.stage_id else None
+    return (
+        timezone.localdate(lead.created_at),
+        pipeline_id,
+        lead.stage_id,
+        lead.source,
+        lead.assigned_to_id,
+    )
+
+
+def _add(deltas: Dict[Key, List], key: Key, count: int, value) -> None:
+    delta = deltas.setdefault(key, [0, Decimal(0)])
+    delta[0] += count
+    delta[1] += Decimal(str(value or 0))
+
+
+def apply_deltas(deltas: Dict[Key, List]) -> None:
+    """Add ``{key: [count, value]}`` to the rollup; rows that reach zero are removed."""
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+
+    params: List = []
+    # Fixed row order keeps concurrent upserts from deadlocking
+    for key in sorted(deltas, key=str):
+        params.extend([*key, *deltas[key]])
+    row = "(" + ", ".join(["%s"] * len(_COLUMNS)) + ")"
+    sql = _UPSERT_SQL.format(columns=", ".join(_COLUMNS), values=", ".join([row] * len(deltas)))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            empty = [pk for pk, count in cursor.fetchall() if count <= 0]
+        if empty:
+            LeadDailyStat.objects.filter(id__in=empty, count__lte=0).delete()
+
+
+def record_lead_saved(lead: Lead, previous: Optional[Tuple[Key, Decimal]] = None) -> None:
+    """Count a saved lead; *previous* is its ``(key, value)`` before the save, None if new."""
+    deltas: Dict[Key, List] = {}
+    if previous is not None:
+        _add(deltas, previous[0], -1, -Decimal(str(previous[1] or 0)))
+    _add(deltas, lead_key(lead), 1, lead.value)
+    apply_deltas(deltas)
+
+
+def record_lead_deleted(lead: Lead) -> None:
+    deltas: Dict[Key, List] = {}
+    _add(deltas, lead_key(lead), -1, -Decimal(str(lead.value or 0)))
+    apply_deltas(deltas)
+
+
+def _grouped_deltas(queryset, sign: int = 1, deltas: Optional[Dict[Key, List]] = None) -> Dict[Key, List]:
+    deltas = {} if deltas is None else deltas
+    rows = (
+        queryset.order_by()
+        .annotate(day=TruncDate("created_at"))
+        .values("day", "stage__pipeline", "stage", "source", "assigned_to")
+        .annotate(n=Count("id"), total=Sum("value"))
+    )
+    for row in rows:
+        key = (row["day"], row["stage__pipeline"], row["stage"], row["source"], row["assigned_to"])
+        _add(deltas, key, sign * row["n"], sign * (row["total"] or 0))
+    return deltas
+
+
+def update_leads(queryset, **changes) -> int:
+    """``queryset.update(**changes)`` with the rollup kept in step."""
+    with transaction.atomic():
+        pks = list(queryset.select_for_update().values_list("pk", flat=True))
+        leads = Lead.objects.filter(pk__in=pks)
+        deltas = _grouped_deltas(leads, -1)
+        count = leads.update(**changes)
+        apply_deltas(_grouped_deltas(leads, 1, deltas))
+    return count
+
+
+def _fold(column: str, value, **targets) -> None:
+    sql = _FOLD_SQL.format(
+        columns=", ".join(_COLUMNS),
+        column=column,
+        pipeline=targets.get("pipeline", "pipeline_id"),
+        stage=targets.get("stage", "stage_id"),
+        assigned_to=targets.get("assigned_to", "assigned_to_id"),
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value])
+        LeadDailyStat.objects.filter(**{column: value}).delete()
+
+
+def fold_stage(stage_id) -> None:
+    """A deleted stage's leads now have no stage, and so no pipeline."""
+    _fold("stage_id", stage_id, pipeline="NULL", stage="NULL")
+
+
+def fold_assignee(user_id) -> None:
+    _fold("assigned_to_id", user_id, assigned_to="NULL")
+
+
+def rebuild_lead_stats() -> int:
+    """Recompute the rollup from the Lead table; returns the number of rows."""
+    with transaction.atomic():
+        # Signal-driven updates wait until the rebuilt table is committed
+        with connection.cursor() as cursor:
+            cursor.execute("LOCK TABLE salescube_leaddailystat IN EXCLUSIVE MODE")
+        deltas = _grouped_deltas(Lead.objects.all())
+        LeadDailyStat.objects.all().delete()
+        LeadDailyStat.objects.bulk_create(
+            [
+                LeadDailyStat(
+                    day=day, pipeline_id=pipeline_id, stage_id=stage_id, source=source,
+                    assigned_to_id=assigned_to_id, count=count, value=value,
+                )
+                for (day, pipeline_id, stage_id, source, assigned_to_id), (count, value) in deltas.items()
+            ],
+            batch_size=1000,
+        )
+    return len(deltas)
@@ -1,8 +1,9 @@
 from datetime import timedelta
 from decimal import Decimal
 
-from django.db.models import Count, Sum, Q, Avg, F
-from django.db.models.functions import TruncMonth, TruncDate, Coalesce
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Sum, Q, Avg, F, Case, When, Value, IntegerField, Window
+from django.db.models.functions import TruncMonth, Coalesce, RowNumber
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
@@ -12,6 +13,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.pagination import decode_cursor, encode_cursor
+
 from .filters import (
     FinancialRecordFilter,
     LeadFilter,
@@ -43,6 +46,7 @@ from .models import (
     Lead,
     LeadActivity,
     LeadComment,
+    LeadDailyStat,
     LeadNote,
     LeadTag,
     LeadTagAssignment,
@@ -94,6 +98,7 @@ from .serializers import (
     SaleSerializer,
     TaskSerializer,
 )
+from .stats import update_leads
 
 
 # ============================================================================
@@ -201,66 +206,96 @@ class PipelineViewSet(viewsets.ModelViewSet):
         Query params:
           - page_size: leads per column (default 50)
           - search: text search on lead name/email/phone
-          - stage: filter specific stage UUID
+          - stage_<uuid>_page: page of that column (default 1)
+          - stage + cursor: "load more" for one column, from a column's
+            next_cursor
+
+        The board is one query: ROW_NUMBER() / COUNT() / SUM() windows
+        partitioned by stage pick each column's page and its totals.
         """
         pipeline = self.get_object()
         page_size = int(request.query_params.get("page_size", 50))
         search = request.query_params.get("search", "")
 
-        stages = pipeline.stages.order_by("order")
-        columns = []
+        leads_qs = Lead.objects.filter(stage__pipeline=pipeline).select_related(
+            "assigned_to", "origin"
+        )
+        if search:
+            leads_qs = leads_qs.filter(
+                Q(name__icontains=search)
+                | Q(email__icontains=search)
+                | Q(phone__icontains=search)
+            )
 
-        for stage in stages:
-            leads_qs = Lead.objects.filter(stage=stage).select_related(
-                "assigned_to", "origin"
-            ).order_by("-created_at")
-
-            if search:
-                leads_qs = leads_qs.filter(
-                    Q(name__icontains=search)
-                    | Q(email__icontains=search)
-                    | Q(phone__icontains=search)
-                )
+        stage_id = request.query_params.get("stage")
+        if stage_id:
+            return self._kanban_column(pipeline, leads_qs, stage_id, page_size)
 
-            # Per-stage pagination
+        stages = sorted(pipeline.stages.all(), key=lambda s: s.order)
+        pages = {}
+        for stage in stages:
             page_param = request.query_params.get(f"stage_{stage.id}_page", "1")
             try:
-                page_num = int(page_param)
+                pages[stage.id] = max(1, int(page_param))
             except (ValueError, TypeError):
-                page_num = 1
-            offset = (page_num - 1) * page_size
-            total_leads = leads_qs.count()
-            total_pages = max(1, (total_leads + page_size - 1) // page_size)
-            page_leads = leads_qs[offset:offset + page_size]
-
-            agg = Lead.objects.filter(stage=stage).aggregate(
-                total_value=Sum("value")
+                pages[stage.id] = 1
+
+        by_stage = Window(Count("id"), partition_by=[F("stage_id")])
+        rows = leads_qs.annotate(
+            row=Window(
+                RowNumber(),
+                partition_by=[F("stage_id")],
+                order_by=[F("created_at").desc(), F("id").desc()],
+            ),
+            stage_count=by_stage,
+            stage_value=Window(Sum("value"), partition_by=[F("stage_id")]),
+            page_offset=Case(
+                *[
+                    When(stage_id=sid, then=Value((page - 1) * page_size))
+                    for sid, page in pages.items()
+                    if page > 1
+                ],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+        ).filter(
+            row__gt=F("page_offset"),
+            row__lte=F("page_offset") + page_size,
+        ).order_by("stage_id", "row")
+
+        leads_by_stage = {}
+        totals = {}
+        for lead in rows:
+            leads_by_stage.setdefault(lead.stage_id, []).append(lead)
+            totals[lead.stage_id] = (lead.stage_count, lead.stage_value)
+
+        # Columns paged past their end return no rows, so no window totals
+        missing = [s.id for s in stages if s.id not in totals and pages[s.id] > 1]
+        if missing:
+            for row in (
+                leads_qs.filter(stage_id__in=missing)
+                .order_by()
+                .values("stage_id")
+                .annotate(n=Count("id"), value=Sum("value"))
+            ):
+                totals[row["stage_id"]] = (row["n"], row["value"])
+        if search:
+            # The column value has always been the whole stage's, not just the matches
+            values = dict(
+                Lead.objects.filter(stage__pipeline=pipeline)
+                .order_by()
+                .values("stage_id")
+                .annotate(value=Sum("value"))
+                .values_list("stage_id", "value")
             )
+            totals = {sid: (count, values.get(sid)) for sid, (count, _) in totals.items()}
 
-            lead_cards = []
-            for lead in page_leads:
-                assigned_name = None
-                if lead.assigned_to:
-                    full = lead.assigned_to.get_full_name()
-                    assigned_name = full if full else lead.assigned_to.username
-
-                lead_cards.append({
-                    "id": str(lead.id),
-                    "name": lead.name,
-                    "email": lead.email,
-                    "phone": lead.phone,
-                    "company": lead.company,
-                    "score": lead.score,
-                    "source": lead.source,
-                    "value": str(lead.value),
-                    "assigned_to": lead.assigned_to_id,
-                    "assigned_to_name": assigned_name,
-                    "stage": str(stage.id),
-                    "origin": str(lead.origin_id) if lead.origin_id else None,
-                    "origin_name": lead.origin.name if lead.origin else None,
-                    "created_at": lead.created_at.isoformat(),
-                })
-
+        columns = []
+        for stage in stages:
+            total_leads, total_value = totals.get(stage.id, (0, None))
+            page_leads = leads_by_stage.get(stage.id, [])
+            page_num = pages[stage.id]
+            has_more = (page_num - 1) * page_size + len(page_leads) < total_leads
             columns.append({
                 "stage_id": str(stage.id),
                 "stage_name": stage.name,
@@ -268,10 +303,11 @@ class PipelineViewSet(viewsets.ModelViewSet):
                 "order": stage.order,
                 "probability": stage.probability,
                 "count": total_leads,
-                "total_value": str(agg["total_value"] or 0),
-                "total_pages": total_pages,
+                "total_value": str(total_value or 0),
+                "total_pages": max(1, (total_leads + page_size - 1) // page_size),
                 "current_page": page_num,
-                "leads": lead_cards,
+                "leads": [_lead_card(lead) for lead in page_leads],
+                "next_cursor": encode_cursor(page_leads[-1].created_at, page_leads[-1].id) if has_more and page_leads else None,
             })
 
         return Response({
@@ -280,6 +316,59 @@ class PipelineViewSet(viewsets.ModelViewSet):
             "columns": columns,
         })
 
+    def _kanban_column(self, pipeline, leads_qs, stage_id, page_size):
+        """One column's next page, keyset-paginated on (created_at, id)."""
+        try:
+            stage = pipeline.stages.get(id=stage_id)
+        except (PipelineStage.DoesNotExist, ValueError, DjangoValidationError):
+            return Response({"error": "Stage not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        leads_qs = leads_qs.filter(stage=stage).order_by("-created_at", "-id")
+        cursor = self.request.query_params.get("cursor")
+        if cursor:
+            try:
+                created_at, last_id = decode_cursor(cursor)
+            except DjangoValidationError as e:
+                return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+            leads_qs = leads_qs.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, id__lt=last_id)
+            )
+
+        page_leads = list(leads_qs[: page_size + 1])
+        has_more = len(page_leads) > page_size
+        page_leads = page_leads[:page_size]
+        return Response({
+            "pipeline_id": str(pipeline.id),
+            "stage_id": str(stage.id),
+            "leads": [_lead_card(lead) for lead in page_leads],
+            "next_cursor": encode_cursor(page_leads[-1].created_at, page_leads[-1].id) if has_more else None,
+        })
+
+
+def _lead_card(lead):
+    assigned_name = None
+    if lead.assigned_to:
+        full = lead.assigned_to.get_full_name()
+        assigned_name = full if full else lead.assigned_to.username
+
+    return {
+        "id": str(lead.id),
+        "name": lead.name,
+        "email": lead.email,
+        "phone": lead.phone,
+        "company": lead.company,
+        "score": lead.score,
+        "source": lead.source,
+        "value": str(lead.value),
+        "assigned_to": lead.assigned_to_id,
+        "assigned_to_name": assigned_name,
+        "stage": str(lead.stage_id),
+        "origin": str(lead.origin_id) if lead.origin_id else None,
+        "origin_name": lead.origin.name if lead.origin else None,
+        "created_at": lead.created_at.isoformat(),
+    }
+
 
 class PipelineStageViewSet(viewsets.ModelViewSet):
     queryset = PipelineStage.objects.all()
@@ -367,7 +456,7 @@ class LeadViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
         leads = Lead.objects.filter(pk__in=lead_ids)
-        count = leads.update(stage=stage)
+        count = update_leads(leads, stage=stage)
         return Response({"moved": count})
 
     @action(detail=False, methods=["post"], url_path="bulk-assign")
@@ -391,7 +480,7 @@ class LeadViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND,
                 )
         leads = Lead.objects.filter(pk__in=lead_ids)
-        count = leads.update(assigned_to=user)
+        count = update_leads(leads, assigned_to=user)
         return Response({"assigned": count})
 
     @action(detail=False, methods=["post"], url_path="bulk-delete")
@@ -518,69 +607,79 @@ class LeadViewSet(viewsets.ModelViewSet):
         else:
             end = now
 
-        leads_qs = Lead.objects.filter(created_at__gte=start, created_at__lte=end)
+        # Lead figures come from the daily rollup (see salescube.stats)
+        all_stats = LeadDailyStat.objects.all()
+        if pipeline_id:
+            all_stats = all_stats.filter(pipeline_id=pipeline_id)
+        period_stats = all_stats.filter(
+            day__gte=timezone.localdate(start), day__lte=timezone.localdate(end)
+        )
         sales_qs = Sale.objects.filter(created_at__gte=start, created_at__lte=end)
-
         if pipeline_id:
-            leads_qs = leads_qs.filter(stage__pipeline_id=pipeline_id)
             sales_qs = sales_qs.filter(lead__stage__pipeline_id=pipeline_id)
 
-        total_leads = leads_qs.count()
-        total_sales = sales_qs.count()
-        total_revenue = sales_qs.filter(stage="won").aggregate(
-            total=Sum("total_value")
-        )["total"] or 0
+        sales_totals = sales_qs.aggregate(
+            count=Count("id"),
+            revenue=Sum("total_value", filter=Q(stage="won")),
+            avg=Avg("total_value", filter=Q(stage="won")),
+        )
+        total_sales = sales_totals["count"]
+        total_revenue = sales_totals["revenue"] or 0
+        avg_deal = sales_totals["avg"] or 0
+
+        # Conversion is over the period for one pipeline, over all time otherwise
+        base_stats = period_stats if pipeline_id else all_stats
+        conversion = base_stats.aggregate(
+            total=Sum("count"),
+            converted=Sum("count", filter=Q(stage__name__in=["Convertido", "Finalizado"])),
+        )
+        all_leads_count = conversion["total"] or 0
+        converted_count = conversion["converted"] or 0
+        conversion_rate = (converted_count / all_leads_count * 100) if all_leads_count > 0 else 0
+        total_leads = all_leads_count if pipeline_id else (
+            period_stats.aggregate(total=Sum("count"))["total"] or 0
+        )
 
         # Leads per stage grouped by pipeline
-        stage_qs = Lead.objects.filter(stage__isnull=False)
-        if pipeline_id:
-            stage_qs = stage_qs.filter(stage__pipeline_id=pipeline_id)
         leads_per_stage = list(
-            stage_qs
+            all_stats.filter(stage__isnull=False)
             .values(
                 "stage__name", "stage__color", "stage__order",
                 "stage__pipeline__name", "stage__pipeline_id"
             )
-            .annotate(count=Count("id"), total_value=Sum("value"))
+            .annotate(count=Sum("count"), total_value=Sum("value"))
             .order_by("stage__pipeline__name", "stage__order")
         )
 
         # Leads per day
         leads_per_day = list(
-            leads_qs.annotate(date=TruncDate("created_at"))
-            .values("date")
-            .annotate(count=Count("id"))
-            .order_by("date")
+            period_stats.values("day")
+            .annotate(count=Sum("count"))
+            .order_by("day")
         )
 
         # Top assignees
-        assignees_qs = Lead.objects.filter(assigned_to__isnull=False)
-        if pipeline_id:
-            assignees_qs = assignees_qs.filter(stage__pipeline_id=pipeline_id)
         top_assignees = list(
-            assignees_qs
+            all_stats.filter(assigned_to__isnull=False)
             .values("assigned_to__username", "assigned_to__first_name", "assigned_to__last_name")
-            .annotate(count=Count("id"), total_value=Sum("value"))
+            .annotate(count=Sum("count"), total_value=Sum("value"))
             .order_by("-count")[:10]
         )
 
         # Leads per source
-        source_qs = leads_qs if pipeline_id else Lead.objects.all()
-        if pipeline_id:
-            source_qs = source_qs.filter(stage__pipeline_id=pipeline_id)
         leads_per_source = list(
-            source_qs
+            base_stats
             .values("source")
-            .annotate(count=Count("id"))
+            .annotate(count=Sum("count"))
             .order_by("-count")
         )
 
         # Pipeline summary
         pipeline_summary = list(
-            Lead.objects.filter(stage__isnull=False)
+            LeadDailyStat.objects.filter(stage__isnull=False)
             .values("stage__pipeline__name", "stage__pipeline_id")
             .annotate(
-                count=Count("id"),
+                count=Sum("count"),
                 total_value=Sum("value"),
             )
             .order_by("-count")
@@ -593,19 +692,6 @@ class LeadViewSet(viewsets.ModelViewSet):
             .order_by("stage")
         )
 
-        # Conversion rate
-        base_qs = leads_qs if pipeline_id else Lead.objects.all()
-        converted_count = base_qs.filter(
-            stage__name__in=["Convertido", "Finalizado"]
-        ).count()
-        all_leads_count = base_qs.count()
-        conversion_rate = (converted_count / all_leads_count * 100) if all_leads_count > 0 else 0
-
-        # Average deal size
-        avg_deal = sales_qs.filter(stage="won").aggregate(
-            avg=Avg("total_value")
-        )["avg"] or 0
-
         return Response({
             "total_leads": total_leads,
             "total_sales": total_sales,
@@ -625,7 +711,7 @@ class LeadViewSet(viewsets.ModelViewSet):
             ],
             "leads_per_day": [
                 {
-                    "date": d["date"].isoformat() if d["date"] else None,
+                    "date": d["day"].isoformat(),
                     "count": d["count"],
                 }
                 for d in leads_per_day
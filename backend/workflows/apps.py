@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class WorkflowsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "workflows"
+
+    def ready(self):
+        import workflows.signals  # noqa: F401
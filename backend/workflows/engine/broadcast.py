@@ -0,0 +1,113 @@
+"""
+Coalesced progress broadcasting for workflow executions.
+
+Executions run in the background most of the time, so the broadcaster
+first checks whether anyone is watching ``execution_{id}``: the
+ExecutionProgressConsumer marks the execution as watched in the cache
+on connect and on every ping.  Unwatched executions send nothing.  Only a
+positive check is reused; "no watcher" is re-read on every event, since
+clients usually connect just after starting the run.
+
+Watched executions buffer events and send them as a single
+``execution.progress_batch`` group message per flush interval; terminal
+events flush immediately so the client never waits on completion.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+import logging
+from typing import Optional
+
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+
+logger = logging.getLogger("flowcube.engine")
+
+
+FLUSH_INTERVAL_S = 0.25      # Max delay before buffered events are sent
+WATCH_TTL_S = 90             # Watcher flag lifetime (client pings every 30s)
+WATCH_RECHECK_S = 1.0        # How long a subscriber check result is reused
+
+TERMINAL_EVENTS = frozenset({"execution_complete", "execution_error"})
+
+
+def _watch_key(execution_id: str) -> str:
+    return f"execution_watchers:{execution_id}"
+
+
+async def mark_watched(execution_id: str) -> None:
+    """Called by the WebSocket consumer to flag *execution_id* as observed."""
+    await cache.aset(_watch_key(execution_id), 1, timeout=WATCH_TTL_S)
+
+
+class ProgressBroadcaster:
+    """Execution-scoped, subscriber-aware event batcher."""
+
+    def __init__(self, execution_id: str, flush_interval: float = FLUSH_INTERVAL_S):
+        self.execution_id = execution_id
+        self.group = f"execution_{execution_id}"
+        self.flush_interval = flush_interval
+        self._channel_layer = None
+        self._pending: list[dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._watched = False
+        self._checked_at: Optional[float] = None
+
+    async def has_subscribers(self, recheck: bool = False) -> bool:
+        now = time.monotonic()
+        if (
+            recheck
+            or not self._watched
+            or self._checked_at is None
+            or now - self._checked_at >= WATCH_RECHECK_S
+        ):
+            self._checked_at = now
+            try:
+                self._watched = bool(await cache.aget(_watch_key(self.execution_id)))
+            except Exception as exc:
+                logger.debug("Watcher lookup failed for %s: %s", self.group, exc)
+                self._watched = False
+        return self._watched
+
+    async def emit(self, event_type: str, data: dict) -> None:
+        """Queue an event; sent with the next batch if anyone is watching."""
+        if not await self.has_subscribers(recheck=event_type in TERMINAL_EVENTS):
+            return
+        self._pending.append({"event_type": event_type, **data})
+        if event_type in TERMINAL_EVENTS:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            self._flush_task.cancel()
+            self._flush_task = None
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+
+        if self._channel_layer is None:
+            try:
+                self._channel_layer = get_channel_layer()
+            except Exception:
+                return
+        if self._channel_layer is None:
+            return
+        try:
+            await self._channel_layer.group_send(
+                self.group,
+                {"type": "execution.progress_batch", "events": events},
+            )
+        except Exception as exc:
+            logger.debug("Broadcast failed for %s: %s", self.group, exc)
+
+    async def close(self) -> None:
+        """Send anything still buffered and stop the flush timer."""
+        await self.flush()
@@ -7,6 +7,8 @@ from __future__ import annotations
 
 import re
 import logging
+from collections import ChainMap
+from functools import lru_cache
 from typing import Any, Optional
 
 logger = logging.getLogger("flowcube.engine")
@@ -51,6 +53,23 @@ class ExecutionContext:
     def get_node_output(self, node_id: str, default: Any = None) -> Any:
         return self.node_outputs.get(node_id, default)
 
+    def fork(self, variables: Optional[dict] = None) -> "ExecutionContext":
+        """
+        Child context for one iterator item.
+
+        Variables and node outputs are copy-on-write views (ChainMap) over
+        this context: the child reads everything the parent has, while its
+        own writes stay local and invisible to sibling items.
+        """
+        child = ExecutionContext(
+            execution_id=self.execution_id,
+            workflow_id=self.workflow_id,
+            trigger_data=self.trigger_data,
+        )
+        child.variables = ChainMap(dict(variables or {}), self.variables)
+        child.node_outputs = ChainMap({}, self.node_outputs)
+        return child
+
     # ------------------------------------------------------------------
     # Template interpolation  {{variable}}  and  {{$node.nodeId.field}}
     # ------------------------------------------------------------------
@@ -68,46 +87,42 @@ class ExecutionContext:
         """
         if not text or "{{" not in text:
             return text
-
-        def _replace(match: re.Match) -> str:
-            expr = match.group(1).strip()
-
-            # Node output reference: $node.nodeId.path.to.field
-            if expr.startswith("$node."):
-                parts = expr[6:].split(".", 1)
-                node_id = parts[0]
-                output = self.node_outputs.get(node_id)
+        return self._render(compile_template(text))
+
+    def _render(self, tokens: tuple) -> str:
+        parts = []
+        for token in tokens:
+            if token.__class__ is str:
+                parts.append(token)
+                continue
+            kind, key, path, raw = token
+            if kind == _NODE:
+                output = self.node_outputs.get(key)
                 if output is None:
-                    return match.group(0)
-                if len(parts) > 1:
-                    return str(_deep_get(output, parts[1]))
-                return str(output)
-
-            # Trigger data reference: $trigger.field
-            if expr.startswith("$trigger."):
-                path = expr[9:]
-                return str(_deep_get(self.trigger_data, path))
-
-            # Plain variable
-            val = self.variables.get(expr)
-            if val is not None:
-                return str(val)
-
-            return match.group(0)  # leave unresolved
-
-        return self._VAR_RE.sub(_replace, text)
+                    parts.append(raw)
+                elif path:
+                    parts.append(str(_deep_get_parts(output, path)))
+                else:
+                    parts.append(str(output))
+            elif kind == _TRIGGER:
+                parts.append(str(_deep_get_parts(self.trigger_data, path)))
+            else:
+                val = self.variables.get(key)
+                parts.append(raw if val is None else str(val))
+        return "".join(parts)
 
     def resolve_dict(self, data: dict) -> dict:
         """Recursively resolve templates in a dict."""
         result = {}
         for key, value in data.items():
             if isinstance(value, str):
-                result[key] = self.resolve_template(value)
+                # Only leaves that contain a placeholder reach the renderer
+                result[key] = self._render(compile_template(value)) if "{{" in value else value
             elif isinstance(value, dict):
                 result[key] = self.resolve_dict(value)
             elif isinstance(value, list):
                 result[key] = [
-                    self.resolve_template(v) if isinstance(v, str)
+                    (self._render(compile_template(v)) if "{{" in v else v) if isinstance(v, str)
                     else self.resolve_dict(v) if isinstance(v, dict)
                     else v
                     for v in value
@@ -117,9 +132,55 @@ class ExecutionContext:
         return result
 
 
+# ----------------------------------------------------------------------
+# Template compilation
+# ----------------------------------------------------------------------
+
+_NODE = 0
+_TRIGGER = 1
+_VARIABLE = 2
+
+TEMPLATE_CACHE_SIZE = 4096  # Distinct template strings kept compiled
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(text: str) -> tuple:
+    """
+    Split *text* into literal strings and placeholder accessors.
+
+    Accessors are ``(kind, key, path_parts, raw)`` tuples where *raw* is the
+    original ``{{...}}`` text, kept so unresolved placeholders render as-is.
+    Compiled once per distinct string; rendering needs no regex.
+    """
+    tokens: list = []
+    pos = 0
+    for match in ExecutionContext._VAR_RE.finditer(text):
+        if match.start() > pos:
+            tokens.append(text[pos:match.start()])
+        pos = match.end()
+        expr = match.group(1).strip()
+        raw = match.group(0)
+
+        if expr.startswith("$node."):
+            node_id, sep, path = expr[6:].partition(".")
+            tokens.append((_NODE, node_id, tuple(path.split(".")) if sep else (), raw))
+        elif expr.startswith("$trigger."):
+            tokens.append((_TRIGGER, None, tuple(expr[9:].split(".")), raw))
+        else:
+            tokens.append((_VARIABLE, expr, (), raw))
+    if pos < len(text):
+        tokens.append(text[pos:])
+    return tuple(tokens)
+
+
 def _deep_get(obj: Any, path: str) -> Any:
     """Navigate nested dict/list by dot-separated path."""
-    for part in path.split("."):
+    return _deep_get_parts(obj, path.split("."))
+
+
+def _deep_get_parts(obj: Any, parts) -> Any:
+    """Navigate nested dict/list by pre-split path parts."""
+    for part in parts:
         if isinstance(obj, dict):
             obj = obj.get(part)
         elif isinstance(obj, (list, tuple)):
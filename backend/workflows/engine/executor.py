@@ -1,49 +1,64 @@
 """
 Graph-based workflow executor.
 
-Builds an adjacency list from React Flow edges, finds start nodes,
-then executes via BFS following edge connections.  Broadcasts progress
-events through Django Channels so the frontend WebSocket client can
-show real-time node status updates.
+Walks a compiled ExecutionPlan (see plan.py) from its start nodes,
+following edge connections.  Independent ready nodes (fan-out, parallel
+router handles) run concurrently as asyncio tasks up to a per-execution
+limit; ``merge`` nodes wait for every incoming branch.  Broadcasts progress
+events through Django Channels (batched, and only while a client is
+watching) so the frontend WebSocket client can show real-time node
+status updates.
 """
 from __future__ import annotations
 
+import asyncio
 import time
 import logging
-from collections import defaultdict
+from collections import deque
 from typing import Any, Optional
 
-from asgiref.sync import sync_to_async
-from channels.layers import get_channel_layer
 from django.utils import timezone
 
-from .registry import NodeRegistry
 from .base import NodeResult
+from .broadcast import ProgressBroadcaster
 from .context import ExecutionContext
+from .logbuffer import LOG_MODE_FULL, NodeLogBuffer
+from .plan import ExecutionPlan, MapStage
 
 logger = logging.getLogger("flowcube.engine")
 
 
+MAX_CONCURRENT_NODES = 8  # Default per-execution limit on in-flight nodes
+MAX_CONCURRENT_ITEMS = 10  # Default iterator items processed at once
+
+_NO_RESULT = object()  # Marks items whose branch never reached the aggregator
+
+
 class WorkflowExecutor:
     """
     Execute a workflow graph stored as {nodes, edges, viewport}.
     """
 
-    def __init__(self, graph: dict, context: ExecutionContext):
+    def __init__(
+        self,
+        graph: dict,
+        context: ExecutionContext,
+        plan: Optional[ExecutionPlan] = None,
+        max_concurrency: int = MAX_CONCURRENT_NODES,
+        log_mode: str = LOG_MODE_FULL,
+        log_sample_rate: float = 1.0,
+    ):
         self.graph = graph
         self.context = context
-        self._nodes: list[dict] = graph.get("nodes", [])
-        self._edges: list[dict] = graph.get("edges", [])
-        self._nodes_by_id: dict[str, dict] = {n["id"]: n for n in self._nodes}
-        # adjacency: source_id -> list of (target_id, source_handle)
-        self._adj: dict[str, list[tuple[str, str]]] = defaultdict(list)
-        for edge in self._edges:
-            src = edge["source"]
-            tgt = edge["target"]
-            handle = edge.get("sourceHandle", "default") or "default"
-            self._adj[src].append((tgt, handle))
-        self._channel_layer = None
-        self._registry = NodeRegistry()
+        self.max_concurrency = max(1, max_concurrency)
+        self.node_logs = NodeLogBuffer(
+            context.execution_id, mode=log_mode, sample_rate=log_sample_rate,
+        )
+        # Callers on the hot path pass a cached plan; ad-hoc runs compile one.
+        self.plan = plan if plan is not None else ExecutionPlan(graph)
+        self._broadcaster = ProgressBroadcaster(context.execution_id)
+        # aggregator node_id -> per-item results collected by its map stage
+        self._map_results: dict[str, list] = {}
 
     # ------------------------------------------------------------------
     # Graph helpers
@@ -51,50 +66,19 @@ class WorkflowExecutor:
 
     def find_start_nodes(self) -> list[dict]:
         """Nodes with no incoming edges (roots of the DAG)."""
-        target_ids = {e["target"] for e in self._edges}
-        starts = [n for n in self._nodes if n["id"] not in target_ids]
-        if not starts and self._nodes:
-            starts = [self._nodes[0]]
-        return starts
+        return list(self.plan.start_nodes)
 
     def get_downstream(self, node_id: str, source_handle: str = "default") -> list[dict]:
         """Return nodes connected to *node_id* via matching source handle."""
-        results = []
-        for tgt_id, handle in self._adj.get(node_id, []):
-            if handle == source_handle or source_handle == "default" and handle == "default":
-                node = self._nodes_by_id.get(tgt_id)
-                if node:
-                    results.append(node)
-        # If source_handle was specific and nothing matched, also try "default" edges
-        if not results and source_handle != "default":
-            for tgt_id, handle in self._adj.get(node_id, []):
-                if handle == "default":
-                    node = self._nodes_by_id.get(tgt_id)
-                    if node:
-                        results.append(node)
-        return results
+        return list(self.plan.downstream(node_id, source_handle))
 
     # ------------------------------------------------------------------
     # Channel broadcasting
     # ------------------------------------------------------------------
 
     async def _broadcast(self, event_type: str, data: dict) -> None:
-        """Send event to the execution's channel group."""
-        if self._channel_layer is None:
-            try:
-                self._channel_layer = get_channel_layer()
-            except Exception:
-                return
-        if self._channel_layer is None:
-            return
-        group = f"execution_{self.context.execution_id}"
-        try:
-            await self._channel_layer.group_send(
-                group,
-                {"type": "execution.progress", "event_type": event_type, **data},
-            )
-        except Exception as exc:
-            logger.debug("Broadcast failed (no subscribers?): %s", exc)
+        """Queue event for the execution's channel group (batched, watchers only)."""
+        await self._broadcaster.emit(event_type, data)
 
     # ------------------------------------------------------------------
     # Main execution loop
@@ -117,49 +101,21 @@ class WorkflowExecutor:
             "execution_id": self.context.execution_id,
         })
 
-        executed_count = 0
-        error_count = 0
-        # BFS queue: list of nodes to execute
-        queue: list[dict] = list(start_nodes)
-        visited: set[str] = set()
-
-        while queue:
-            node = queue.pop(0)
-            node_id = node["id"]
-
-            if node_id in visited:
-                continue
-            visited.add(node_id)
-
-            result = await self._execute_node(node)
-            executed_count += 1
-
-            if not result.success:
-                error_count += 1
-                # Check error handling config
-                error_handling = node.get("data", {}).get("error_handling", "stop")
-                if error_handling == "stop":
-                    break
-                elif error_handling == "ignore":
-                    # Continue with default handle
-                    pass
-                elif error_handling == "resume":
-                    # Use fallback output
-                    fallback = node.get("data", {}).get("fallback_output")
-                    if fallback is not None:
-                        self.context.store_node_output(node_id, fallback)
-                elif error_handling == "break":
-                    # Stop this branch but continue others already in queue
-                    continue
-
-            # Find downstream nodes via the result's source_handle
-            # Support parallel routing via source_handles list
-            handles = result.source_handles if result.source_handles else [result.source_handle]
-            for handle in handles:
-                downstream = self.get_downstream(node_id, handle)
-                for next_node in downstream:
-                    if next_node["id"] not in visited:
-                        queue.append(next_node)
+        try:
+            executed_count, error_count = await self._run(start_nodes)
+        finally:
+            # Persist buffered node logs and stop the flush timer even if the scheduler crashed
+            await self.node_logs.flush()
+            await self._broadcaster.close()
+
+        plan = self.plan
+        # Present outputs in graph order regardless of completion order
+        ordered = sorted(
+            self.context.node_outputs.items(),
+            key=lambda item: plan.order.get(item[0], len(plan.order)),
+        )
+        self.context.node_outputs.clear()
+        self.context.node_outputs.update(ordered)
 
         await self._broadcast("execution_complete", {
             "execution_id": self.context.execution_id,
@@ -173,6 +129,176 @@ class WorkflowExecutor:
             "error_count": error_count,
         }
 
+    async def _run(self, start_nodes) -> tuple[int, int]:
+        """
+        Schedule nodes of ``self.plan`` from *start_nodes* until nothing is
+        runnable.  Returns ``(executed_count, error_count)``.
+        """
+        plan = self.plan
+        executed_count = 0
+        error_count = 0
+        stopped = False
+        # Nodes whose tasks may be started, in activation order
+        ready: deque[dict] = deque()
+        # Merge nodes activated by one branch, waiting for the others
+        waiting: dict[str, dict] = {}
+        scheduled: set[str] = set()
+        finished: set[str] = set()
+        running: dict[asyncio.Task, dict] = {}
+
+        def schedule(node: dict) -> None:
+            waiting.pop(node["id"], None)
+            scheduled.add(node["id"])
+            ready.append(node)
+
+        def activate(node: dict) -> None:
+            node_id = node["id"]
+            if node_id in scheduled:
+                return
+            if node.get("type") == "merge" and not all(
+                p in finished for p in plan.predecessors.get(node_id, ())
+            ):
+                waiting[node_id] = node
+                return
+            schedule(node)
+
+        for node in start_nodes:
+            activate(node)
+
+        while True:
+            while ready and not stopped and len(running) < self.max_concurrency:
+                node = ready.popleft()
+                running[asyncio.create_task(self._run_node(node))] = node
+
+            if not running:
+                if waiting and not stopped:
+                    # Every branch that could still reach these merges has
+                    # ended elsewhere; release them in a stable order.
+                    for node_id in sorted(waiting, key=plan.order.__getitem__):
+                        schedule(waiting[node_id])
+                    continue
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            # Handle simultaneous completions in graph order so downstream
+            # activation (and therefore output order) is deterministic.
+            for task in sorted(done, key=lambda t: plan.order[running[t]["id"]]):
+                node = running.pop(task)
+                node_id = node["id"]
+                try:
+                    result = task.result()
+                except Exception as exc:
+                    logger.exception("Node %s crashed the scheduler: %s", node_id, exc)
+                    result = NodeResult(error=str(exc))
+                executed_count += 1 + result.metadata.get("map_executed", 0)
+                error_count += result.metadata.get("map_errors", 0)
+                finished.add(node_id)
+
+                if not result.success:
+                    error_count += 1
+                    # Check error handling config
+                    error_handling = node.get("data", {}).get("error_handling", "stop")
+                    if error_handling == "stop":
+                        # Let in-flight branches finish, start nothing new
+                        stopped = True
+                        continue
+                    elif error_handling == "ignore":
+                        # Continue with default handle
+                        pass
+                    elif error_handling == "resume":
+                        # Use fallback output
+                        fallback = node.get("data", {}).get("fallback_output")
+                        if fallback is not None:
+                            self.context.store_node_output(node_id, fallback)
+                    elif error_handling == "break":
+                        # Stop this branch but continue the others
+                        continue
+
+                stage = plan.map_stages.get(node_id)
+                if stage is not None:
+                    # The body already ran once per item; resume at the aggregator
+                    activate(plan.nodes_by_id[stage.aggregator_id])
+                    continue
+
+                # Find downstream nodes via the result's source_handle
+                # Support parallel routing via source_handles list
+                handles = result.source_handles if result.source_handles else [result.source_handle]
+                for handle in handles:
+                    for next_node in plan.downstream(node_id, handle):
+                        activate(next_node)
+
+            for node_id in [n for n in waiting if all(
+                p in finished for p in plan.predecessors.get(n, ())
+            )]:
+                schedule(waiting[node_id])
+
+        return executed_count, error_count
+
+    # ------------------------------------------------------------------
+    # Iterator / aggregator map stages
+    # ------------------------------------------------------------------
+
+    async def _run_node(self, node: dict) -> NodeResult:
+        """Execute *node*; iterators with a matching aggregator also run their map stage."""
+        result = await self._execute_node(node)
+        stage = self.plan.map_stages.get(node["id"])
+        if stage is None or not result.success:
+            return result
+
+        items = (result.output or {}).get("items", [])
+        config = node.get("data", {}).get("config", node.get("data", {}))
+        results, executed, errors = await self._run_map(stage, items, config)
+        self._map_results[stage.aggregator_id] = results
+        result.metadata.update({"map_executed": executed, "map_errors": errors})
+        return result
+
+    async def _run_map(self, stage: MapStage, items: list, config: dict) -> tuple[list, int, int]:
+        """
+        Run the iterator body once per item with bounded concurrency.
+
+        Each item gets a child context whose variables and node outputs are
+        copy-on-write views of the parent's, so items cannot see each other.
+        Returns ``(results, executed_count, error_count)``; *results* holds,
+        in item order, the output that reached the aggregator for each item.
+        """
+        if stage.plan is None:
+            return list(items), 0, 0
+
+        item_var = config.get("item_variable", "item")
+        try:
+            limit = int(config.get("concurrency", MAX_CONCURRENT_ITEMS))
+        except (TypeError, ValueError):
+            limit = MAX_CONCURRENT_ITEMS
+        limit = max(1, min(limit, len(items) or 1))
+
+        results: list = [_NO_RESULT] * len(items)
+        totals = [0, 0]
+        indexes = iter(range(len(items)))
+
+        async def worker() -> None:
+            for index in indexes:
+                child = self._child_executor(
+                    self.context.fork({item_var: items[index], "item_index": index}),
+                    stage.plan,
+                )
+                executed, errors = await child._run(stage.plan.start_nodes)
+                totals[0] += executed
+                totals[1] += errors
+                for tail_id in stage.tail_ids:
+                    if tail_id in child.context.node_outputs.maps[0]:
+                        results[index] = child.context.node_outputs[tail_id]
+                        break
+
+        await asyncio.gather(*(worker() for _ in range(limit)))
+        return [r for r in results if r is not _NO_RESULT], totals[0], totals[1]
+
+    def _child_executor(self, context: ExecutionContext, plan: ExecutionPlan) -> "WorkflowExecutor":
+        """Executor for a sub-plan that shares this execution's logs and broadcasts."""
+        child = WorkflowExecutor(self.graph, context, plan=plan, max_concurrency=self.max_concurrency)
+        child.node_logs = self.node_logs
+        child._broadcaster = self._broadcaster
+        return child
+
     # ------------------------------------------------------------------
     # Single node execution
     # ------------------------------------------------------------------
@@ -191,18 +317,20 @@ class WorkflowExecutor:
 
         start_time = time.monotonic()
 
-        handler = self._registry.get_handler(node_type)
+        handler = self.plan.handlers.get(node_id)
         if handler is None:
             result = NodeResult(
                 output={"skipped": True, "reason": f"No handler for '{node_type}'"},
             )
             logger.warning("No handler registered for node type '%s'", node_type)
         else:
-            # Validate first
-            validation_error = handler.validate(node_data)
+            # Validated once at plan compile time
+            validation_error = self.plan.validation_errors.get(node_id)
             if validation_error:
                 result = NodeResult(error=f"Validation: {validation_error}")
             else:
+                if node_id in self._map_results:
+                    node_data = {**node_data, "_map_results": self._map_results.pop(node_id)}
                 try:
                     result = await handler.execute(node_data, self.context)
                 except Exception as exc:
@@ -230,26 +358,5 @@ class WorkflowExecutor:
         return result
 
     async def _save_node_log(self, node: dict, result: NodeResult, duration_ms: int) -> None:
-        from workflows.models import Execution, NodeExecutionLog
-
-        node_data = node.get("data", {})
-        try:
-            execution = await sync_to_async(
-                Execution.objects.get
-            )(id=self.context.execution_id)
-
-            status = NodeExecutionLog.Status.SUCCESS if result.success else NodeExecutionLog.Status.ERROR
-
-            await sync_to_async(NodeExecutionLog.objects.create)(
-                execution=execution,
-                node_id=node["id"],
-                node_type=node.get("type", "unknown"),
-                node_label=node_data.get("label", node["id"]),
-                status=status,
-                input_data=node_data,
-                output_data=result.output if result.success else None,
-                error_details=result.error or "",
-                duration_ms=duration_ms,
-            )
-        except Exception as exc:
-            logger.error("Failed to save NodeExecutionLog: %s", exc)
+        """Queue the NodeExecutionLog row; written in bulk by the buffer."""
+        await self.node_logs.add(node, result, duration_ms)
@@ -8,6 +8,7 @@ import httpx
 from workflows.engine.base import BaseNodeHandler, NodeResult
 from workflows.engine.context import ExecutionContext
 from workflows.engine.registry import NodeRegistry
+from workflows.engine.worker import http_client
 
 logger = logging.getLogger("flowcube.engine")
 
@@ -48,7 +49,7 @@ class HTTPRequestHandler(BaseNodeHandler):
             body = context.resolve_template(body)
 
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
+            async with http_client(timeout) as client:
                 if method in ("POST", "PUT", "PATCH") and body:
                     response = await client.request(method, url, headers=headers, json=body)
                 else:
@@ -110,7 +111,7 @@ class WebhookSendHandler(BaseNodeHandler):
         timeout = int(config.get("timeout", 30))
 
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
+            async with http_client(timeout) as client:
                 response = await client.post(url, json=payload, headers=headers)
 
             try:
@@ -3,12 +3,12 @@ AI/LLM node handlers - multi-provider (OpenAI, Claude, DeepSeek).
 """
 import logging
 
-import httpx
 from django.conf import settings as django_settings
 
 from workflows.engine.base import BaseNodeHandler, NodeResult
 from workflows.engine.context import ExecutionContext
 from workflows.engine.registry import NodeRegistry
+from workflows.engine.worker import http_client
 
 logger = logging.getLogger("flowcube.engine")
 
@@ -35,7 +35,7 @@ class OpenAIHandler(BaseNodeHandler):
         messages.append({"role": "user", "content": user_prompt})
 
         try:
-            async with httpx.AsyncClient(timeout=120) as client:
+            async with http_client(120) as client:
                 response = await client.post(
                     "https://api.openai.com/v1/chat/completions",
                     headers={
@@ -85,7 +85,7 @@ class ClaudeHandler(BaseNodeHandler):
         messages = [{"role": "user", "content": user_prompt}]
 
         try:
-            async with httpx.AsyncClient(timeout=120) as client:
+            async with http_client(120) as client:
                 response = await client.post(
                     "https://api.anthropic.com/v1/messages",
                     headers={
@@ -136,7 +136,7 @@ class DeepSeekHandler(BaseNodeHandler):
         messages.append({"role": "user", "content": user_prompt})
 
         try:
-            async with httpx.AsyncClient(timeout=300) as client:
+            async with http_client(300) as client:
                 response = await client.post(
                     f"{ollama_url}/api/chat",
                     json={
@@ -3,8 +3,11 @@ Data transformation node handlers.
 
 JSONTransform, Iterator, Aggregator, TextParser, Filter, Sort.
 """
+import heapq
 import re
 import logging
+from functools import lru_cache
+from itertools import compress
 from typing import Any
 
 import jmespath
@@ -33,10 +36,12 @@ class JSONTransformHandler(BaseNodeHandler):
         # Get input data
         data = context.get_variable(input_var) if input_var else context.trigger_data
         if data is None:
-            data = dict(context.node_outputs)
+            # Read outputs in place; only copy-on-write views need flattening
+            outputs = context.node_outputs
+            data = outputs if isinstance(outputs, dict) else dict(outputs)
 
         try:
-            result = jmespath.search(expression, data)
+            result = _compile_jmespath(expression).search(data)
             context.set_variable(output_var, result)
             return NodeResult(output=result)
         except Exception as exc:
@@ -47,7 +52,11 @@ class JSONTransformHandler(BaseNodeHandler):
 class IteratorHandler(BaseNodeHandler):
     """
     Split an array into individual items for downstream processing.
-    Each item becomes the output so downstream nodes process it.
+
+    When an aggregator is reachable downstream, the executor runs the nodes
+    between them once per item (see WorkflowExecutor._run_map), exposing
+    the item as ``{{item}}`` (config ``item_variable``) and ``{{item_index}}``.
+    Config ``concurrency`` bounds how many items run at once.
     """
     node_type = "iterator"
 
@@ -62,9 +71,7 @@ class IteratorHandler(BaseNodeHandler):
         if not isinstance(data, (list, tuple)):
             return NodeResult(error=f"Expected array, got {type(data).__name__}")
 
-        # Store items for downstream processing
-        # In a real implementation, this would fan-out execution.
-        # For now, we store the array and let downstream nodes handle iteration.
+        # Items stay available to nodes that handle the array themselves
         context.set_variable("_iterator_items", list(data))
         context.set_variable("_iterator_count", len(data))
 
@@ -76,7 +83,12 @@ class IteratorHandler(BaseNodeHandler):
 
 @NodeRegistry.register
 class AggregatorHandler(BaseNodeHandler):
-    """Collect items back into an array after Iterator processing."""
+    """
+    Collect items back into an array after Iterator processing.
+
+    After a fan-out the executor passes the per-item results, in item
+    order, as ``_map_results``; otherwise ``input_variable`` is read.
+    """
     node_type = "aggregator"
 
     async def execute(self, node_data: dict, context: ExecutionContext) -> NodeResult:
@@ -84,7 +96,9 @@ class AggregatorHandler(BaseNodeHandler):
         input_var = config.get("input_variable", "_iterator_items")
         output_var = config.get("output_variable", "aggregated_result")
 
-        items = context.get_variable(input_var, [])
+        items = node_data.get("_map_results")
+        if items is None:
+            items = context.get_variable(input_var, [])
         if not isinstance(items, list):
             items = [items]
 
@@ -140,13 +154,12 @@ class FilterHandler(BaseNodeHandler):
         if not isinstance(data, list):
             return NodeResult(error=f"Expected array, got {type(data).__name__}")
 
-        from .logic import _evaluate_condition
+        from .logic import compile_condition
 
-        filtered = []
-        for item in data:
-            actual = _deep_field(item, field) if field else item
-            if _evaluate_condition(str(actual), operator, str(value)):
-                filtered.append(item)
+        # Extract the column once, then apply a predicate built for this operator
+        predicate = compile_condition(operator, str(value))
+        column = map(_field_getter(field), data) if field else data
+        filtered = list(compress(data, map(predicate, column)))
 
         context.set_variable(output_var, filtered)
         return NodeResult(output={"items": filtered, "count": len(filtered)})
@@ -154,7 +167,12 @@ class FilterHandler(BaseNodeHandler):
 
 @NodeRegistry.register
 class SortHandler(BaseNodeHandler):
-    """Sort items in an array."""
+    """
+    Sort items in an array.
+
+    With ``limit`` set only the top-K items are kept, selected with a heap
+    instead of sorting the whole array.
+    """
     node_type = "sort"
 
     async def execute(self, node_data: dict, context: ExecutionContext) -> NodeResult:
@@ -163,20 +181,29 @@ class SortHandler(BaseNodeHandler):
         field = config.get("field", "")
         direction = config.get("direction", "asc")
         output_var = config.get("output_variable", "sorted_result")
+        limit = config.get("limit")
 
         data = context.get_variable(input_var, [])
         if not isinstance(data, list):
             return NodeResult(error=f"Expected array, got {type(data).__name__}")
 
+        if field:
+            get = _field_getter(field)
+            key = lambda x: get(x) or ""  # noqa: E731
+        else:
+            key = None
+        try:
+            limit = int(limit) if limit not in (None, "") else None
+        except (TypeError, ValueError):
+            return NodeResult(error=f"Invalid limit: {limit!r}")
+
         try:
-            if field:
-                sorted_data = sorted(
-                    data,
-                    key=lambda x: _deep_field(x, field) or "",
-                    reverse=(direction == "desc"),
-                )
+            if limit is not None and 0 <= limit < len(data):
+                # Same result as sorted(...)[:limit], in O(n log k)
+                select = heapq.nlargest if direction == "desc" else heapq.nsmallest
+                sorted_data = select(limit, data, key=key)
             else:
-                sorted_data = sorted(data, reverse=(direction == "desc"))
+                sorted_data = sorted(data, key=key, reverse=(direction == "desc"))
 
             context.set_variable(output_var, sorted_data)
             return NodeResult(output={"items": sorted_data, "count": len(sorted_data)})
@@ -184,11 +211,30 @@ class SortHandler(BaseNodeHandler):
             return NodeResult(error=f"Sort error: {exc}")
 
 
+JMESPATH_CACHE_SIZE = 512  # Distinct expressions kept compiled
+
+
+@lru_cache(maxsize=JMESPATH_CACHE_SIZE)
+def _compile_jmespath(expression: str):
+    """Parse a JMESPath expression once; nodes reuse it on every run."""
+    return jmespath.compile(expression)
+
+
 def _deep_field(obj: Any, field: str) -> Any:
     """Get a nested field from a dict using dot notation."""
-    for part in field.split("."):
-        if isinstance(obj, dict):
-            obj = obj.get(part)
-        else:
-            return None
-    return obj
+    return _field_getter(field)(obj)
+
+
+def _field_getter(field: str):
+    """Return a getter for dot-notation *field* with the path split once."""
+    parts = field.split(".")
+
+    def get(obj: Any) -> Any:
+        for part in parts:
+            if isinstance(obj, dict):
+                obj = obj.get(part)
+            else:
+                return None
+        return obj
+
+    return get
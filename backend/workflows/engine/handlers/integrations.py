@@ -10,11 +10,10 @@ import logging
 import unicodedata
 import random
 
-import httpx
-
 from workflows.engine.base import BaseNodeHandler, NodeResult
 from workflows.engine.context import ExecutionContext
 from workflows.engine.registry import NodeRegistry
+from workflows.engine.worker import http_client
 
 logger = logging.getLogger("flowcube.engine")
 
@@ -164,7 +163,7 @@ class DeduplicateHandler(BaseNodeHandler):
 
         # External dedup service call
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
+            async with http_client(10) as client:
                 resp = await client.post(
                     f"{service_url.rstrip('/')}/register",
                     json={"id": value, "field": dedup_field, "ttl_hours": ttl_hours},
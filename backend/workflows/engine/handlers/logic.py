@@ -86,7 +86,8 @@ class WaitHandler(BaseNodeHandler):
 class MergeHandler(BaseNodeHandler):
     """
     Merge collects outputs from multiple incoming branches into a single output.
-    Since BFS visits nodes once, this simply gathers all node_outputs available.
+    The executor only runs a merge once every incoming branch has finished,
+    so all upstream node_outputs are available here.
     """
     node_type = "merge"
 
@@ -99,6 +100,52 @@ class MergeHandler(BaseNodeHandler):
 # Helpers
 # ------------------------------------------------------------------
 
+def compile_condition(operator: str, expected: str):
+    """
+    Build a predicate equivalent to ``_evaluate_condition(str(v), operator, expected)``.
+
+    Operator dispatch and parsing of *expected* happen once, and values
+    that are already strings (or numbers, for numeric comparisons) are not
+    re-stringified, so filtering a large column stays cheap.
+    """
+    def as_str(value):
+        return value if value.__class__ is str else str(value)
+
+    if operator == "equals":
+        return lambda v: as_str(v) == expected
+    if operator == "not_equals":
+        return lambda v: as_str(v) != expected
+    if operator == "contains":
+        return lambda v: expected in as_str(v)
+    if operator == "not_contains":
+        return lambda v: expected not in as_str(v)
+    if operator == "starts_with":
+        return lambda v: as_str(v).startswith(expected)
+    if operator == "ends_with":
+        return lambda v: as_str(v).endswith(expected)
+    if operator == "not_empty":
+        return lambda v: bool(as_str(v))
+    if operator == "is_empty":
+        return lambda v: not as_str(v)
+    if operator in ("greater_than", "less_than"):
+        try:
+            threshold = float(expected)
+        except ValueError:
+            return lambda v: False
+        greater = operator == "greater_than"
+
+        def compare(v):
+            if v.__class__ not in (int, float):
+                try:
+                    v = float(as_str(v))
+                except ValueError:
+                    return False
+            return v > threshold if greater else v < threshold
+
+        return compare
+    return lambda v: _evaluate_condition(as_str(v), operator, expected)
+
+
 def _evaluate_condition(actual: str, operator: str, expected: str) -> bool:
     try:
         if operator == "equals":
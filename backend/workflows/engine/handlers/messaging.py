@@ -4,13 +4,13 @@ Messaging node handlers: Email (SMTP) and WhatsApp (via ChatCube EngineClient).
 """
 import logging
 
-import httpx
 from asgiref.sync import sync_to_async
 from django.conf import settings as django_settings
 
 from workflows.engine.base import BaseNodeHandler, NodeResult
 from workflows.engine.context import ExecutionContext
 from workflows.engine.registry import NodeRegistry
+from workflows.engine.worker import http_client
 
 logger = logging.getLogger("flowcube.engine")
 
@@ -141,7 +141,7 @@ class SalesCubeCreateLeadHandler(BaseNodeHandler):
             lead_data["name"] = "Lead FRZ Platform"
 
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
+            async with http_client(30) as client:
                 response = await client.post(
                     f"{api_url}/api/leads/",
                     json=lead_data,
@@ -36,6 +36,7 @@ class SubWorkflowHandler(BaseNodeHandler):
     async def execute(self, node_data: dict, context: ExecutionContext) -> NodeResult:
         from workflows.models import Workflow, Execution
         from workflows.engine.executor import WorkflowExecutor
+        from workflows.engine.plan import plan_for_workflow
 
         config = node_data.get("config", node_data)
         child_workflow_id = config.get("workflow_id")
@@ -76,7 +77,13 @@ class SubWorkflowHandler(BaseNodeHandler):
 
         # Execute child workflow
         import workflows.engine.handlers  # noqa: F401
-        executor = WorkflowExecutor(child_graph, child_context)
+        executor = WorkflowExecutor(
+            child_graph,
+            child_context,
+            plan=plan_for_workflow(child_workflow),
+            log_mode=child_workflow.node_log_mode,
+            log_sample_rate=child_workflow.node_log_sample_rate,
+        )
         summary = await executor.execute()
 
         # Update child execution
@@ -0,0 +1,114 @@
+"""
+Write-behind buffer for NodeExecutionLog rows.
+
+The executor records each finished node here instead of writing it
+immediately; rows are persisted with a single ``bulk_create`` when the
+buffer reaches a size or age threshold and once more when the execution
+ends (including on crash, via the executor's ``finally``).
+
+Log modes (``Workflow.node_log_mode``):
+  full         every node is logged
+  errors_only  only failed nodes are logged
+  sampled      a fraction of executions is logged in full; errors always are
+"""
+from __future__ import annotations
+
+import random
+import time
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .base import NodeResult
+
+logger = logging.getLogger("flowcube.engine")
+
+
+LOG_MODE_FULL = "full"
+LOG_MODE_ERRORS_ONLY = "errors_only"
+LOG_MODE_SAMPLED = "sampled"
+
+FLUSH_MAX_ROWS = 100       # Flush once this many rows are pending
+FLUSH_MAX_AGE_S = 5.0      # ... or when the oldest pending row is this old
+
+
+class NodeLogBuffer:
+    """Execution-scoped accumulator of NodeExecutionLog rows."""
+
+    def __init__(
+        self,
+        execution_id: str,
+        mode: str = LOG_MODE_FULL,
+        sample_rate: float = 1.0,
+        max_rows: int = FLUSH_MAX_ROWS,
+        max_age_s: float = FLUSH_MAX_AGE_S,
+    ):
+        self.execution_id = execution_id
+        self.mode = mode
+        self.max_rows = max_rows
+        self.max_age_s = max_age_s
+        # Sampling is decided per execution so a sampled trace is complete
+        self._keep_success = (
+            mode == LOG_MODE_FULL
+            or (mode == LOG_MODE_SAMPLED and random.random() < sample_rate)
+        )
+        self._pending: list = []
+        self._oldest: Optional[float] = None
+
+    def wants(self, result: NodeResult) -> bool:
+        return self._keep_success or not result.success
+
+    async def add(self, node: dict, result: NodeResult, duration_ms: int) -> None:
+        """Queue a log row for *node*; flushes if a threshold is crossed."""
+        from workflows.models import NodeExecutionLog
+
+        if not self.wants(result):
+            return
+
+        node_data = node.get("data", {})
+        self._pending.append(NodeExecutionLog(
+            execution_id=self.execution_id,
+            node_id=node["id"],
+            node_type=node.get("type", "unknown"),
+            node_label=node_data.get("label", node["id"]),
+            status=(
+                NodeExecutionLog.Status.SUCCESS if result.success
+                else NodeExecutionLog.Status.ERROR
+            ),
+            input_data=node_data,
+            output_data=result.output if result.success else None,
+            error_details=result.error or "",
+            duration_ms=duration_ms,
+            started_at=timezone.now() - timedelta(milliseconds=duration_ms),
+        ))
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+        if (
+            len(self._pending) >= self.max_rows
+            or time.monotonic() - self._oldest >= self.max_age_s
+        ):
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Persist pending rows in one bulk insert.  Returns rows written."""
+        if not self._pending:
+            return 0
+        from workflows.models import NodeExecutionLog
+
+        rows, self._pending, self._oldest = self._pending, [], None
+        try:
+            await sync_to_async(NodeExecutionLog.objects.bulk_create)(rows)
+        except Exception as exc:
+            logger.error(
+                "Failed to save %d NodeExecutionLog row(s) for %s: %s",
+                len(rows), self.execution_id, exc,
+            )
+            return 0
+        return len(rows)
+
+    def __len__(self) -> int:
+        return len(self._pending)
@@ -0,0 +1,297 @@
+"""
+Compiled execution plans for workflow graphs.
+
+Parsing the raw React Flow JSON (adjacency list, start nodes, handler
+lookup, config validation) is pure work on an immutable input, so it is
+done once per graph revision and cached in-process.  The executor then
+walks the plan instead of the JSON on every hop.
+
+Cache keys are ``(workflow_id, revision)`` where revision is either the
+published ``WorkflowVersion`` id (immutable) or the draft ``updated_at``
+timestamp, so a stale entry can never be served even in worker processes
+that miss an invalidation signal.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from .base import BaseNodeHandler
+from .registry import NodeRegistry
+
+logger = logging.getLogger("flowcube.engine")
+
+
+PLAN_CACHE_SIZE = 256  # Compiled graphs kept per process
+
+
+@dataclass(frozen=True)
+class MapStage:
+    """Sub-graph between an ``iterator`` and its matching ``aggregator``."""
+    iterator_id: str
+    aggregator_id: str
+    # Body compiled as its own plan; None when the iterator feeds the aggregator directly
+    plan: Optional["ExecutionPlan"]
+    # Body nodes with an edge into the aggregator, in plan order
+    tail_ids: tuple[str, ...]
+
+
+class ExecutionPlan:
+    """
+    Immutable, pre-resolved view of a workflow graph.
+
+    Attributes:
+        nodes: React Flow nodes in declaration order
+        nodes_by_id: node_id -> node dict
+        start_nodes: roots of the DAG (nodes with no incoming edges)
+        successors: node_id -> {source_handle: (node, ...)}
+        predecessors: node_id -> distinct source node ids of incoming edges
+        order: node_id -> stable BFS rank, used to order concurrent results
+        handlers: node_id -> handler instance (None when unregistered)
+        validation_errors: node_id -> handler.validate() result
+        map_stages: iterator node_id -> MapStage (iterators with an aggregator)
+    """
+
+    def __init__(
+        self,
+        graph: dict,
+        registry: Optional[NodeRegistry] = None,
+        start_ids: Optional[list[str]] = None,
+    ):
+        registry = registry or NodeRegistry()
+        self.nodes: list[dict] = list(graph.get("nodes", []))
+        self.nodes_by_id: dict[str, dict] = {n["id"]: n for n in self.nodes}
+        edges: list[dict] = graph.get("edges", [])
+
+        self.successors: dict[str, dict[str, tuple[dict, ...]]] = {}
+        incoming: dict[str, dict[str, None]] = {}
+        for edge in edges:
+            target = self.nodes_by_id.get(edge["target"])
+            if target is None:
+                continue
+            handle = edge.get("sourceHandle", "default") or "default"
+            by_handle = self.successors.setdefault(edge["source"], {})
+            by_handle[handle] = by_handle.get(handle, ()) + (target,)
+            if edge["source"] in self.nodes_by_id:
+                incoming.setdefault(edge["target"], {})[edge["source"]] = None
+        self.predecessors: dict[str, tuple[str, ...]] = {
+            node_id: tuple(sources) for node_id, sources in incoming.items()
+        }
+
+        if start_ids is not None:
+            starts = [self.nodes_by_id[i] for i in start_ids if i in self.nodes_by_id]
+        else:
+            target_ids = {e["target"] for e in edges}
+            starts = [n for n in self.nodes if n["id"] not in target_ids]
+            if not starts and self.nodes:
+                starts = [self.nodes[0]]
+        self.start_nodes: tuple[dict, ...] = tuple(starts)
+        self.order: dict[str, int] = self._rank_nodes()
+
+        # Handlers are stateless, so one instance per node serves every run.
+        self.handlers: dict[str, Optional[BaseNodeHandler]] = {}
+        self.validation_errors: dict[str, Optional[str]] = {}
+        for node in self.nodes:
+            handler = registry.get_handler(node.get("type", "unknown"))
+            self.handlers[node["id"]] = handler
+            self.validation_errors[node["id"]] = (
+                handler.validate(node.get("data", {})) if handler is not None else None
+            )
+
+        self.map_stages: dict[str, MapStage] = {}
+        for node in self.nodes:
+            if node.get("type") == "iterator":
+                stage = self._compile_map_stage(node["id"], edges, registry)
+                if stage is not None:
+                    self.map_stages[node["id"]] = stage
+
+    def _map_body(
+        self, iterator_id: str, expanding: frozenset = frozenset()
+    ) -> Optional[tuple[str, list[str]]]:
+        """
+        Find the aggregator matching *iterator_id* and the nodes between them.
+
+        Nested iterator/aggregator pairs are absorbed into the body.  Returns
+        ``(aggregator_id, body_ids)`` or None if no aggregator is reachable.
+        *expanding* holds the iterators whose bodies are being searched
+        already, so a cycle through several iterators ends.
+        """
+        expanding = expanding | {iterator_id}
+        aggregators: list[str] = []
+        body: list[str] = []
+        seen = {iterator_id}
+        frontier = [t["id"] for targets in self.successors.get(iterator_id, {}).values() for t in targets]
+        while frontier:
+            next_frontier = []
+            for node_id in frontier:
+                if node_id in seen:
+                    continue
+                seen.add(node_id)
+                node_type = self.nodes_by_id[node_id].get("type")
+                if node_type == "aggregator":
+                    aggregators.append(node_id)
+                    continue
+                body.append(node_id)
+                continue_from = node_id
+                if node_type == "iterator" and node_id not in expanding:
+                    nested = self._map_body(node_id, expanding)
+                    if nested is not None:
+                        nested_aggregator, nested_body = nested
+                        body.extend(i for i in nested_body if i not in seen)
+                        seen.update(nested_body)
+                        seen.add(nested_aggregator)
+                        body.append(nested_aggregator)
+                        continue_from = nested_aggregator
+                for targets in self.successors.get(continue_from, {}).values():
+                    next_frontier.extend(t["id"] for t in targets)
+            frontier = next_frontier
+
+        if not aggregators:
+            return None
+        if len(aggregators) > 1:
+            logger.warning(
+                "Iterator %s reaches several aggregators %s; using %s",
+                iterator_id, aggregators, aggregators[0],
+            )
+        return aggregators[0], body
+
+    def _compile_map_stage(self, iterator_id: str, edges: list[dict], registry) -> Optional[MapStage]:
+        found = self._map_body(iterator_id)
+        if found is None:
+            return None
+        aggregator_id, body = found
+        if not body:
+            return MapStage(iterator_id, aggregator_id, None, ())
+
+        body_ids = set(body)
+        sub_plan = ExecutionPlan(
+            {
+                "nodes": [self.nodes_by_id[i] for i in body],
+                "edges": [e for e in edges if e["source"] in body_ids and e["target"] in body_ids],
+            },
+            registry,
+            start_ids=[
+                t["id"] for targets in self.successors.get(iterator_id, {}).values()
+                for t in targets if t["id"] in body_ids
+            ],
+        )
+        tails = [i for i in self.predecessors.get(aggregator_id, ()) if i in body_ids]
+        tails.sort(key=lambda i: sub_plan.order[i])
+        return MapStage(iterator_id, aggregator_id, sub_plan, tuple(tails))
+
+    def _rank_nodes(self) -> dict[str, int]:
+        """BFS rank from the start nodes; unreachable nodes follow in declaration order."""
+        order: dict[str, int] = {}
+        frontier = [n["id"] for n in self.start_nodes]
+        while frontier:
+            next_frontier = []
+            for node_id in frontier:
+                if node_id in order:
+                    continue
+                order[node_id] = len(order)
+                for targets in self.successors.get(node_id, {}).values():
+                    next_frontier.extend(t["id"] for t in targets)
+            frontier = next_frontier
+        for node in self.nodes:
+            order.setdefault(node["id"], len(order))
+        return order
+
+    def downstream(self, node_id: str, source_handle: str = "default") -> tuple[dict, ...]:
+        """
+        Nodes connected to *node_id* via *source_handle*.
+
+        A specific handle with no matching edges falls back to the
+        ``default`` edges, mirroring how plain (unlabelled) connections
+        behave in the editor.
+        """
+        by_handle = self.successors.get(node_id)
+        if not by_handle:
+            return ()
+        matched = by_handle.get(source_handle)
+        if matched:
+            return matched
+        if source_handle != "default":
+            return by_handle.get("default", ())
+        return ()
+
+
+class PlanCache:
+    """
+    Thread-safe LRU cache of compiled plans keyed by (workflow_id, revision).
+
+    *compile* turns a raw graph into the cached object; other runtimes
+    (the chatbot engine) reuse the cache with their own compiled form.
+    """
+
+    def __init__(self, maxsize: int = PLAN_CACHE_SIZE, compile: Callable[[dict], Any] = ExecutionPlan):
+        self.maxsize = maxsize
+        self.compile = compile
+        self._plans: OrderedDict[tuple[str, str], Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, workflow_id: Any, revision: str) -> Any:
+        """Cached plan for the revision, or None; lets callers skip loading the graph."""
+        key = (str(workflow_id), revision)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+            return plan
+
+    def get_or_compile(self, workflow_id: Any, revision: str, graph: dict) -> Any:
+        key = (str(workflow_id), revision)
+        plan = self.get(workflow_id, revision)
+        if plan is not None:
+            return plan
+
+        plan = self.compile(graph)
+
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def invalidate(self, workflow_id: Any) -> int:
+        """Drop every cached revision of *workflow_id*.  Returns count removed."""
+        workflow_id = str(workflow_id)
+        with self._lock:
+            stale = [key for key in self._plans if key[0] == workflow_id]
+            for key in stale:
+                del self._plans[key]
+        if stale:
+            logger.debug("Invalidated %d plan(s) for workflow %s", len(stale), workflow_id)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._plans.clear()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+
+plan_cache = PlanCache()
+
+
+def plan_for_workflow(workflow) -> ExecutionPlan:
+    """Compiled plan for the current draft graph of *workflow*."""
+    revision = f"draft:{workflow.updated_at.isoformat() if workflow.updated_at else ''}"
+    return plan_cache.get_or_compile(workflow.id, revision, workflow.graph or {})
+
+
+def plan_for_execution(execution) -> ExecutionPlan:
+    """
+    Compiled plan for *execution*: the pinned WorkflowVersion snapshot when
+    one is attached, otherwise the workflow's current draft graph.
+    """
+    version = execution.version
+    if version is not None:
+        return plan_cache.get_or_compile(
+            execution.workflow_id, f"version:{version.id}", version.graph or {},
+        )
+    return plan_for_workflow(execution.workflow)
@@ -0,0 +1,159 @@
+"""
+Worker-process event loop and shared async resources.
+
+Celery tasks are synchronous, so every workflow run used to pay for a
+fresh event loop (and, with it, fresh httpx clients and channel-layer
+connections).  Instead, each worker process lazily starts one event loop
+in a daemon thread and submits coroutines to it; resources bound to that
+loop live for the life of the process and are closed by the Celery
+``worker_process_shutdown`` hook (see workflows/tasks.py).
+
+Usage:
+    from workflows.engine.worker import worker_loop, http_client
+
+    summary = worker_loop.run(executor.execute())
+
+    async with http_client(timeout=30) as client:
+        response = await client.get(url)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Coroutine, Optional
+
+import httpx
+
+logger = logging.getLogger("flowcube.engine")
+
+
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE = 20
+
+
+class WorkerLoop:
+    """A process-wide event loop running in a dedicated daemon thread."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        # timeout -> shared client; only ever touched from the loop thread
+        self._http_clients: dict[float, httpx.AsyncClient] = {}
+        # Other shared clients by name; closed with aclose() on shutdown
+        self._resources: dict[str, Any] = {}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # A loop inherited across fork() has no thread behind it
+            if self._loop is None or self._pid != os.getpid():
+                self._start()
+            return self._loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run() -> None:
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name="workflow-event-loop", daemon=True)
+        thread.start()
+        ready.wait()
+        self._loop, self._thread, self._pid = loop, thread, os.getpid()
+        self._http_clients = {}
+        self._resources = {}
+        logger.debug("Started worker event loop in pid %s", self._pid)
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run *coro* on the worker loop and block until it finishes."""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("WorkerLoop.run() called from the worker loop thread")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def http_client_for(self, timeout: float) -> Optional[httpx.AsyncClient]:
+        """Shared client for *timeout*, or None when not on the worker loop."""
+        if not self.in_loop_thread():
+            return None
+        client = self._http_clients.get(timeout)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                ),
+            )
+            self._http_clients[timeout] = client
+        return client
+
+    def resource(self, name: str, factory: Callable[[], Any]) -> Optional[Any]:
+        """Shared object *name*, built by *factory* once; None when not on the worker loop."""
+        if not self.in_loop_thread():
+            return None
+        resource = self._resources.get(name)
+        if resource is None:
+            resource = self._resources[name] = factory()
+        return resource
+
+    async def _aclose_resources(self) -> None:
+        clients, self._http_clients = list(self._http_clients.values()), {}
+        resources, self._resources = list(self._resources.values()), {}
+        for client in clients + resources:
+            await client.aclose()
+        try:
+            from channels.layers import get_channel_layer
+
+            layer = get_channel_layer()
+            if layer is not None and hasattr(layer, "close_pools"):
+                await layer.close_pools()
+        except Exception as exc:
+            logger.debug("Channel layer close failed: %s", exc)
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Close shared resources and stop the loop thread."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid():
+                return
+            self._loop = self._thread = self._pid = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._aclose_resources(), loop).result(timeout)
+        except Exception as exc:
+            logger.warning("Error closing worker loop resources: %s", exc)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+        logger.debug("Worker event loop stopped")
+
+
+worker_loop = WorkerLoop()
+
+
+@asynccontextmanager
+async def http_client(timeout: float = 30) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    httpx client for node handlers.
+
+    On the worker loop this is a pooled keep-alive client shared by every
+    execution in the process; anywhere else (tests, ASGI views) a
+    short-lived client is created and closed as before.
+    """
+    client = worker_loop.http_client_for(timeout)
+    if client is not None:
+        yield client
+        return
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        yield client
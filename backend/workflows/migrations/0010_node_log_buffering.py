@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-16 12:00
+
+import django.core.validators
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0009_alter_block_block_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workflow',
+            name='node_log_mode',
+            field=models.CharField(choices=[('full', 'Full'), ('errors_only', 'Errors only'), ('sampled', 'Sampled')], default='full', help_text='Which NodeExecutionLog rows are persisted for executions', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='workflow',
+            name='node_log_sample_rate',
+            field=models.FloatField(default=0.1, help_text="Fraction of executions fully logged in 'sampled' mode (errors are always logged)", validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(1)]),
+        ),
+        migrations.AlterField(
+            model_name='nodeexecutionlog',
+            name='started_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -3,7 +3,9 @@ FlowCube 3.0 Workflow Models
 Based on best practices from n8n, Typebot, and Flowise
 """
 from django.conf import settings
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.utils import timezone
 import uuid
 
 
@@ -106,6 +108,22 @@ class Workflow(models.Model):
     # Tags for filtering
     tags = models.JSONField(default=list, blank=True)
     
+    # Node execution log persistence
+    class NodeLogMode(models.TextChoices):
+        FULL = "full", "Full"
+        ERRORS_ONLY = "errors_only", "Errors only"
+        SAMPLED = "sampled", "Sampled"
+
+    node_log_mode = models.CharField(
+        max_length=20, choices=NodeLogMode.choices, default=NodeLogMode.FULL,
+        help_text="Which NodeExecutionLog rows are persisted for executions",
+    )
+    node_log_sample_rate = models.FloatField(
+        default=0.1,
+        validators=[MinValueValidator(0), MaxValueValidator(1)],
+        help_text="Fraction of executions fully logged in 'sampled' mode (errors are always logged)",
+    )
+    
     class Meta:
         ordering = ["-updated_at"]
     
@@ -224,7 +242,8 @@ class NodeExecutionLog(models.Model):
     # Performance
     duration_ms = models.PositiveIntegerField(default=0)
     
-    started_at = models.DateTimeField(auto_now_add=True)
+    # Set by the executor when the node finishes (logs are bulk-inserted later)
+    started_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ["started_at"]
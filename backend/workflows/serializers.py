@@ -134,7 +134,7 @@ class WorkflowDetailSerializer(serializers.ModelSerializer):
             'id', 'name', 'description', 'owner', 'graph',
             'is_published', 'is_active', 'created_at', 'updated_at',
             'published_at', 'folder', 'tags', 'versions', 'variables',
-            'node_analytics'
+            'node_analytics', 'node_log_mode', 'node_log_sample_rate'
         ]
         read_only_fields = ['owner', 'created_at', 'updated_at', 'published_at']
 
@@ -227,7 +227,10 @@ class WorkflowCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating/updating workflows"""
     class Meta:
         model = Workflow
-        fields = ['id', 'name', 'description', 'graph', 'is_published', 'is_active', 'folder', 'tags']
+        fields = [
+            'id', 'name', 'description', 'graph', 'is_published', 'is_active', 'folder', 'tags',
+            'node_log_mode', 'node_log_sample_rate',
+        ]
 
     def validate_name(self, value):
         """Sanitize name field to prevent XSS"""
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Workflow, WorkflowVersion
+
+
+@receiver(post_save, sender=Workflow)
+@receiver(post_delete, sender=Workflow)
+def invalidate_workflow_plans(sender, instance, **kwargs):
+    from .engine.plan import plan_cache
+
+    plan_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=WorkflowVersion)
+@receiver(post_delete, sender=WorkflowVersion)
+def invalidate_version_plans(sender, instance, **kwargs):
+    from .engine.plan import plan_cache
+
+    plan_cache.invalidate(instance.workflow_id)
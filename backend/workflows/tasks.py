@@ -7,22 +7,36 @@ import asyncio
 import logging
 
 from celery import shared_task
+from celery.signals import worker_process_shutdown, worker_shutdown
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
 
 def _run_async(coro):
-    """Run an async coroutine from synchronous Celery context."""
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                return pool.submit(asyncio.run, coro).result()
-        return loop.run_until_complete(coro)
-    except RuntimeError:
-        return asyncio.run(coro)
+    """
+    Run an async coroutine from synchronous Celery context.
+
+    Coroutines run on the worker process's persistent event loop so pooled
+    httpx clients and channel-layer connections survive between tasks.
+    """
+    from workflows.engine.worker import worker_loop
+
+    if worker_loop.in_loop_thread():
+        # Called synchronously from code already on the worker loop
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, coro).result()
+    return worker_loop.run(coro)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _shutdown_worker_loop(**kwargs):
+    """Close shared async resources when a Celery worker process exits."""
+    from workflows.engine.worker import worker_loop
+
+    worker_loop.shutdown()
 
 
 @shared_task(bind=True, max_retries=3)
@@ -50,22 +64,30 @@ def execute_workflow_task(self, execution_id):
             execution_id, execution.workflow.name,
         )
 
-        graph = execution.workflow.graph
-        if not graph.get("nodes"):
-            raise ValueError("Workflow has no nodes to execute")
-
         # Import engine (triggers handler auto-registration)
         from workflows.engine.context import ExecutionContext
         from workflows.engine.executor import WorkflowExecutor
+        from workflows.engine.plan import plan_for_execution
         import workflows.engine.handlers  # noqa: F401 - registers all handlers
 
+        # Compiled once per WorkflowVersion (or draft revision) and cached
+        plan = plan_for_execution(execution)
+        if not plan.nodes:
+            raise ValueError("Workflow has no nodes to execute")
+
         context = ExecutionContext(
             execution_id=str(execution.id),
             workflow_id=str(execution.workflow.id),
             trigger_data=execution.trigger_data or {},
         )
 
-        executor = WorkflowExecutor(graph, context)
+        executor = WorkflowExecutor(
+            execution.version.graph if execution.version else execution.workflow.graph,
+            context,
+            plan=plan,
+            log_mode=execution.workflow.node_log_mode,
+            log_sample_rate=execution.workflow.node_log_sample_rate,
+        )
         summary = _run_async(executor.execute())
 
         # Mark execution complete
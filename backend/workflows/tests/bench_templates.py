@@ -0,0 +1,110 @@
+"""
+Micro-benchmark for ExecutionContext template resolution.
+
+Not collected by the test runner.  Run from backend/:
+
+    python -m workflows.tests.bench_templates [--fields 300] [--rounds 2000]
+
+Compares the compiled resolver against the previous regex-per-call
+implementation on a config with many fields, a fraction of which
+contain placeholders.
+"""
+import argparse
+import re
+import timeit
+
+from workflows.engine.context import ExecutionContext, _deep_get
+
+
+_VAR_RE = re.compile(r"\{\{\s*(.+?)\s*\}\}")
+
+
+def regex_resolve_template(context, text):
+    """Reference implementation: regex substitution with a closure per call."""
+    if not text or "{{" not in text:
+        return text
+
+    def _replace(match):
+        expr = match.group(1).strip()
+        if expr.startswith("$node."):
+            parts = expr[6:].split(".", 1)
+            output = context.node_outputs.get(parts[0])
+            if output is None:
+                return match.group(0)
+            if len(parts) > 1:
+                return str(_deep_get(output, parts[1]))
+            return str(output)
+        if expr.startswith("$trigger."):
+            return str(_deep_get(context.trigger_data, expr[9:]))
+        val = context.variables.get(expr)
+        if val is not None:
+            return str(val)
+        return match.group(0)
+
+    return _VAR_RE.sub(_replace, text)
+
+
+def regex_resolve_dict(context, data):
+    result = {}
+    for key, value in data.items():
+        if isinstance(value, str):
+            result[key] = regex_resolve_template(context, value)
+        elif isinstance(value, dict):
+            result[key] = regex_resolve_dict(context, value)
+        elif isinstance(value, list):
+            result[key] = [
+                regex_resolve_template(context, v) if isinstance(v, str)
+                else regex_resolve_dict(context, v) if isinstance(v, dict)
+                else v
+                for v in value
+            ]
+        else:
+            result[key] = value
+    return result
+
+
+def build_config(fields):
+    config = {}
+    for i in range(fields):
+        if i % 3 == 0:
+            config[f"field_{i}"] = f"Hello {{{{name}}}}, order {{{{$node.http_1.body.items.{i % 5}.id}}}}"
+        elif i % 3 == 1:
+            config[f"field_{i}"] = {"nested": f"{{{{$trigger.payload.field_{i % 7}}}}}", "static": i}
+        else:
+            config[f"field_{i}"] = f"static value {i}"
+    return config
+
+
+def build_context():
+    context = ExecutionContext(
+        execution_id="bench",
+        workflow_id="bench",
+        trigger_data={"payload": {f"field_{i}": i for i in range(7)}},
+        variables={"name": "Maria"},
+    )
+    context.store_node_output("http_1", {"body": {"items": [{"id": i} for i in range(5)]}})
+    return context
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fields", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    context = build_context()
+    config = build_config(args.fields)
+    assert context.resolve_dict(config) == regex_resolve_dict(context, config)
+
+    compiled = timeit.timeit(lambda: context.resolve_dict(config), number=args.rounds)
+    baseline = timeit.timeit(lambda: regex_resolve_dict(context, config), number=args.rounds)
+
+    per_call = lambda total: total / args.rounds * 1e6
+    print(f"fields={args.fields} rounds={args.rounds}")
+    print(f"regex    : {per_call(baseline):9.1f} us/resolve_dict")
+    print(f"compiled : {per_call(compiled):9.1f} us/resolve_dict")
+    print(f"speedup  : {baseline / compiled:9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
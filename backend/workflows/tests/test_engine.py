@@ -0,0 +1,345 @@
+import asyncio
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+import workflows.engine.handlers  # noqa: F401
+from workflows.engine import BaseNodeHandler, ExecutionContext, NodeRegistry, NodeResult
+from workflows.engine.broadcast import ProgressBroadcaster
+from workflows.engine.context import compile_template
+from workflows.engine.executor import WorkflowExecutor
+from workflows.engine.handlers.data import FilterHandler, SortHandler
+from workflows.engine.handlers.logic import _evaluate_condition, compile_condition
+from workflows.engine.logbuffer import NodeLogBuffer
+from workflows.engine.plan import ExecutionPlan, PlanCache
+
+
+@NodeRegistry.register
+class SleepHandler(BaseNodeHandler):
+    node_type = 'test_sleep'
+
+    async def execute(self, node_data, context):
+        await asyncio.sleep(node_data.get('seconds', 0))
+        return NodeResult(output={'label': node_data.get('label')})
+
+
+def node(node_id, node_type='unknown_type', **data):
+    return {'id': node_id, 'type': node_type, 'data': data}
+
+
+def edge(source, target, handle=None):
+    e = {'id': f'{source}-{target}', 'source': source, 'target': target}
+    if handle is not None:
+        e['sourceHandle'] = handle
+    return e
+
+
+class ExecutionPlanTestCase(SimpleTestCase):
+    def setUp(self):
+        self.graph = {
+            'nodes': [
+                node('start', 'manual_trigger'),
+                node('route', 'condition'),
+                node('yes', 'set_variable', variable_name='a', value='1'),
+                node('no'),
+                node('after'),
+            ],
+            'edges': [
+                edge('start', 'route'),
+                edge('route', 'yes', 'true'),
+                edge('route', 'no', 'else'),
+                edge('yes', 'after'),
+                edge('no', 'after', 'default'),
+                edge('no', 'missing'),
+            ],
+        }
+
+    def test_start_nodes(self):
+        plan = ExecutionPlan(self.graph)
+        self.assertEqual([n['id'] for n in plan.start_nodes], ['start'])
+
+    def test_downstream_by_handle(self):
+        plan = ExecutionPlan(self.graph)
+        self.assertEqual([n['id'] for n in plan.downstream('route', 'true')], ['yes'])
+        self.assertEqual([n['id'] for n in plan.downstream('route', 'else')], ['no'])
+
+    def test_downstream_falls_back_to_default_edges(self):
+        plan = ExecutionPlan(self.graph)
+        self.assertEqual([n['id'] for n in plan.downstream('yes', 'anything')], ['after'])
+        self.assertEqual(plan.downstream('route', 'unknown'), ())
+
+    def test_edges_to_missing_nodes_are_dropped(self):
+        plan = ExecutionPlan(self.graph)
+        self.assertEqual([n['id'] for n in plan.downstream('no')], ['after'])
+
+    def test_handlers_and_validation_resolved(self):
+        plan = ExecutionPlan(self.graph)
+        self.assertIsNotNone(plan.handlers['yes'])
+        self.assertIsNone(plan.handlers['no'])
+        self.assertIsNone(plan.validation_errors['yes'])
+
+
+class PlanCacheTestCase(SimpleTestCase):
+    graph = {'nodes': [node('a')], 'edges': []}
+
+    def test_reuses_compiled_plan(self):
+        cache = PlanCache(maxsize=4)
+        first = cache.get_or_compile('wf', 'version:1', self.graph)
+        self.assertIs(cache.get_or_compile('wf', 'version:1', self.graph), first)
+        self.assertIsNot(cache.get_or_compile('wf', 'version:2', self.graph), first)
+
+    def test_lru_eviction(self):
+        cache = PlanCache(maxsize=2)
+        a = cache.get_or_compile('a', 'r', self.graph)
+        cache.get_or_compile('b', 'r', self.graph)
+        cache.get_or_compile('a', 'r', self.graph)
+        cache.get_or_compile('c', 'r', self.graph)
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get_or_compile('a', 'r', self.graph), a)
+
+    def test_invalidate_workflow(self):
+        cache = PlanCache()
+        cache.get_or_compile('wf', 'version:1', self.graph)
+        cache.get_or_compile('wf', 'draft:x', self.graph)
+        cache.get_or_compile('other', 'version:1', self.graph)
+        self.assertEqual(cache.invalidate('wf'), 2)
+        self.assertEqual(len(cache), 1)
+
+
+@mock.patch.object(WorkflowExecutor, '_save_node_log', mock.AsyncMock())
+class WorkflowExecutorTestCase(SimpleTestCase):
+    def run_graph(self, graph):
+        context = ExecutionContext(execution_id='exec', workflow_id='wf')
+        summary = asyncio.run(WorkflowExecutor(graph, context).execute())
+        return summary, context
+
+    def test_parallel_branches_run_concurrently(self):
+        graph = {
+            'nodes': [node('start', 'test_sleep')] + [
+                node(b, 'test_sleep', seconds=0.2) for b in ('a', 'b', 'c')
+            ],
+            'edges': [edge('start', b) for b in ('a', 'b', 'c')],
+        }
+        started = time.monotonic()
+        summary, _ = self.run_graph(graph)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(summary['executed_count'], 4)
+
+    def test_merge_waits_for_all_branches(self):
+        graph = {
+            'nodes': [
+                node('start', 'test_sleep'),
+                node('slow', 'test_sleep', seconds=0.1),
+                node('fast', 'test_sleep'),
+                node('join', 'merge'),
+            ],
+            'edges': [
+                edge('start', 'slow'), edge('start', 'fast'),
+                edge('slow', 'join'), edge('fast', 'join'),
+            ],
+        }
+        _, context = self.run_graph(graph)
+        self.assertIn('slow', context.node_outputs['join']['merged'])
+
+    def test_merge_released_when_branch_not_taken(self):
+        graph = {
+            'nodes': [
+                node('start', 'test_sleep'),
+                node('taken', 'test_sleep'),
+                node('skipped', 'test_sleep'),
+                node('join', 'merge'),
+            ],
+            'edges': [
+                edge('start', 'taken'), edge('start', 'skipped', 'other'),
+                edge('taken', 'join'), edge('skipped', 'join'),
+            ],
+        }
+        summary, context = self.run_graph(graph)
+        self.assertEqual(summary['executed_count'], 3)
+        self.assertIn('join', context.node_outputs)
+
+    def test_outputs_in_graph_order(self):
+        graph = {
+            'nodes': [
+                node('start', 'test_sleep'),
+                node('a', 'test_sleep', seconds=0.05),
+                node('b', 'test_sleep'),
+            ],
+            'edges': [edge('start', 'a'), edge('start', 'b')],
+        }
+        _, context = self.run_graph(graph)
+        self.assertEqual(list(context.node_outputs), ['start', 'a', 'b'])
+
+    def map_graph(self, **iterator_config):
+        return {
+            'nodes': [
+                node('loop', 'iterator', input_variable='rows', **iterator_config),
+                node('tag', 'set_variable', variable_name='tagged', value='{{item}}!'),
+                node('collect', 'aggregator'),
+            ],
+            'edges': [edge('loop', 'tag'), edge('tag', 'collect')],
+        }
+
+    def test_iterator_fans_out_to_aggregator(self):
+        plan = ExecutionPlan(self.map_graph())
+        self.assertEqual(plan.map_stages['loop'].aggregator_id, 'collect')
+
+        context = ExecutionContext(
+            execution_id='exec', workflow_id='wf', variables={'rows': [1, 2, 3]},
+        )
+        summary = asyncio.run(WorkflowExecutor(self.map_graph(concurrency=2), context).execute())
+        self.assertEqual(summary['error_count'], 0)
+        self.assertEqual(
+            context.node_outputs['collect']['items'],
+            [{'tagged': '1!'}, {'tagged': '2!'}, {'tagged': '3!'}],
+        )
+        # Per-item writes stay in the child contexts
+        self.assertNotIn('tagged', context.variables)
+        self.assertNotIn('tag', context.node_outputs)
+
+    def test_iterator_cycle_compiles(self):
+        graph = {
+            'nodes': [
+                node('outer', 'iterator', input_variable='rows'),
+                node('inner', 'iterator', input_variable='item'),
+                node('collect', 'aggregator'),
+            ],
+            'edges': [edge('outer', 'inner'), edge('inner', 'outer'), edge('inner', 'collect')],
+        }
+        # Used to recurse between the two iterators until RecursionError
+        plan = ExecutionPlan(graph)
+        self.assertEqual([n['id'] for n in plan.downstream('inner')], ['outer', 'collect'])
+
+
+class NodeLogBufferTestCase(SimpleTestCase):
+    def test_full_mode_keeps_everything(self):
+        buffer = NodeLogBuffer('exec', mode='full')
+        self.assertTrue(buffer.wants(NodeResult(output={})))
+        self.assertTrue(buffer.wants(NodeResult(error='boom')))
+
+    def test_errors_only_mode(self):
+        buffer = NodeLogBuffer('exec', mode='errors_only')
+        self.assertFalse(buffer.wants(NodeResult(output={})))
+        self.assertTrue(buffer.wants(NodeResult(error='boom')))
+
+    def test_sampled_mode_always_keeps_errors(self):
+        buffer = NodeLogBuffer('exec', mode='sampled', sample_rate=0.0)
+        self.assertFalse(buffer.wants(NodeResult(output={})))
+        self.assertTrue(buffer.wants(NodeResult(error='boom')))
+
+    def test_add_skips_unwanted_rows_without_flushing(self):
+        buffer = NodeLogBuffer('exec', mode='errors_only')
+        asyncio.run(buffer.add(node('a'), NodeResult(output={}), 5))
+        self.assertEqual(len(buffer), 0)
+
+
+class ProgressBroadcasterTestCase(SimpleTestCase):
+    def run_events(self, watched):
+        layer = mock.Mock(group_send=mock.AsyncMock())
+        broadcaster = ProgressBroadcaster('exec', flush_interval=10)
+        broadcaster._channel_layer = layer
+
+        async def scenario():
+            with mock.patch('workflows.engine.broadcast.cache') as cache:
+                cache.aget = mock.AsyncMock(return_value=1 if watched else None)
+                await broadcaster.emit('node_start', {'node_id': 'a'})
+                await broadcaster.emit('node_complete', {'node_id': 'a'})
+                await broadcaster.emit('execution_complete', {})
+
+        asyncio.run(scenario())
+        return layer.group_send
+
+    def test_unwatched_execution_sends_nothing(self):
+        self.assertFalse(self.run_events(watched=False).called)
+
+    def test_events_coalesced_into_one_message(self):
+        group_send = self.run_events(watched=True)
+        group_send.assert_awaited_once()
+        group, message = group_send.await_args.args
+        self.assertEqual(group, 'execution_exec')
+        self.assertEqual(
+            [e['event_type'] for e in message['events']],
+            ['node_start', 'node_complete', 'execution_complete'],
+        )
+
+    def test_watcher_connecting_mid_run_gets_completion(self):
+        layer = mock.Mock(group_send=mock.AsyncMock())
+        broadcaster = ProgressBroadcaster('exec', flush_interval=10)
+        broadcaster._channel_layer = layer
+
+        async def scenario():
+            with mock.patch('workflows.engine.broadcast.cache') as cache:
+                cache.aget = mock.AsyncMock(return_value=None)
+                await broadcaster.emit('node_start', {'node_id': 'a'})
+                cache.aget.return_value = 1
+                await broadcaster.emit('execution_complete', {})
+
+        asyncio.run(scenario())
+        layer.group_send.assert_awaited_once()
+        _, message = layer.group_send.await_args.args
+        self.assertEqual([e['event_type'] for e in message['events']], ['execution_complete'])
+
+
+class TemplateResolutionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.context = ExecutionContext(
+            execution_id='exec',
+            workflow_id='wf',
+            trigger_data={'payload': {'email': 'a@b.c'}},
+            variables={'name': 'Maria'},
+        )
+        self.context.store_node_output('http', {'items': [{'id': 7}]})
+
+    def test_compiled_once_per_string(self):
+        self.assertIs(compile_template('Hi {{name}}'), compile_template('Hi {{name}}'))
+
+    def test_resolves_all_reference_kinds(self):
+        self.assertEqual(
+            self.context.resolve_template(
+                '{{ name }} {{$trigger.payload.email}} {{$node.http.items.0.id}}'
+            ),
+            'Maria a@b.c 7',
+        )
+
+    def test_unresolved_placeholders_left_intact(self):
+        self.assertEqual(
+            self.context.resolve_template('{{missing}} {{$node.other.x}}'),
+            '{{missing}} {{$node.other.x}}',
+        )
+
+    def test_resolve_dict_nested(self):
+        data = {'a': 'plain', 'b': {'c': '{{name}}'}, 'd': ['{{name}}', {'e': 1}], 'f': 2}
+        self.assertEqual(
+            self.context.resolve_dict(data),
+            {'a': 'plain', 'b': {'c': 'Maria'}, 'd': ['Maria', {'e': 1}], 'f': 2},
+        )
+
+
+class DataHandlersTestCase(SimpleTestCase):
+    rows = [{'name': n, 'score': s} for n, s in [('a', 5), ('b', 12), ('c', 9), ('d', 12), ('e', 1)]]
+
+    def run_handler(self, handler, **config):
+        context = ExecutionContext(execution_id='exec', workflow_id='wf', variables={'rows': self.rows})
+        return asyncio.run(handler.execute({'input_variable': 'rows', **config}, context))
+
+    def test_compiled_condition_matches_evaluate_condition(self):
+        values = [None, '', 'abc', 0, 3, 2.5, '10', True, [], {'k': 1}]
+        for operator in ('equals', 'contains', 'not_empty', 'is_empty', 'greater_than', 'less_than'):
+            for expected in ('', '3', 'abc', 'None'):
+                predicate = compile_condition(operator, expected)
+                for value in values:
+                    self.assertEqual(
+                        predicate(value), _evaluate_condition(str(value), operator, expected),
+                        (operator, expected, value),
+                    )
+
+    def test_filter_by_field(self):
+        result = self.run_handler(FilterHandler(), field='score', operator='greater_than', value='8')
+        self.assertEqual([r['name'] for r in result.output['items']], ['b', 'c', 'd'])
+
+    def test_sort_top_k_matches_full_sort(self):
+        for direction in ('asc', 'desc'):
+            full = self.run_handler(SortHandler(), field='score', direction=direction)
+            top = self.run_handler(SortHandler(), field='score', direction=direction, limit=3)
+            self.assertEqual(top.output['items'], full.output['items'][:3])
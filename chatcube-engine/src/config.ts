@@ -13,6 +13,7 @@ export const config = {
   sessionsDir: process.env.SESSIONS_DIR || "/app/sessions",
   defaultMessageDelay: parseInt(process.env.MESSAGE_DELAY || "3000"),
   maxQueueSize: parseInt(process.env.MAX_QUEUE_SIZE || "1000"),
+  maxSendBatch: parseInt(process.env.MAX_SEND_BATCH || "100"),
   maxMessageRetries: parseInt(process.env.MAX_MESSAGE_RETRIES || "3"),
   r2Endpoint: process.env.CLOUDFLARE_R2_ENDPOINT || "",
   r2AccessKey: process.env.CLOUDFLARE_R2_ACCESS_KEY || "",
@@ -1,11 +1,38 @@
 import { Router, Request, Response } from "express";
 import pino from "pino";
 import { InstanceManager } from "../services/InstanceManager";
-import { ApiResponse, SendMessageBody, MessageResult } from "../types";
+import { config } from "../config";
+import {
+  ApiResponse,
+  BatchMessageResult,
+  MessageResult,
+  SendBatchBody,
+  SendMessageBody,
+} from "../types";
 
 const router = Router();
 const logger = pino({ name: "routes:messages" });
 
+/**
+ * Returns a validation error for a send body, or null if it is valid
+ */
+function validateMessage(body: SendMessageBody): string | null {
+  const { to, type, content, mediaUrl } = body;
+  if (!to) {
+    return "Field to is required (phone number or JID)";
+  }
+  if (!type) {
+    return "Field type is required (text, image, video, audio, document)";
+  }
+  if (type === "text" && !content) {
+    return "Field content is required for text messages";
+  }
+  if (type !== "text" && !mediaUrl) {
+    return "Field mediaUrl is required for media messages";
+  }
+  return null;
+}
+
 /**
  * POST /api/messages/:instanceId/send
  * Send a message via an instance
@@ -22,36 +49,9 @@ router.post(
         req.body;
 
       // Validation
-      if (!to) {
-        res.status(400).json({
-          success: false,
-          error: "Field to is required (phone number or JID)",
-        });
-        return;
-      }
-
-      if (!type) {
-        res.status(400).json({
-          success: false,
-          error:
-            "Field type is required (text, image, video, audio, document)",
-        });
-        return;
-      }
-
-      if (type === "text" && !content) {
-        res.status(400).json({
-          success: false,
-          error: "Field content is required for text messages",
-        });
-        return;
-      }
-
-      if (type !== "text" && !mediaUrl) {
-        res.status(400).json({
-          success: false,
-          error: "Field mediaUrl is required for media messages",
-        });
+      const validationError = validateMessage(req.body);
+      if (validationError) {
+        res.status(400).json({ success: false, error: validationError });
         return;
       }
 
@@ -102,4 +102,91 @@ router.post(
   }
 );
 
+/**
+ * POST /api/messages/:instanceId/send-batch
+ * Enqueue several messages for an instance in one request, in order.
+ * Every message is validated before any is queued; an invalid message
+ * rejects the whole batch with a 400. Once queued, responds with one
+ * result per message.
+ */
+router.post(
+  "/:instanceId/send-batch",
+  async (
+    req: Request<{ instanceId: string }, {}, SendBatchBody>,
+    res: Response<ApiResponse<BatchMessageResult>>
+  ) => {
+    try {
+      const { instanceId } = req.params;
+      const { messages } = req.body;
+
+      if (!Array.isArray(messages) || messages.length === 0) {
+        res.status(400).json({
+          success: false,
+          error: "Field messages is required (non-empty array)",
+        });
+        return;
+      }
+
+      if (messages.length > config.maxSendBatch) {
+        res.status(400).json({
+          success: false,
+          error: `At most ${config.maxSendBatch} messages per batch`,
+        });
+        return;
+      }
+
+      for (let i = 0; i < messages.length; i++) {
+        const validationError = validateMessage(messages[i]);
+        if (validationError) {
+          res.status(400).json({
+            success: false,
+            error: `messages[${i}]: ${validationError}`,
+          });
+          return;
+        }
+      }
+
+      const manager = InstanceManager.getInstance();
+      const results = await manager.sendMessages(
+        instanceId,
+        messages.map(
+          ({ to, type, content, mediaUrl, fileName, caption, mimetype }) => ({
+            to,
+            type,
+            content: content || "",
+            mediaUrl,
+            fileName,
+            caption,
+            mimetype,
+          })
+        )
+      );
+
+      logger.info(
+        {
+          instanceId,
+          count: messages.length,
+          queued: results.filter((r) => r.success).length,
+        },
+        "Message batch queued via API"
+      );
+
+      res.json({
+        success: true,
+        data: { results },
+      });
+    } catch (error: unknown) {
+      const errMsg = error instanceof Error ? error.message : "Unknown error";
+      logger.error(
+        { error: errMsg, instanceId: req.params.instanceId },
+        "Failed to send message batch"
+      );
+      res.status(500).json({
+        success: false,
+        error: errMsg,
+      });
+    }
+  }
+);
+
 export default router;
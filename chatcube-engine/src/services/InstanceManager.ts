@@ -428,6 +428,34 @@ export class InstanceManager {
     return this.messageQueue.enqueue(instanceId, jid, content);
   }
 
+  /**
+   * Enqueue several messages for rate-limited sending, in order
+   */
+  async sendMessages(
+    instanceId: string,
+    messages: SendMessagePayload[]
+  ): Promise<MessageResult[]> {
+    const engine = this.instances.get(instanceId);
+    if (!engine) {
+      return messages.map(() => ({
+        success: false,
+        error: `Instance ${instanceId} not found`,
+      }));
+    }
+
+    if (engine.status !== "connected") {
+      return messages.map(() => ({
+        success: false,
+        error: `Instance ${instanceId} is not connected (status: ${engine.status})`,
+      }));
+    }
+
+    return this.messageQueue.enqueueMany(
+      instanceId,
+      messages.map((content) => ({ jid: content.to, content }))
+    );
+  }
+
   /**
    * Get contacts for an instance
    */
@@ -130,11 +130,24 @@ export class MessageQueue {
     jid: string,
     content: SendMessagePayload
   ): MessageResult {
+    return this.enqueueMany(instanceId, [{ jid, content }])[0];
+  }
+
+  /**
+   * Enqueue several messages for one instance, in order.
+   * The queue is persisted to Redis once for the whole batch.
+   *
+   * @returns One MessageResult per message, in the same order
+   */
+  enqueueMany(
+    instanceId: string,
+    messages: Array<{ jid: string; content: SendMessagePayload }>
+  ): MessageResult[] {
     if (!this.senders.has(instanceId)) {
-      return {
+      return messages.map(() => ({
         success: false,
         error: `No sender registered for instance ${instanceId}`,
-      };
+      }));
     }
 
     let queue = this.queues.get(instanceId);
@@ -143,50 +156,56 @@ export class MessageQueue {
       this.queues.set(instanceId, queue);
     }
 
-    if (queue.length >= MAX_QUEUE_SIZE) {
-      logger.warn(
-        { instanceId, queueSize: queue.length },
-        "Queue is full, rejecting message"
+    let added = 0;
+    const results = messages.map(({ jid, content }): MessageResult => {
+      if (queue!.length >= MAX_QUEUE_SIZE) {
+        logger.warn(
+          { instanceId, queueSize: queue!.length },
+          "Queue is full, rejecting message"
+        );
+        return {
+          success: false,
+          error: `Queue full for instance ${instanceId} (max ${MAX_QUEUE_SIZE})`,
+        };
+      }
+
+      const messageId = randomUUID();
+      queue!.push({
+        id: messageId,
+        instanceId,
+        jid,
+        content,
+        addedAt: Date.now(),
+        retries: 0,
+      });
+      added++;
+
+      logger.debug(
+        { instanceId, messageId, jid, queueSize: queue!.length },
+        "Message enqueued"
       );
+
       return {
-        success: false,
-        error: `Queue full for instance ${instanceId} (max ${MAX_QUEUE_SIZE})`,
+        success: true,
+        messageId,
+        timestamp: Date.now(),
       };
-    }
-
-    const messageId = randomUUID();
-    const item: QueuedMessage = {
-      id: messageId,
-      instanceId,
-      jid,
-      content,
-      addedAt: Date.now(),
-      retries: 0,
-    };
-
-    queue.push(item);
-
-    // Persist updated queue to Redis (fire-and-forget)
-    this.persistQueue(instanceId).catch((err: Error) => {
-      logger.error(
-        { instanceId, error: err.message },
-        "Failed to persist queue after enqueue"
-      );
     });
 
-    // Kick off processing if not already running
-    this.processQueue(instanceId);
+    if (added > 0) {
+      // Persist updated queue to Redis (fire-and-forget)
+      this.persistQueue(instanceId).catch((err: Error) => {
+        logger.error(
+          { instanceId, error: err.message },
+          "Failed to persist queue after enqueue"
+        );
+      });
 
-    logger.debug(
-      { instanceId, messageId, jid, queueSize: queue.length },
-      "Message enqueued"
-    );
+      // Kick off processing if not already running
+      this.processQueue(instanceId);
+    }
 
-    return {
-      success: true,
-      messageId,
-      timestamp: Date.now(),
-    };
+    return results;
   }
 
   /**
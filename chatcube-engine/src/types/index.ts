@@ -185,3 +185,11 @@ export interface PairingCodeBody {
 }
 
 export interface SendMessageBody extends SendMessagePayload {}
+
+export interface SendBatchBody {
+  messages: SendMessageBody[];
+}
+
+export interface BatchMessageResult {
+  results: MessageResult[];
+}
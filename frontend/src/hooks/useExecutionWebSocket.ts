@@ -42,42 +42,51 @@ export function useExecutionWebSocket(executionId: string | null) {
       setIsConnected(true);
     };
 
+    const handleEvent = (data: any) => {
+      const eventType = data.event_type;
+
+      if (eventType === 'node_start') {
+        setNodeStatus(data.node_id, 'running');
+        addNodeLog({
+          node_id: data.node_id,
+          node_type: data.node_type,
+          node_label: data.node_label,
+          status: 'running',
+          timestamp: new Date().toISOString(),
+        });
+      } else if (eventType === 'node_complete') {
+        setNodeStatus(data.node_id, 'success');
+        addNodeLog({
+          node_id: data.node_id,
+          node_type: data.node_type,
+          status: 'success',
+          duration_ms: data.duration_ms,
+          timestamp: new Date().toISOString(),
+        });
+      } else if (eventType === 'node_error') {
+        setNodeStatus(data.node_id, 'error');
+        addNodeLog({
+          node_id: data.node_id,
+          node_type: data.node_type,
+          status: 'error',
+          error: data.error,
+          duration_ms: data.duration_ms,
+          timestamp: new Date().toISOString(),
+        });
+      } else if (eventType === 'execution_complete') {
+        executionDoneRef.current = true;
+        finishExecution();
+      }
+    };
+
     ws.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
-        const eventType = data.event_type;
-
-        if (eventType === 'node_start') {
-          setNodeStatus(data.node_id, 'running');
-          addNodeLog({
-            node_id: data.node_id,
-            node_type: data.node_type,
-            node_label: data.node_label,
-            status: 'running',
-            timestamp: new Date().toISOString(),
-          });
-        } else if (eventType === 'node_complete') {
-          setNodeStatus(data.node_id, 'success');
-          addNodeLog({
-            node_id: data.node_id,
-            node_type: data.node_type,
-            status: 'success',
-            duration_ms: data.duration_ms,
-            timestamp: new Date().toISOString(),
-          });
-        } else if (eventType === 'node_error') {
-          setNodeStatus(data.node_id, 'error');
-          addNodeLog({
-            node_id: data.node_id,
-            node_type: data.node_type,
-            status: 'error',
-            error: data.error,
-            duration_ms: data.duration_ms,
-            timestamp: new Date().toISOString(),
-          });
-        } else if (eventType === 'execution_complete') {
-          executionDoneRef.current = true;
-          finishExecution();
+        // Progress events arrive coalesced as {event_type: 'batch', events: [...]}
+        if (data.event_type === 'batch') {
+          data.events.forEach(handleEvent);
+        } else {
+          handleEvent(data);
         }
       } catch (err) {
         console.error('[WS] Parse error:', err);